@@ -0,0 +1,41 @@
+"""
+Archivage des données froides
+=============================
+Déplace vers services_archive et demandes_archive, par petites transactions :
+- les services désactivés depuis plus de --jours-services jours (sans demande en
+  attente), avec toutes leurs demandes ;
+- les demandes acceptées ou refusées depuis plus de --jours-demandes jours.
+Les tables actives restent petites ; l'historique reste consultable dans "Mon compte".
+À lancer périodiquement (cron), application en marche.
+
+Utilisation : python archiver.py [--base voisins.db] [--jours-demandes 180] [--jours-services 365]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base", help="fichier SQLite à archiver (défaut : VOISINS_DB ou voisins.db)")
+    parser.add_argument("--jours-demandes", type=int, help="rétention des demandes closes (défaut : VOISINS_ARCHIVE_JOURS_DEMANDES)")
+    parser.add_argument("--jours-services", type=int, help="rétention des services inactifs (défaut : VOISINS_ARCHIVE_JOURS_SERVICES)")
+    parser.add_argument("--lot", type=int, help="lignes déplacées par transaction (défaut : VOISINS_ARCHIVE_TAILLE_LOT)")
+    args = parser.parse_args()
+    if args.base:
+        os.environ["VOISINS_DB"] = args.base
+
+    import voisins_db as vdb
+    vdb.init_database(vdb.DB_PATH)
+    debut = time.perf_counter()
+    totaux = vdb.archiver(
+        vdb.ARCHIVE_JOURS_DEMANDES if args.jours_demandes is None else args.jours_demandes,
+        vdb.ARCHIVE_JOURS_SERVICES if args.jours_services is None else args.jours_services,
+        args.lot or vdb.ARCHIVE_TAILLE_LOT)
+    print(f"{totaux['services']} service(s) et {totaux['demandes']} demande(s) archivé(s) "
+          f"en {time.perf_counter() - debut:.1f} s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
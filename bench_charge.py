@@ -0,0 +1,338 @@
+"""
+Test de charge multi-sessions
+=============================
+Simule N voisins virtuels qui utilisent voisins_sol.py en même temps, chacun dans
+sa propre session streamlit.testing AppTest (sans navigateur), sur une base temporaire :
+inscription, connexion, publication d'un service, puis à chaque itération recherche
+avec filtres (catégorie, type), envoi d'une demande, onglet « Demandes reçues » de
+« Mon compte » et acceptation ou refus d'une demande en attente.
+
+Chaque rerun est chronométré et rattaché à sa page et à son action. Le rapport donne,
+par action puis par page, le nombre de reruns, les percentiles p50 / p95 / p99 en
+millisecondes et le taux d'erreur : exception du script, délai dépassé, élément attendu
+absent (bouton, message de succès...).
+
+AppTest remplace le runtime Streamlit global à chaque rerun : deux sessions ne peuvent
+pas tourner en même temps dans un même processus. Chaque voisin virtuel a donc son
+processus, comme autant de workers qui partagent la base SQLite (et ses verrous).
+
+Pour comparer deux commits, garder les mêmes paramètres et la même graine :
+--enregistrer écrit les résultats (avec le commit mesuré), --reference les compare et
+le script échoue si un p50 dépasse la référence de plus de --tolerance et d'au moins
+--marge-ms, ou si un taux d'erreur augmente de plus de --erreurs-tolerees.
+
+Utilisation :
+    python bench_charge.py --voisins 16 --iterations 5 --enregistrer charge.json
+    python bench_charge.py --voisins 16 --iterations 5 --reference charge.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+DOSSIER = os.path.dirname(os.path.abspath(__file__))
+APPLICATION = os.path.join(DOSSIER, "voisins_sol.py")
+MOT_DE_PASSE = "voisin-charge"
+DELAI_RERUN_S = 60
+ATTENTE_BARRIERE_S = 600
+ADRESSES = ["12 rue Oberkampf 75011 Paris", "3 rue de Belleville 75020 Paris", "40 boulevard Voltaire 75011 Paris",
+            "8 rue des Pyrénées 75020 Paris", "25 rue de Charonne 75011 Paris", "5 avenue Gambetta 75020 Paris"]
+
+# ---------- VOISIN VIRTUEL (un processus) ----------
+
+class ElementAbsent(LookupError):
+    pass
+
+def bouton(at, libelle=None, cle=None):
+    # Premier bouton portant ce libellé (hors barre de navigation) ou cette clé
+    for b in at.button:
+        if (cle is not None and b.key == cle) or (
+                libelle is not None and b.label == libelle and not (b.key or "").startswith("nav_")):
+            return b
+    raise ElementAbsent(f"bouton {cle or libelle!r}")
+
+def succes(texte):
+    return lambda at: any(texte in m.value for m in at.success)
+
+class VoisinVirtuel:
+    """Une session AppTest qui enchaîne les actions du scénario en chronométrant chaque rerun."""
+
+    def __init__(self, numero, graine):
+        from streamlit.testing.v1 import AppTest
+        self.at = AppTest.from_file(APPLICATION, default_timeout=DELAI_RERUN_S)
+        self.numero = numero
+        self.alea = random.Random(graine * 1000 + numero)
+        self.email = f"charge{numero}@exemple.fr"
+        self.mesures = []  # (page, action, durée en ms ou None, erreur ou None)
+
+    def rerun(self, page, action, preparer, attendu=None):
+        # preparer(at) saisit les champs et retourne l'objet dont .run() déclenche le rerun
+        # (at lui-même, ou le widget après click()/set_value()) ; seul le rerun est chronométré
+        duree, erreur = None, None
+        try:
+            declencheur = preparer(self.at)
+            debut = time.perf_counter()
+            declencheur.run()
+            duree = (time.perf_counter() - debut) * 1000
+            if self.at.exception:
+                erreur = f"exception : {self.at.exception[0].message}"
+            elif attendu is not None and not attendu(self.at):
+                erreur = "résultat attendu absent"
+        except ElementAbsent as e:
+            erreur = f"élément absent : {e}"
+        except Exception as e:  # délai dépassé (RuntimeError d'AppTest) ou autre échec du rerun
+            erreur = f"{type(e).__name__} : {e}"
+        self.mesures.append((page, action, duree, erreur))
+        return erreur is None
+
+    def naviguer(self, page):
+        return self.rerun(page, "navigation", lambda at: bouton(at, cle=f"nav_{page}").click())
+
+    def inscription(self):
+        def remplir(at):
+            champs = at.text_input
+            for champ, valeur in zip(champs, ("Charge", f"Voisin{self.numero}", self.email,
+                                              MOT_DE_PASSE, MOT_DE_PASSE, f"06{self.numero:08d}")):
+                champ.input(valeur)
+            at.text_area[0].input(self.alea.choice(ADRESSES))
+            return bouton(at, "S'inscrire").click()
+        self.naviguer("S'inscrire")
+        return self.rerun("S'inscrire", "inscription", remplir, succes("Inscription réussie"))
+
+    def connexion(self):
+        def remplir(at):
+            at.text_input[0].input(self.email)
+            at.text_input[1].input(MOT_DE_PASSE)
+            return bouton(at, "Se connecter").click()
+        self.naviguer("Se connecter")
+        return self.rerun("Se connecter", "connexion", remplir,
+                          lambda at: "utilisateur" in at.session_state and at.session_state["utilisateur"])
+
+    def publication(self):
+        from voisins_db import CATEGORIES
+        def remplir(at):
+            at.selectbox[0].set_value(self.alea.choice(CATEGORIES))
+            at.text_input[0].input(f"Service de charge {self.numero}")
+            at.text_area[0].input("Annonce publiée par le test de charge")
+            return bouton(at, "Publier le service").click()
+        self.naviguer("Proposer un service")
+        return self.rerun("Proposer un service", "publication", remplir, succes("Service publié"))
+
+    def recherche(self):
+        from voisins_db import CATEGORIES, TYPES_SERVICE
+        self.naviguer("Trouver un service")
+        page = "Trouver un service"
+        # Moitié des recherches sans filtre de catégorie : les annonces récentes des autres voisins sont en tête
+        categorie = self.alea.choice(CATEGORIES) if self.alea.random() < 0.5 else "Toutes"
+        self.rerun(page, "filtre catégorie", lambda at: at.selectbox(key="filtre_categorie").set_value(categorie))
+        type_service = self.alea.choice(TYPES_SERVICE) if self.alea.random() < 0.3 else "Tous"
+        self.rerun(page, "filtre type", lambda at: at.selectbox(key="filtre_type").set_value(type_service))
+
+    def demande(self):
+        # Le i-ème bouton « Envoyer une demande » et le i-ème champ « Message » sont dans le même formulaire
+        boutons = [b for b in self.at.button if b.label == "Envoyer une demande"]
+        if not boutons:
+            return False  # aucun service d'un autre voisin avec ces filtres : rien à demander
+        # Annonces les plus récentes (celles des autres voisins virtuels) plus souvent demandées
+        i = min(self.alea.randrange(len(boutons)), self.alea.randrange(len(boutons)))
+        def remplir(at):
+            [m for m in at.text_area if m.label == "Message"][i].input(f"Demande du voisin {self.numero}")
+            return [b for b in at.button if b.label == "Envoyer une demande"][i].click()
+        return self.rerun("Trouver un service", "demande", remplir, succes("Demande envoyée"))
+
+    def reponse(self):
+        page = "Mon compte"
+        self.naviguer(page)
+        def ouvrir_onglet(at):
+            at.session_state["onglet_mon_compte"] = "Demandes reçues"
+            return at
+        self.rerun(page, "onglet demandes reçues", ouvrir_onglet,
+                   lambda at: any(s.value == "Demandes reçues pour mes services" for s in at.subheader))
+        en_attente = [b.key for b in self.at.button if (b.key or "").startswith("accept_")]
+        if not en_attente:
+            return False
+        decision = "accept" if self.alea.random() < 0.7 else "reject"
+        cle = f"{decision}_{en_attente[0].split('_', 1)[1]}"
+        # Après le rerun, la demande n'est plus en attente : ses boutons disparaissent
+        return self.rerun(page, "accepter" if decision == "accept" else "refuser",
+                          lambda at: bouton(at, cle=cle).click(),
+                          lambda at: all(b.key != cle for b in at.button))
+
+def attendre(barriere):
+    # Un voisin en échec casse la barrière : les autres continuent sans synchronisation
+    try:
+        barriere.wait(ATTENTE_BARRIERE_S)
+    except threading.BrokenBarrierError:
+        pass
+
+def executer_voisin(numero, graine, iterations, pause, barriere, resultats):
+    from streamlit.testing.v1 import AppTest
+    AppTest.from_file(APPLICATION, default_timeout=DELAI_RERUN_S).run()  # échauffement : imports, caches
+    voisin = VoisinVirtuel(numero, graine)
+    attendre(barriere)
+    voisin.rerun("Accueil", "ouverture", lambda at: at)
+    if voisin.inscription() and voisin.connexion():
+        voisin.publication()
+    # Tous les services publiés avant la première recherche ; à chaque itération, les demandes
+    # envoyées avant de consulter les demandes reçues
+    attendre(barriere)
+    for _ in range(iterations):
+        voisin.recherche()
+        voisin.demande()
+        attendre(barriere)
+        time.sleep(pause)
+        voisin.reponse()
+        time.sleep(pause)
+    resultats.put((numero, voisin.mesures))
+
+# ---------- ORCHESTRATION ET RAPPORT ----------
+
+def preparer_base(vdb, services_initiaux, alea):
+    # Catalogue de départ publié par quelques voisins qui ne se connectent pas
+    vdb.init_database(vdb.DB_PATH)
+    proposants = []
+    for i in range(max(1, services_initiaux // 20)):
+        email = f"initial{i}@exemple.fr"
+        vdb.creer_utilisateur("Initial", f"Voisin{i}", email, MOT_DE_PASSE, alea.choice(ADRESSES), "")
+        proposants.append(vdb.verifier_connexion(email, MOT_DE_PASSE)[0])
+    for i in range(services_initiaux):
+        type_service = alea.choice(vdb.TYPES_SERVICE)
+        vdb.creer_service(f"Service initial {i}", alea.choice(vdb.CATEGORIES), "Annonce du catalogue de départ",
+                          type_service, 10.0 if type_service in ("Location payante", "Service rémunéré") else 0.0,
+                          alea.choice(proposants))
+
+def version_mesuree():
+    # Commit mesuré (suffixe -dirty si l'arbre de travail est modifié), None hors d'un dépôt git
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=DOSSIER, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def agreger(mesures, cle):
+    groupes = {}
+    for mesure in mesures:
+        groupes.setdefault(cle(mesure), []).append(mesure)
+    from voisins_db import percentiles
+    resultats = {}
+    for nom, lignes in sorted(groupes.items()):
+        durees = [duree for _, _, duree, _ in lignes if duree is not None]
+        erreurs = sum(1 for *_, erreur in lignes if erreur)
+        resultats[nom] = {"reruns": len(lignes), **percentiles(durees), "taux_erreur": erreurs / len(lignes)}
+    return resultats
+
+def comparer(nom, mesure, reference, args):
+    # Suffixe de la ligne du rapport et indicateur de régression par rapport à la référence
+    if nom not in reference:
+        return "", False
+    ref, suffixe, regression = reference[nom], "", False
+    if mesure["p50"] is not None and ref["p50"]:
+        ecart = mesure["p50"] / ref["p50"] - 1
+        suffixe += f"  {ref['p50']:.1f} ({ecart:+.0%})"
+        regression = ecart > args.tolerance and mesure["p50"] - ref["p50"] > args.marge_ms
+    if mesure["taux_erreur"] - ref["taux_erreur"] > args.erreurs_tolerees:
+        suffixe += f"  erreurs {ref['taux_erreur']:.1%} -> {mesure['taux_erreur']:.1%}"
+        regression = True
+    return suffixe + ("  RÉGRESSION" if regression else ""), regression
+
+def afficher(titre, resultats, reference, args):
+    regressions = []
+    print(f"\n{titre:<46} {'reruns':>6} {'p50':>8} {'p95':>8} {'p99':>8} {'erreurs':>8}  référence p50")
+    for nom, mesure in resultats.items():
+        ms = lambda p: f"{mesure[p]:>8.1f}" if mesure[p] is not None else f"{'-':>8}"
+        suffixe, regression = comparer(nom, mesure, reference, args)
+        print(f"{nom:<46} {mesure['reruns']:>6} {ms('p50')} {ms('p95')} {ms('p99')} "
+              f"{mesure['taux_erreur']:>8.1%}{suffixe}")
+        if regression:
+            regressions.append(nom)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--voisins", type=int, default=8, help="nombre de voisins virtuels simultanés")
+    parser.add_argument("--iterations", type=int, default=3, help="recherches / demandes / réponses par voisin")
+    parser.add_argument("--services-initiaux", type=int, default=100)
+    parser.add_argument("--pause", type=float, default=0.0, help="temps de réflexion entre deux actions (s)")
+    parser.add_argument("--graine", type=int, default=7)
+    parser.add_argument("--cout-bcrypt", type=int, help="VOISINS_BCRYPT_COUT des comptes créés (défaut : celui de l'application)")
+    parser.add_argument("--enregistrer", help="écrire les résultats dans ce fichier JSON (nouvelle référence)")
+    parser.add_argument("--reference", help="fichier JSON de référence à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="dégradation tolérée du p50 (0.25 = +25 %%)")
+    parser.add_argument("--marge-ms", type=float, default=10.0, help="écart absolu minimal pour une régression")
+    parser.add_argument("--erreurs-tolerees", type=float, default=0.0, help="hausse tolérée du taux d'erreur")
+    args = parser.parse_args()
+
+    # Base temporaire (et ses quartiers si VOISINS_QUARTIERS est défini), héritée par les processus des voisins
+    os.environ["VOISINS_DB"] = os.path.join(tempfile.mkdtemp(prefix="voisins_charge_"), "voisins.db")
+    if args.cout_bcrypt:
+        os.environ["VOISINS_BCRYPT_COUT"] = str(args.cout_bcrypt)
+    # Sous charge, l'attente du verrou d'écriture dépasse souvent le seuil : inutile de tout journaliser
+    os.environ.setdefault("VOISINS_SEUIL_REQUETE_LENTE_MS", "10000")
+    import voisins_db as vdb
+    preparer_base(vdb, args.services_initiaux, random.Random(args.graine))
+    reference = {}
+    if args.reference:
+        with open(args.reference, encoding="utf-8") as fichier:
+            reference = json.load(fichier)
+
+    contexte = multiprocessing.get_context("spawn")
+    barriere, file = contexte.Barrier(args.voisins), contexte.Queue()
+    processus = [contexte.Process(target=executer_voisin,
+                                  args=(numero, args.graine, args.iterations, args.pause, barriere, file))
+                 for numero in range(1, args.voisins + 1)]
+    debut = time.perf_counter()
+    for p in processus:
+        p.start()
+    mesures, perdus = [], 0
+    for p in processus:
+        try:
+            mesures.extend(file.get(timeout=ATTENTE_BARRIERE_S * (args.iterations + 2))[1])
+        except Exception:  # queue.Empty : voisin mort ou bloqué
+            perdus += 1
+    for p in processus:
+        p.join(5)
+        if p.is_alive():
+            p.terminate()
+    duree = time.perf_counter() - debut
+
+    resultats = {
+        "version": version_mesuree(),
+        "parametres": {"voisins": args.voisins, "iterations": args.iterations, "graine": args.graine,
+                       "services_initiaux": args.services_initiaux, "pause": args.pause,
+                       "quartiers": len(vdb.CHEMINS_QUARTIERS), "cout_bcrypt": vdb.BCRYPT_COUT},
+        "actions": agreger(mesures, lambda m: f"{m[0]} / {m[1]}"),
+        "pages": agreger(mesures, lambda m: m[0]),
+    }
+    print(f"Version {resultats['version']} : {args.voisins} voisin(s), {len(mesures)} rerun(s) en {duree:.1f} s")
+    if reference and reference.get("parametres") != resultats["parametres"]:
+        print(f"ATTENTION : paramètres différents de la référence ({reference.get('version')})")
+    regressions = afficher("page / action", resultats["actions"], reference.get("actions", {}), args)
+    regressions += afficher("page", resultats["pages"], reference.get("pages", {}), args)
+    erreurs = {}
+    for page, action, _, erreur in mesures:
+        if erreur:
+            erreurs.setdefault((page, action, erreur), 0)
+            erreurs[page, action, erreur] += 1
+    if erreurs:
+        print("\nErreurs les plus fréquentes :")
+        for (page, action, erreur), nombre in sorted(erreurs.items(), key=lambda e: -e[1])[:10]:
+            print(f"  {nombre:>5} × {page} / {action} : {erreur[:120]}")
+    if perdus:
+        print(f"\n{perdus} voisin(s) sans résultat (processus mort ou bloqué)")
+
+    if args.enregistrer:
+        with open(args.enregistrer, "w", encoding="utf-8") as fichier:
+            json.dump(resultats, fichier, indent=2, ensure_ascii=False)
+    if regressions:
+        print(f"\n{len(regressions)} régression(s) : {', '.join(regressions)}")
+    return 1 if regressions or perdus else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Banc d'essai du démarrage de l'application
+==========================================
+Mesure, dans des processus Python neufs (comme un worker qui redémarre) :
+- le temps d'import de voisins_sol (python -X importtime), avec les modules les plus lourds ;
+- le temps du premier rendu de la page d'accueil (streamlit.testing AppTest).
+Vérifie aussi que bcrypt, pandas et numpy ne sont pas chargés par l'import du module.
+
+Utilisation : python bench_demarrage.py [--repetitions 5] [--json resultats.json]
+"""
+
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+
+DOSSIER = os.path.dirname(os.path.abspath(__file__))
+
+# Modules qui ne doivent être chargés qu'au premier usage
+IMPORTS_DIFFERES = ("bcrypt", "pandas", "numpy")
+
+SCRIPT_RENDU = """
+import time
+debut = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.run()
+assert not at.exception, at.exception
+print(time.perf_counter() - debut)
+"""
+
+def environnement():
+    env = dict(os.environ)
+    env["VOISINS_DB"] = os.path.join(tempfile.mkdtemp(prefix="voisins_demarrage_"), "voisins.db")
+    env["PYTHONPATH"] = DOSSIER + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+def mesurer_import():
+    # Retourne (durée totale en s, {module importé par voisins_sol: durée cumulée en s}, modules chargés)
+    resultat = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import voisins_sol"],
+        capture_output=True, text=True, env=environnement(), cwd=DOSSIER, check=True)
+    # importtime liste les sous-modules avant leur parent : les modules d'indentation 3
+    # qui précèdent la ligne de voisins_sol sont ceux qu'il importe directement
+    total, modules, enfants = 0.0, {}, {}
+    for ligne in resultat.stderr.splitlines():
+        trouve = re.match(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)", ligne)
+        if not trouve:
+            continue
+        niveau, module, cumul = len(trouve.group(3)), trouve.group(4), int(trouve.group(2)) / 1e6
+        if niveau == 3:
+            enfants[module] = cumul
+        elif niveau == 1:
+            if module == "voisins_sol":
+                total, modules = cumul, enfants
+            enfants = {}
+    charges = {m.split(".")[0] for m in re.findall(r"\|\s+(\S+)$", resultat.stderr, flags=re.MULTILINE)}
+    return total, modules, charges
+
+def mesurer_rendu():
+    app = os.path.join(DOSSIER, "voisins_sol.py")
+    resultat = subprocess.run(
+        [sys.executable, "-c", SCRIPT_RENDU.format(app=app)],
+        capture_output=True, text=True, env=environnement(), cwd=DOSSIER, check=True)
+    return float(resultat.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repetitions", type=int, default=5)
+    parser.add_argument("--json", help="fichier où écrire les résultats (suivi des régressions)")
+    args = parser.parse_args()
+
+    durees_import, durees_rendu = [], []
+    for _ in range(args.repetitions):
+        duree, modules, charges = mesurer_import()
+        durees_import.append(duree)
+        durees_rendu.append(mesurer_rendu())
+
+    plus_lourds = sorted(modules.items(), key=lambda m: m[1], reverse=True)[:10]
+    differes_charges = [m for m in IMPORTS_DIFFERES if m in charges]
+    resultats = {
+        "import_s_mediane": statistics.median(durees_import),
+        "premier_rendu_s_mediane": statistics.median(durees_rendu),
+        "modules_les_plus_lourds": dict(plus_lourds),
+        "imports_differes_charges": differes_charges,
+    }
+
+    print(f"Import de voisins_sol     : {resultats['import_s_mediane'] * 1000:8.1f} ms (médiane)")
+    print(f"Premier rendu (Accueil)   : {resultats['premier_rendu_s_mediane'] * 1000:8.1f} ms (médiane)")
+    print("Modules les plus lourds à l'import :")
+    for module, duree in plus_lourds:
+        print(f"  {module:<30} {duree * 1000:8.1f} ms")
+    if differes_charges:
+        print(f"ATTENTION : chargés dès l'import : {', '.join(differes_charges)}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fichier:
+            json.dump(resultats, fichier, indent=2, ensure_ascii=False)
+    return 1 if differes_charges else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
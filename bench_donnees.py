@@ -0,0 +1,110 @@
+"""
+Banc d'essai des fonctions d'accès aux données
+==============================================
+Chronomètre les fonctions de voisins_db.py sur une base remplie par
+donnees_synthetiques.py et affiche, pour chaque scénario, les percentiles
+p50 / p90 / p99 en millisecondes :
+- obtenir_services pour chaque combinaison de filtres catégorie × type (première page) ;
+- obtenir_demandes_recues et obtenir_mes_demandes_initiees pour des utilisateurs tirés au hasard ;
+- creer_demande (écriture) et verifier_connexion (bcrypt compris).
+Le cache du catalogue est vidé avant chaque appel : on mesure le chemin SQL.
+
+Les résultats peuvent être enregistrés comme référence (--enregistrer) puis comparés
+à cette référence (--reference) : le script échoue si un p50 dépasse la référence
+de plus de --tolerance et d'au moins --marge-ms (les mesures sous la milliseconde
+sont trop bruitées pour un seuil purement relatif).
+
+Utilisation :
+    python bench_donnees.py --base synthetique.db --enregistrer reference.json
+    python bench_donnees.py --base synthetique.db --reference reference.json
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+def percentile(valeurs, p):
+    valeurs = sorted(valeurs)
+    return valeurs[min(len(valeurs) - 1, len(valeurs) * p // 100)]
+
+def chronometrer(fonction, arguments, iterations):
+    durees = []
+    for _ in range(iterations):
+        args = arguments()
+        debut = time.perf_counter()
+        fonction(*args)
+        durees.append((time.perf_counter() - debut) * 1000)
+    return {"p50": percentile(durees, 50), "p90": percentile(durees, 90), "p99": percentile(durees, 99)}
+
+def scenarios(vdb, alea, iterations):
+    conn = vdb.obtenir_connexion()
+    nb_utilisateurs = conn.execute("SELECT MAX(id) FROM utilisateurs").fetchone()[0]
+    nb_services = conn.execute("SELECT MAX(id) FROM services").fetchone()[0]
+    utilisateur = lambda: alea.randint(1, nb_utilisateurs)
+    cache = vdb.cache_catalogue()
+
+    def services_filtres(categorie, type_service):
+        cache.invalider()
+        return vdb.obtenir_services(categorie, type_service, limite=vdb.TAILLE_PAGE_SERVICES + 1)
+
+    for categorie in [None] + vdb.CATEGORIES:
+        for type_service in [None] + vdb.TYPES_SERVICE:
+            nom = f"obtenir_services[{categorie or 'Toutes'} | {type_service or 'Tous'}]"
+            yield nom, services_filtres, lambda c=categorie, t=type_service: (c, t), iterations
+    yield "obtenir_demandes_recues", vdb.obtenir_demandes_recues, lambda: (utilisateur(),), iterations
+    yield "obtenir_mes_demandes_initiees", vdb.obtenir_mes_demandes_initiees, lambda: (utilisateur(),), iterations
+    yield ("creer_demande", vdb.creer_demande,
+           lambda: (alea.randint(1, nb_services), utilisateur(), "2030-01-01", "Banc d'essai"), iterations)
+
+    from donnees_synthetiques import MOT_DE_PASSE
+    yield ("verifier_connexion", vdb.verifier_connexion,
+           lambda: (f"voisin{utilisateur()}@exemple.fr", MOT_DE_PASSE), max(5, iterations // 10))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base", help="base remplie par donnees_synthetiques.py (défaut : VOISINS_DB)")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--graine", type=int, default=7)
+    parser.add_argument("--enregistrer", help="écrire les résultats dans ce fichier JSON (nouvelle référence)")
+    parser.add_argument("--reference", help="fichier JSON de référence à comparer")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="dégradation tolérée du p50 (0.25 = +25 %%)")
+    parser.add_argument("--marge-ms", type=float, default=1.0, help="écart absolu minimal pour une régression")
+    args = parser.parse_args()
+    if args.base:
+        os.environ["VOISINS_DB"] = args.base
+
+    import voisins_db as vdb
+    vdb.init_database(vdb.DB_PATH)
+    alea = random.Random(args.graine)
+    reference = {}
+    if args.reference:
+        with open(args.reference, encoding="utf-8") as fichier:
+            reference = json.load(fichier)
+
+    resultats, regressions = {}, []
+    print(f"{'scénario':<58} {'p50':>8} {'p90':>8} {'p99':>8}  référence p50")
+    for nom, fonction, arguments, iterations in scenarios(vdb, alea, args.iterations):
+        fonction(*arguments())  # échauffement (cache de pages SQLite)
+        mesure = resultats[nom] = chronometrer(fonction, arguments, iterations)
+        ligne = f"{nom:<58} {mesure['p50']:>8.2f} {mesure['p90']:>8.2f} {mesure['p99']:>8.2f}"
+        if nom in reference:
+            ecart = mesure["p50"] / reference[nom]["p50"] - 1 if reference[nom]["p50"] else 0.0
+            ligne += f"  {reference[nom]['p50']:.2f} ({ecart:+.0%})"
+            if ecart > args.tolerance and mesure["p50"] - reference[nom]["p50"] > args.marge_ms:
+                regressions.append(nom)
+                ligne += "  RÉGRESSION"
+        print(ligne)
+
+    if args.enregistrer:
+        with open(args.enregistrer, "w", encoding="utf-8") as fichier:
+            json.dump(resultats, fichier, indent=2, ensure_ascii=False)
+    if regressions:
+        print(f"\n{len(regressions)} régression(s) : {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""
+Banc d'essai des écritures concurrentes
+=======================================
+Compare, pour plusieurs nombres de sessions concurrentes (threads), deux façons
+d'écrire une demande (INSERT de la demande et de son évènement) :
+- "avant" : chaque appel prend sa connexion et valide sa propre transaction (COMMIT par appel) ;
+- "après" : creer_demande, qui passe par l'écrivain unique (un COMMIT par lot).
+Affiche le débit (écritures/s), les latences p50 / p99 en millisecondes, le nombre
+d'échecs ("database is locked"...) et, pour l'écrivain, la taille moyenne des lots.
+
+Utilisation : python bench_ecritures.py [--sessions 1 8 32 64] [--ecritures 200]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+os.environ.setdefault("VOISINS_DB", os.path.join(tempfile.mkdtemp(prefix="voisins_ecritures_"), "voisins.db"))
+# Sous contention, l'attente du verrou d'écriture dépasse souvent le seuil : inutile de tout journaliser
+os.environ.setdefault("VOISINS_SEUIL_REQUETE_LENTE_MS", "10000")
+
+import voisins_db as vdb  # noqa: E402
+
+def avant(service_id, demandeur_id):
+    # Ancien chemin : transaction et COMMIT propres à l'appel, en concurrence pour le verrou d'écriture
+    try:
+        with vdb.obtenir_connexion() as conn:
+            c = conn.cursor()
+            c.execute('''INSERT INTO demandes (service_id, demandeur_id, date_souhaitee, message)
+                         VALUES (?, ?, '2030-01-01', 'Banc d''essai')''', (service_id, demandeur_id))
+            c.execute('''INSERT INTO evenements (type, demande_id, proposant_id, demandeur_id, statut)
+                         SELECT 'demande', ?, utilisateur_id, ?, 'en_attente' FROM services WHERE id = ?''',
+                      (c.lastrowid, demandeur_id, service_id))
+            conn.commit()
+        return True
+    except Exception:
+        return False
+
+def apres(service_id, demandeur_id):
+    return vdb.creer_demande(service_id, demandeur_id, "2030-01-01", "Banc d'essai")[0]
+
+def mesurer(fonction, sessions, ecritures):
+    durees, echecs, verrou = [], [0], threading.Lock()
+    depart = threading.Barrier(sessions + 1)
+
+    def session(numero):
+        locales, erreurs = [], 0
+        depart.wait()
+        for _ in range(ecritures):
+            debut = time.perf_counter()
+            erreurs += not fonction(1, numero + 1)
+            locales.append((time.perf_counter() - debut) * 1000)
+        with verrou:
+            durees.extend(locales)
+            echecs[0] += erreurs
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(sessions)]
+    for thread in threads:
+        thread.start()
+    depart.wait()
+    debut = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    total_s = time.perf_counter() - debut
+    latences = vdb.percentiles(durees, (50, 99))
+    return len(durees) / total_s, latences['p50'], latences['p99'], echecs[0]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="+", default=[1, 8, 32, 64])
+    parser.add_argument("--ecritures", type=int, default=200, help="écritures par session")
+    args = parser.parse_args()
+
+    vdb.init_database(vdb.DB_PATH)
+    vdb.creer_utilisateur("Martin", "Jean", "jean@exemple.fr", "secret", "1 rue des Lilas 75011 Paris", "0601020304")
+    vdb.creer_service("Perceuse", vdb.CATEGORIES[1], "Perceuse à percussion", vdb.TYPES_SERVICE[0], 0.0, 1)
+
+    print(f"{'sessions':>8} | {'variante':<8} | {'écritures/s':>11} | {'p50 (ms)':>8} | {'p99 (ms)':>8} | {'échecs':>6} | lot moyen")
+    for sessions in args.sessions:
+        for nom, fonction in (("avant", avant), ("après", apres)):
+            stats = vdb.ecrivain(vdb.DB_PATH).statistiques()
+            lots, ecrites = stats['lots'], stats['ecritures']
+            debit, p50, p99, echecs = mesurer(fonction, sessions, args.ecritures)
+            stats = vdb.ecrivain(vdb.DB_PATH).statistiques()
+            lot = (stats['ecritures'] - ecrites) / max(1, stats['lots'] - lots) if nom == "après" else 1
+            print(f"{sessions:>8} | {nom:<8} | {debit:>11.0f} | {p50:>8.2f} | {p99:>8.2f} | {echecs:>6} | {lot:.1f}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
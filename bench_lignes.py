@@ -0,0 +1,82 @@
+"""
+Banc d'essai : DataFrame pandas contre enregistrements compacts
+===============================================================
+Compare, pour 1 000, 10 000 et 100 000 services, le coût d'un rerun qui lit
+le catalogue puis parcourt chaque ligne :
+- "avant" : pd.read_sql_query puis DataFrame.iterrows() (ancien chemin des pages) ;
+- "après" : enregistrements Service construits depuis le curseur (lire_lignes).
+Mesure le temps médian et le pic mémoire (tracemalloc) de chaque variante.
+
+Utilisation : python bench_lignes.py [--tailles 1000 10000 100000] [--repetitions 5]
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("VOISINS_DB", os.path.join(tempfile.mkdtemp(prefix="voisins_bench_"), "voisins.db"))
+
+import pandas as pd  # noqa: E402
+import voisins_db as vdb  # noqa: E402
+
+REQUETE = f'''SELECT {vdb.COLONNES_CATALOGUE}
+              FROM services s JOIN utilisateurs u ON s.utilisateur_id = u.id
+              WHERE s.disponible = 1 ORDER BY s.date_creation DESC, s.id DESC LIMIT ?'''
+
+def remplir(conn, nombre):
+    # Complète la table services jusqu'à `nombre` lignes (un seul proposant suffit ici)
+    conn.execute('''INSERT OR IGNORE INTO utilisateurs (id, nom, prenom, email, mot_de_passe)
+                    VALUES (1, 'Martin', 'Jean', 'jean@exemple.fr', '-')''')
+    existants = conn.execute('SELECT COUNT(*) FROM services').fetchone()[0]
+    conn.executemany(
+        '''INSERT INTO services (titre, categorie, description, type_service, prix, utilisateur_id)
+           VALUES (?, ?, ?, ?, ?, 1)''',
+        ((f"Service {i}", vdb.CATEGORIES[i % len(vdb.CATEGORIES)], "Description " * 8,
+          vdb.TYPES_SERVICE[i % len(vdb.TYPES_SERVICE)], float(i % 20)) for i in range(existants, nombre)))
+    conn.commit()
+
+def avant(conn, nombre):
+    df = pd.read_sql_query(REQUETE, conn, params=(nombre,))
+    total = 0
+    for _, service in df.iterrows():
+        total += len(service['titre']) + (service['prix'] > 0)
+    return total
+
+def apres(conn, nombre):
+    total = 0
+    for service in vdb.lire_lignes(conn, vdb.Service, REQUETE, (nombre,)):
+        total += len(service.titre) + ((service.prix or 0) > 0)
+    return total
+
+def mesurer(fonction, conn, nombre, repetitions):
+    durees = []
+    for _ in range(repetitions):
+        debut = time.perf_counter()
+        fonction(conn, nombre)
+        durees.append((time.perf_counter() - debut) * 1000)
+    tracemalloc.start()
+    fonction(conn, nombre)
+    _, pic = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return statistics.median(durees), pic / 1024 / 1024
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tailles", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--repetitions", type=int, default=5)
+    args = parser.parse_args()
+
+    vdb.init_database(vdb.DB_PATH)
+    conn = vdb.obtenir_connexion()
+    print(f"{'lignes':>8} | {'avant (ms)':>10} | {'après (ms)':>10} | {'avant (Mo)':>10} | {'après (Mo)':>10}")
+    for nombre in sorted(args.tailles):
+        remplir(conn, nombre)
+        ms_avant, mo_avant = mesurer(avant, conn, nombre, args.repetitions)
+        ms_apres, mo_apres = mesurer(apres, conn, nombre, args.repetitions)
+        print(f"{nombre:>8} | {ms_avant:>10.1f} | {ms_apres:>10.1f} | {mo_avant:>10.1f} | {mo_apres:>10.1f}")
+
+if __name__ == "__main__":
+    main()
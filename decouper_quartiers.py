@@ -0,0 +1,149 @@
+"""
+Découpage d'une base existante par quartier
+===========================================
+Répartit le contenu d'une base voisins.db non découpée dans les bases des quartiers
+configurés par VOISINS_QUARTIERS (base principale VOISINS_DB ou --base) :
+- chaque utilisateur va dans la base du code postal de son adresse (base principale sinon),
+  avec ses services, leurs demandes et leurs évènements, actifs ou archivés ;
+- les identifiants sont renumérotés dans la plage de leur base (numéro << 40) et les
+  références (proposant, demandeur, service, demande) suivent ;
+- un demandeur d'un autre quartier laisse une fiche de contact dans la base du service ;
+- les sessions et le secret des jetons vont dans la base principale : personne n'est déconnecté.
+Les bases de destination doivent être vides ; la source est seulement mise à jour au dernier
+schéma si besoin. Les compteurs, l'index plein texte et les positions sont reconstruits.
+
+Utilisation :
+    VOISINS_QUARTIERS=75011,75020 python decouper_quartiers.py ancienne_voisins.db [--base voisins.db]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+def decouper(vdb, conn, numero, numeros_utilisateurs, numeros_services):
+    # Nouvel identifiant (expression SQL) : ancien identifiant décalé dans la plage de sa base,
+    # celle de destination (n) ou celle d'un utilisateur d'un autre quartier (u)
+    n = lambda colonne: f"((:numero << {vdb.BITS_QUARTIER}) + {colonne})"
+    u = lambda colonne: f"((quartier_utilisateur({colonne}) << {vdb.BITS_QUARTIER}) + {colonne})"
+    conn.create_function('quartier_utilisateur', 1, lambda i: numeros_utilisateurs.get(i, 0), deterministic=True)
+    conn.create_function('quartier_service', 1, lambda i: numeros_services.get(i, 0), deterministic=True)
+    # Un service, ses demandes et leurs évènements sont dans la base de son proposant
+    instructions = [
+        ("utilisateurs", f'''INSERT INTO utilisateurs (id, nom, prenom, email, mot_de_passe, adresse, telephone, date_inscription)
+                             SELECT {n('id')}, nom, prenom, email, mot_de_passe, adresse, telephone, date_inscription
+                             FROM source.utilisateurs WHERE quartier_utilisateur(id) = :numero'''),
+        ("services", f'''INSERT INTO services (id, titre, categorie, description, type_service, prix, utilisateur_id,
+                                               disponible, date_creation, date_desactivation)
+                         SELECT {n('id')}, titre, categorie, description, type_service, prix, {n('utilisateur_id')},
+                                disponible, date_creation, date_desactivation
+                         FROM source.services WHERE quartier_service(id) = :numero'''),
+        ("demandes", f'''INSERT INTO demandes (id, service_id, demandeur_id, date_demande, date_souhaitee, statut, message,
+                                               date_cloture)
+                         SELECT {n('id')}, {n('service_id')}, {u('demandeur_id')},
+                                date_demande, date_souhaitee, statut, message, date_cloture
+                         FROM source.demandes WHERE quartier_service(service_id) = :numero'''),
+        ("evenements", f'''INSERT INTO evenements (id, type, demande_id, proposant_id, demandeur_id, statut, date_evenement)
+                           SELECT {n('id')}, type, {n('demande_id')}, {n('proposant_id')}, {u('demandeur_id')},
+                                  statut, date_evenement
+                           FROM source.evenements WHERE quartier_utilisateur(proposant_id) = :numero'''),
+        ("services_archive", f'''INSERT INTO services_archive (id, titre, categorie, description, type_service, prix,
+                                     utilisateur_id, disponible, date_creation, date_desactivation, date_archivage)
+                                 SELECT {n('id')}, titre, categorie, description, type_service, prix, {n('utilisateur_id')},
+                                        disponible, date_creation, date_desactivation, date_archivage
+                                 FROM source.services_archive WHERE quartier_service(id) = :numero'''),
+        ("demandes_archive", f'''INSERT INTO demandes_archive (id, service_id, demandeur_id, proposant_id, titre,
+                                     date_demande, date_souhaitee, statut, message, date_archivage)
+                                 SELECT {n('id')}, {n('service_id')}, {u('demandeur_id')},
+                                        {n('proposant_id')}, titre, date_demande, date_souhaitee, statut, message, date_archivage
+                                 FROM source.demandes_archive WHERE quartier_utilisateur(proposant_id) = :numero'''),
+        # Fiches de contact des demandeurs venus d'autres quartiers (sans mot de passe)
+        ("fiches", f'''INSERT INTO utilisateurs ({vdb.COLONNES_FICHE}, mot_de_passe)
+                       SELECT {u('id')}, nom, prenom, email, adresse, telephone, date_inscription, ''
+                       FROM source.utilisateurs
+                       WHERE quartier_utilisateur(id) <> :numero AND id IN (
+                           SELECT demandeur_id FROM source.demandes WHERE quartier_service(service_id) = :numero
+                           UNION SELECT demandeur_id FROM source.demandes_archive
+                                 WHERE quartier_utilisateur(proposant_id) = :numero)'''),
+    ]
+    if numero == 0:
+        instructions += [
+            ("sessions", f'''INSERT INTO sessions (empreinte, utilisateur_id, date_creation, date_expiration)
+                             SELECT empreinte, {u('utilisateur_id')}, date_creation, date_expiration FROM source.sessions'''),
+            # Emails réservés (unicité entre les quartiers) : tous les comptes, avec leur nouvel identifiant
+            ("emails_comptes", f'''INSERT OR IGNORE INTO emails_comptes (email, utilisateur_id)
+                                   SELECT email, {u('id')} FROM source.utilisateurs WHERE mot_de_passe <> '' '''),
+            # Le modèle et les curseurs des recommandations désignent les anciens identifiants :
+            # recommander.py refait un calcul complet après le découpage
+            ("parametres", '''INSERT OR REPLACE INTO parametres (cle, valeur) SELECT cle, valeur FROM source.parametres
+                              WHERE cle NOT LIKE 'recommandations%' '''),
+        ]
+    nombres = {}
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for table, requete in instructions:
+            nombres[table] = conn.execute(requete, {'numero': numero}).rowcount
+        debut = numero << vdb.BITS_QUARTIER
+        vdb.positionner_utilisateurs(conn, conn.execute(
+            'SELECT id, adresse FROM utilisateurs WHERE id > ? AND id <= ?',
+            (debut, debut + (1 << vdb.BITS_QUARTIER) - 1)).fetchall())
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    vdb.reserver_identifiants(conn, numero)  # Séquences ramenées dans la plage de la base (fiches)
+    conn.execute('ANALYZE')
+    return nombres
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="base non découpée à répartir")
+    parser.add_argument("--base", help="base principale de destination (défaut : VOISINS_DB ou voisins.db)")
+    args = parser.parse_args()
+    if args.base:
+        os.environ["VOISINS_DB"] = args.base
+
+    import sqlite3
+    import voisins_db as vdb
+
+    source = os.path.abspath(args.source)
+    if not os.path.isfile(source):
+        print(f"Base source introuvable : {source}", file=sys.stderr)
+        return 1
+    if source in map(os.path.abspath, vdb.CHEMINS_QUARTIERS):
+        print("La source doit être distincte des bases de destination.", file=sys.stderr)
+        return 1
+    if not vdb.QUARTIERS:
+        print("Aucun quartier configuré : renseigner VOISINS_QUARTIERS (codes postaux).", file=sys.stderr)
+        return 1
+    with sqlite3.connect(source) as conn:
+        vdb.appliquer_migrations(conn)
+        if conn.execute('SELECT COALESCE(MAX(id), 0) FROM utilisateurs').fetchone()[0] >> vdb.BITS_QUARTIER:
+            print("La source est déjà une base de quartier : utiliser une base non découpée.", file=sys.stderr)
+            return 1
+        numeros_utilisateurs = {i: vdb.quartier_adresse(adresse)
+                                for i, adresse in conn.execute('SELECT id, adresse FROM utilisateurs')}
+        numeros_services = {i: numeros_utilisateurs.get(proprietaire, 0) for i, proprietaire in conn.execute(
+            'SELECT id, utilisateur_id FROM services UNION ALL SELECT id, utilisateur_id FROM services_archive')}
+
+    vdb.init_database(vdb.DB_PATH)
+    for numero, chemin in enumerate(vdb.CHEMINS_QUARTIERS):
+        conn = vdb.connexion_quartier(numero)
+        if conn.execute('SELECT EXISTS (SELECT 1 FROM utilisateurs)').fetchone()[0]:
+            print(f"La base {chemin} contient déjà des données : utiliser des bases vides.", file=sys.stderr)
+            return 1
+
+    for numero, chemin in enumerate(vdb.CHEMINS_QUARTIERS):
+        debut = time.perf_counter()
+        conn = vdb.connexion_quartier(numero)
+        conn.execute('ATTACH DATABASE ? AS source', (source,))
+        try:
+            nombres = decouper(vdb, conn, numero, numeros_utilisateurs, numeros_services)
+        finally:
+            conn.execute('DETACH DATABASE source')
+        detail = ", ".join(f"{nombre} {table}" for table, nombre in nombres.items())
+        print(f"{chemin} : {detail} en {time.perf_counter() - debut:.1f} s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
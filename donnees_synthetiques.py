@@ -0,0 +1,147 @@
+"""
+Générateur de données synthétiques
+==================================
+Remplit une base voisins.db avec des volumes et des distributions réalistes,
+de façon reproductible (graine fixe) :
+- utilisateurs : adresses et téléphones fictifs, un même mot de passe connu
+  (MOT_DE_PASSE) haché une seule fois pour que la génération reste rapide ;
+- services : catégories et types pondérés, prix selon le type, 85 % disponibles,
+  5 % des voisins publient 60 % des annonces, dates sur deux ans ;
+- demandes : services populaires plus demandés, statuts en_attente / acceptee /
+  refusee selon STATUTS, date postérieure à la création du service.
+
+Utilisation :
+    python donnees_synthetiques.py --utilisateurs 50000 --services 1000000 --demandes 5000000
+La base visée est VOISINS_DB (ou --base).
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from array import array
+from datetime import datetime, timedelta
+from itertools import islice
+
+# Mot de passe en clair de tous les utilisateurs générés (utilisé par bench_donnees.py)
+MOT_DE_PASSE = "voisin-synthetique"
+
+POIDS_CATEGORIES = {"Jardinage": 16, "Bricolage": 22, "Courses": 12, "Garde d'enfants": 9,
+                    "Garde d'animaux": 10, "Aide aux devoirs": 8, "Covoiturage": 7,
+                    "Aide à domicile": 9, "Autre": 7}
+POIDS_TYPES = {"Service gratuit": 45, "Location payante": 20, "Service rémunéré": 15, "Échange": 20}
+STATUTS = {"en_attente": 25, "acceptee": 55, "refusee": 20}
+
+MOTS = {
+    "Jardinage": ["tondeuse", "taille-haie", "débroussailleuse", "sécateur", "potager", "arrosage"],
+    "Bricolage": ["perceuse", "visseuse", "échelle", "scie", "ponceuse", "montage de meubles"],
+    "Courses": ["courses", "marché", "pharmacie", "commissions", "supermarché"],
+    "Garde d'enfants": ["baby-sitting", "sortie d'école", "garde", "mercredi"],
+    "Garde d'animaux": ["promenade", "chien", "chat", "nourrir", "vacances"],
+    "Aide aux devoirs": ["mathématiques", "français", "anglais", "devoirs", "collège", "lycée"],
+    "Covoiturage": ["trajet", "gare", "aéroport", "voiture", "covoiturage"],
+    "Aide à domicile": ["ménage", "repassage", "repas", "accompagnement", "lecture"],
+    "Autre": ["déménagement", "informatique", "couture", "photographie"],
+}
+RUES = ["rue des Lilas", "avenue de la République", "rue Oberkampf", "boulevard Voltaire",
+        "rue de Charonne", "rue du Faubourg Saint-Antoine", "place de la Nation", "rue de Belleville"]
+PRENOMS = ["Camille", "Léa", "Manon", "Inès", "Chloé", "Lucas", "Hugo", "Louis", "Nathan", "Gabriel",
+           "Fatou", "Yanis", "Sofia", "Adam", "Zoé", "Mohamed", "Emma", "Jules", "Aïcha", "Paul"]
+NOMS = ["Martin", "Bernard", "Dubois", "Thomas", "Robert", "Petit", "Durand", "Leroy", "Moreau",
+        "Diallo", "Nguyen", "Garcia", "Lefebvre", "Traoré", "Fournier", "Girard", "Benali", "Roux"]
+
+DEBUT = datetime(2024, 1, 1)
+DUREE_SECONDES = 2 * 365 * 24 * 3600
+TAILLE_LOT = 50000
+
+def horodatage(secondes):
+    return (DEBUT + timedelta(seconds=secondes)).strftime("%Y-%m-%d %H:%M:%S")
+
+def utilisateurs(alea, nombre, hachage):
+    for i in range(1, nombre + 1):
+        code_postal = f"750{alea.randint(1, 20):02d}"
+        yield (i, alea.choice(NOMS), alea.choice(PRENOMS), f"voisin{i}@exemple.fr", hachage,
+               f"{alea.randint(1, 150)} {alea.choice(RUES)} {code_postal} Paris",
+               f"06{alea.randint(0, 99999999):08d}", horodatage(alea.randrange(DUREE_SECONDES)))
+
+def services(alea, nombre, nombre_utilisateurs, dates):
+    categories, poids_categories = zip(*POIDS_CATEGORIES.items())
+    types, poids_types = zip(*POIDS_TYPES.items())
+    for i in range(1, nombre + 1):
+        categorie = alea.choices(categories, poids_categories)[0]
+        type_service = alea.choices(types, poids_types)[0]
+        mot = alea.choice(MOTS[categorie])
+        prix = round(alea.lognormvariate(2.3, 0.6), 1) if type_service in ("Location payante", "Service rémunéré") else 0.0
+        # 5 % des voisins (les plus actifs) publient 60 % des annonces
+        if alea.random() < 0.6:
+            proposant = alea.randint(1, max(1, nombre_utilisateurs // 20))
+        else:
+            proposant = alea.randint(1, nombre_utilisateurs)
+        secondes = alea.randrange(DUREE_SECONDES)
+        dates.append(secondes)
+        yield (i, f"{mot.capitalize()} - {categorie}", categorie,
+               f"Je propose : {mot}. " + " ".join(alea.choices(MOTS[categorie], k=6)),
+               type_service, prix, proposant, int(alea.random() < 0.85), horodatage(secondes))
+
+def demandes(alea, nombre, nombre_services, nombre_utilisateurs, dates):
+    statuts, poids_statuts = zip(*STATUTS.items())
+    for i in range(1, nombre + 1):
+        # Distribution exponentielle : une partie des services concentre les demandes
+        service = min(nombre_services, int(alea.expovariate(1.0 / (nombre_services / 4))) + 1)
+        debut = dates[service - 1]
+        secondes = min(DUREE_SECONDES, debut + int(alea.expovariate(1 / (14 * 24 * 3600))))
+        yield (i, service, alea.randint(1, nombre_utilisateurs), horodatage(secondes),
+               horodatage(secondes + alea.randint(1, 30) * 24 * 3600)[:10],
+               alea.choices(statuts, poids_statuts)[0], "Bonjour, je suis intéressé(e) !")
+
+def inserer(conn, requete, lignes, libelle):
+    debut, total = time.perf_counter(), 0
+    while lot := list(islice(lignes, TAILLE_LOT)):
+        with conn:
+            conn.executemany(requete, lot)
+        total += len(lot)
+        print(f"{libelle} : {total}", end="\r", file=sys.stderr)
+    print(f"{libelle} : {total} ligne(s) en {time.perf_counter() - debut:.1f} s")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--utilisateurs", type=int, default=50000)
+    parser.add_argument("--services", type=int, default=1000000)
+    parser.add_argument("--demandes", type=int, default=5000000)
+    parser.add_argument("--graine", type=int, default=42)
+    parser.add_argument("--base", help="fichier SQLite à remplir (défaut : VOISINS_DB ou voisins.db)")
+    args = parser.parse_args()
+    if args.base:
+        os.environ["VOISINS_DB"] = args.base
+
+    import voisins_db as vdb
+    import import_export
+
+    vdb.init_database(vdb.DB_PATH)
+    conn = vdb.obtenir_connexion()
+    if conn.execute("SELECT EXISTS (SELECT 1 FROM utilisateurs)").fetchone()[0]:
+        print(f"La base {vdb.DB_PATH} contient déjà des données : utiliser une base vide.", file=sys.stderr)
+        return 1
+    conn.execute("PRAGMA cache_size = -262144")
+    alea = random.Random(args.graine)
+    dates = array("l")
+
+    # Utilisateurs et services : même insertion par lots que l'import en masse
+    # (positions géocodées, indexation plein texte groupée)
+    for table, lignes in (("utilisateurs", utilisateurs(alea, args.utilisateurs, vdb.hash_password(MOT_DE_PASSE))),
+                          ("services", services(alea, args.services, args.utilisateurs, dates))):
+        debut, total = time.perf_counter(), 0
+        while lot := list(islice(lignes, TAILLE_LOT)):
+            total += import_export.inserer_lot(conn, table, lot)
+            print(f"{table} : {total}", end="\r", file=sys.stderr)
+        print(f"{table} : {total} ligne(s) en {time.perf_counter() - debut:.1f} s")
+
+    inserer(conn, '''INSERT INTO demandes (id, service_id, demandeur_id, date_demande, date_souhaitee, statut, message)
+                     VALUES (?, ?, ?, ?, ?, ?, ?)''',
+            demandes(alea, args.demandes, args.services, args.utilisateurs, dates), "demandes")
+    conn.execute("ANALYZE")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,307 @@
+"""
+Import / export en masse des utilisateurs et des services
+=========================================================
+Outil en ligne de commande pour charger d'un coup les annonces d'une association
+de quartier (au lieu de les saisir une par une) ou pour exporter la base.
+Les fichiers CSV ou JSONL (un objet JSON par ligne, selon l'extension) sont lus
+et écrits au fil de l'eau, par lots : la mémoire utilisée ne dépend pas de la
+taille du fichier.
+
+- Les lignes sont validées (champs obligatoires, CATEGORIES, TYPES_SERVICE) ;
+  les lignes rejetées sont signalées avec leur numéro et ignorées.
+- Les mots de passe en clair (colonne mot_de_passe) sont hachés sur un pool de
+  processus ; une colonne mot_de_passe_hash (issue d'un export) est reprise telle quelle.
+- Chaque lot est inséré avec executemany dans une seule transaction.
+- L'export parcourt toutes les bases de quartier (VOISINS_QUARTIERS) sans les
+  fiches de contact recopiées ; l'import se fait dans une base non répartie,
+  découpée ensuite avec decouper_quartiers.py.
+
+Utilisation :
+    python import_export.py importer utilisateurs voisins.csv [--cout-bcrypt 10]
+    python import_export.py importer services annonces.jsonl
+    python import_export.py exporter services export.csv
+"""
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import voisins_db as vdb
+
+TAILLE_LOT = 10000
+
+# Colonnes exportées (et acceptées à l'import) pour chaque table
+COLONNES = {
+    "utilisateurs": ["id", "nom", "prenom", "email", "mot_de_passe_hash", "adresse", "telephone", "date_inscription"],
+    "services": ["id", "titre", "categorie", "description", "type_service", "prix", "utilisateur_id",
+                 "disponible", "date_creation"],
+}
+
+INSERTIONS = {
+    # INSERT OR IGNORE : un email déjà inscrit est compté comme doublon au lieu d'interrompre le lot,
+    # y compris s'il est réservé par un compte d'un autre quartier (emails_comptes). Sans identifiant,
+    # le compte prend le suivant de la plage de la base principale (voir vdb.prochain_utilisateur)
+    "utilisateurs": f'''INSERT OR IGNORE INTO utilisateurs
+                       (id, nom, prenom, email, mot_de_passe, adresse, telephone, date_inscription)
+                       SELECT COALESCE(?1, {vdb.prochain_utilisateur(0)}), ?2, ?3, ?4, ?5, ?6, ?7, COALESCE(?8, CURRENT_TIMESTAMP)
+                       WHERE NOT EXISTS (SELECT 1 FROM emails_comptes WHERE email = ?4)''',
+    # Les identifiants explicites déjà présents sont écartés avant l'insertion (voir inserer_lot)
+    "services": '''INSERT INTO services
+                   (id, titre, categorie, description, type_service, prix, utilisateur_id, disponible, date_creation)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, COALESCE(?, 1), COALESCE(?, CURRENT_TIMESTAMP))''',
+}
+
+# Lignes de la plage d'identifiants d'une base (début, fin) : les fiches de contact recopiées
+# depuis les autres quartiers (sans mot de passe) ne sont exportées qu'avec leur base d'origine
+EXPORTS = {
+    "utilisateurs": '''SELECT id, nom, prenom, email, mot_de_passe, adresse, telephone, date_inscription
+                       FROM utilisateurs WHERE id >= ? AND id < ? ORDER BY id''',
+    "services": '''SELECT id, titre, categorie, description, type_service, prix, utilisateur_id,
+                   disponible, date_creation FROM services WHERE id >= ? AND id < ? ORDER BY id''',
+}
+
+class LigneInvalide(ValueError):
+    pass
+
+# ---------- LECTURE / ÉCRITURE EN FLUX ----------
+
+def est_jsonl(chemin):
+    return chemin.lower().endswith((".jsonl", ".ndjson"))
+
+def lire_lignes(chemin):
+    # Générateur de dictionnaires, une ligne du fichier à la fois. Une ligne JSONL illisible
+    # donne une LigneInvalide (rejetée par preparer_lot), une ligne vide None (ignorée)
+    with open(chemin, newline="", encoding="utf-8") as fichier:
+        if est_jsonl(chemin):
+            for ligne in fichier:
+                if not ligne.strip():
+                    yield None
+                    continue
+                try:
+                    objet = json.loads(ligne)
+                except json.JSONDecodeError as e:
+                    yield LigneInvalide(f"JSON invalide : {e}")
+                    continue
+                yield objet if isinstance(objet, dict) else LigneInvalide("la ligne n'est pas un objet JSON")
+        else:
+            yield from csv.DictReader(fichier)
+
+def par_lots(iterable, taille):
+    iterateur = iter(iterable)
+    while lot := list(islice(iterateur, taille)):
+        yield lot
+
+# ---------- VALIDATION ----------
+
+def texte(ligne, champ, obligatoire=True):
+    valeur = ligne.get(champ)
+    valeur = None if valeur is None else str(valeur).strip()
+    if obligatoire and not valeur:
+        raise LigneInvalide(f"champ '{champ}' manquant")
+    return valeur or None
+
+def entier(ligne, champ, obligatoire=False):
+    valeur = texte(ligne, champ, obligatoire)
+    try:
+        return None if valeur is None else int(valeur)
+    except ValueError:
+        raise LigneInvalide(f"champ '{champ}' non entier : {valeur!r}")
+
+def valider_utilisateur(ligne):
+    # Retourne (valeurs à insérer sans le hash, mot de passe en clair ou None, hash ou None)
+    valeurs = (entier(ligne, "id"), texte(ligne, "nom"), texte(ligne, "prenom"), texte(ligne, "email"))
+    clair = texte(ligne, "mot_de_passe", obligatoire=False)
+    hachage = texte(ligne, "mot_de_passe_hash", obligatoire=False)
+    if not clair and not hachage:
+        raise LigneInvalide("mot_de_passe ou mot_de_passe_hash requis")
+    if clair and len(clair) < 6:
+        raise LigneInvalide("le mot de passe doit contenir au moins 6 caractères")
+    fin = (texte(ligne, "adresse", False), texte(ligne, "telephone", False), texte(ligne, "date_inscription", False))
+    return valeurs, fin, clair, hachage
+
+def valider_service(ligne):
+    categorie = texte(ligne, "categorie")
+    if categorie not in vdb.CATEGORIES:
+        raise LigneInvalide(f"catégorie inconnue : {categorie!r}")
+    type_service = texte(ligne, "type_service")
+    if type_service not in vdb.TYPES_SERVICE:
+        raise LigneInvalide(f"type de service inconnu : {type_service!r}")
+    prix = texte(ligne, "prix", obligatoire=False)
+    try:
+        prix = float(prix) if prix is not None else 0.0
+    except ValueError:
+        raise LigneInvalide(f"prix invalide : {prix!r}")
+    disponible = entier(ligne, "disponible")
+    if disponible not in (None, 0, 1):
+        raise LigneInvalide(f"disponible doit valoir 0 ou 1 : {disponible!r}")
+    return (entier(ligne, "id"), texte(ligne, "titre"), categorie, texte(ligne, "description"), type_service,
+            prix, entier(ligne, "utilisateur_id", obligatoire=True), disponible,
+            texte(ligne, "date_creation", obligatoire=False))
+
+# ---------- HACHAGE SUR POOL DE PROCESSUS ----------
+
+def hacher(arguments):
+    # Exécuté dans un processus du pool : bcrypt importé une fois par processus
+    import bcrypt  # type: ignore
+    mot_de_passe, cout = arguments
+    return bcrypt.hashpw(mot_de_passe.encode("utf-8"), bcrypt.gensalt(rounds=cout)).decode("utf-8")
+
+# ---------- IMPORT ----------
+
+def preparer_lot(table, lot, premier_numero, pool, processus, cout):
+    # Valide un lot, hache les mots de passe en clair ; retourne (lignes à insérer, rejets)
+    lignes, rejets = [], []
+    for numero, ligne in enumerate(lot, start=premier_numero):
+        if ligne is None:
+            continue
+        try:
+            if isinstance(ligne, LigneInvalide):
+                raise ligne
+            lignes.append(valider_utilisateur(ligne) if table == "utilisateurs" else valider_service(ligne))
+        except LigneInvalide as e:
+            rejets.append((numero, str(e)))
+    if table == "utilisateurs":
+        a_hacher = [(clair, cout) for _, _, clair, hachage in lignes if not hachage]
+        hachages = iter(pool.map(hacher, a_hacher, chunksize=max(1, len(a_hacher) // (4 * processus))))
+        lignes = [debut + (hachage or next(hachages),) + fin for debut, fin, clair, hachage in lignes]
+    return lignes, rejets
+
+def inserer_lot(conn, table, lignes):
+    """
+    Insère un lot dans une seule transaction et retourne le nombre de lignes insérées.
+    Pour les utilisateurs, les adresses sont géocodées et les positions écrites dans
+    l'index R*Tree dans la même transaction.
+    Pour les services, les triggers d'insertion (une écriture FTS et une mise à jour de
+    compteur par ligne) sont suspendus le temps du lot et remplacés par une insertion
+    groupée dans services_fts et un comptage groupé des nouvelles lignes. La suspension
+    est la ligne 'import_services' de parametres, écrite et effacée dans la transaction
+    du lot (migration 13) : le schéma ne change pas, et les autres connexions, qui ne
+    voient pas cette ligne, gardent les triggers.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Dernier identifiant de la plage de la base principale : les fiches d'autres quartiers sont au-delà
+        fin = 1 << vdb.BITS_QUARTIER
+        dernier_id = conn.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table} WHERE id < ?', (fin,)).fetchone()[0]
+        if table == "services":
+            # Un identifiant déjà présent (ou répété dans le lot) est un doublon ignoré, comme un
+            # email déjà inscrit, au lieu d'une IntegrityError qui annulerait tout le lot
+            existants = {identifiant for (identifiant,) in conn.execute(
+                'SELECT id FROM services WHERE id IN (SELECT value FROM json_each(?))',
+                (json.dumps([ligne[0] for ligne in lignes if ligne[0] is not None]),))}
+            retenues = []
+            for ligne in lignes:
+                if ligne[0] not in existants:
+                    retenues.append(ligne)
+                    if ligne[0] is not None:
+                        existants.add(ligne[0])
+            lignes = retenues
+            conn.execute("INSERT INTO parametres (cle, valeur) VALUES ('import_services', '1')")
+        curseur = conn.executemany(INSERTIONS[table], lignes)
+        ids_explicites = [ligne[0] for ligne in lignes if ligne[0] is not None and not dernier_id < ligne[0] < fin]
+        if table == "utilisateurs":
+            vdb.positionner_utilisateurs(conn, conn.execute(
+                '''SELECT id, adresse FROM utilisateurs
+                   WHERE id > ? AND id < ? OR id IN (SELECT value FROM json_each(?))''',
+                (dernier_id, fin, json.dumps(ids_explicites))).fetchall())
+            # Emails des comptes importés réservés dans la même transaction (unicité entre les quartiers)
+            conn.execute("""INSERT OR IGNORE INTO emails_comptes (email, utilisateur_id)
+                            SELECT email, id FROM utilisateurs
+                            WHERE email IN (SELECT value FROM json_each(?)) AND mot_de_passe <> ''""",
+                         (json.dumps([ligne[3] for ligne in lignes]),))
+        if table == "services":
+            conn.execute('''INSERT INTO services_fts (rowid, titre, description)
+                            SELECT id, titre, description FROM services
+                            WHERE disponible = 1
+                              AND (id > ? OR id IN (SELECT value FROM json_each(?)))''',
+                         (dernier_id, json.dumps(ids_explicites)))
+            conn.execute('''INSERT INTO compteurs_services (categorie, type_service, disponibles)
+                            SELECT categorie, type_service, COUNT(*) FROM services
+                            WHERE disponible = 1
+                              AND (id > ? OR id IN (SELECT value FROM json_each(?)))
+                            GROUP BY categorie, type_service
+                            ON CONFLICT (categorie, type_service)
+                            DO UPDATE SET disponibles = disponibles + excluded.disponibles''',
+                         (dernier_id, json.dumps(ids_explicites)))
+            conn.execute("DELETE FROM parametres WHERE cle = 'import_services'")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return curseur.rowcount
+
+def importer(table, chemin, taille_lot, processus, cout):
+    if len(vdb.CHEMINS_QUARTIERS) > 1:
+        # Chaque compte irait dans la base de son quartier, son email réservé dans la base principale :
+        # c'est le rôle de decouper_quartiers.py, pas de l'import par lots
+        print("Import impossible dans une installation répartie par quartier (VOISINS_QUARTIERS) : importer "
+              "dans une base non répartie, puis la découper avec decouper_quartiers.py.", file=sys.stderr)
+        return 1
+    conn = vdb.obtenir_connexion()
+    conn.execute('PRAGMA cache_size = -262144')  # 256 Mo de cache : moins de relectures d'index pendant l'import
+    inseres = ignores = nombre_rejets = 0
+    debut = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=processus) as pool:
+        numero = 2 if not est_jsonl(chemin) else 1  # numéro de ligne dans le fichier (en-tête CSV exclu)
+        for lot in par_lots(lire_lignes(chemin), taille_lot):
+            lignes, rejets = preparer_lot(table, lot, numero, pool, processus, cout)
+            numero += len(lot)
+            for numero_rejet, raison in rejets:
+                print(f"ligne {numero_rejet} rejetée : {raison}", file=sys.stderr)
+            nombre_rejets += len(rejets)
+            nombre = inserer_lot(conn, table, lignes)
+            inseres += nombre
+            ignores += len(lignes) - nombre
+            print(f"{inseres} ligne(s) importée(s)...", file=sys.stderr, end="\r")
+    print(f"{table} : {inseres} importée(s), {ignores} doublon(s) ignoré(s), {nombre_rejets} rejetée(s) "
+          f"en {time.perf_counter() - debut:.1f} s")
+    return 0 if not nombre_rejets else 1
+
+# ---------- EXPORT ----------
+
+def exporter(table, chemin, taille_lot):
+    colonnes = COLONNES[table]
+    nombre = 0
+    with open(chemin, "w", newline="", encoding="utf-8") as fichier:
+        ecrivain = None if est_jsonl(chemin) else csv.writer(fichier)
+        if ecrivain:
+            ecrivain.writerow(colonnes)
+        # Bases lues l'une après l'autre, au fil de l'eau : plages croissantes, export trié par id
+        for numero in range(len(vdb.CHEMINS_QUARTIERS)):
+            curseur = vdb.connexion_quartier(numero).execute(
+                EXPORTS[table], (numero << vdb.BITS_QUARTIER, (numero + 1) << vdb.BITS_QUARTIER))
+            while lignes := curseur.fetchmany(taille_lot):
+                if ecrivain:
+                    ecrivain.writerows(lignes)
+                else:
+                    fichier.writelines(json.dumps(dict(zip(colonnes, ligne)), ensure_ascii=False) + "\n"
+                                       for ligne in lignes)
+                nombre += len(lignes)
+    print(f"{table} : {nombre} ligne(s) exportée(s) vers {chemin}")
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("action", choices=["importer", "exporter"])
+    parser.add_argument("table", choices=sorted(COLONNES))
+    parser.add_argument("fichier", help="fichier .csv ou .jsonl")
+    parser.add_argument("--taille-lot", type=int, default=TAILLE_LOT, help="lignes par transaction")
+    parser.add_argument("--processus", type=int, default=os.cpu_count() or 2,
+                        help="processus de hachage des mots de passe")
+    parser.add_argument("--cout-bcrypt", type=int, default=vdb.BCRYPT_COUT,
+                        help="coût bcrypt des mots de passe importés (remis au coût configuré "
+                             "à la première connexion de chaque utilisateur)")
+    args = parser.parse_args()
+
+    vdb.init_database(vdb.DB_PATH)
+    if args.action == "importer":
+        return importer(args.table, args.fichier, args.taille_lot, args.processus, args.cout_bcrypt)
+    return exporter(args.table, args.fichier, args.taille_lot)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,380 @@
+"""
+Instantanés analytiques (Parquet)
+=================================
+Copie utilisateurs, services et demandes dans des fichiers Parquet partitionnés par mois de
+création (dossier VOISINS_INSTANTANES, « instantanes » à côté de la base par défaut) : les
+analyses pandas lisent ces fichiers au lieu de la base de production.
+- Chaque passage ne relit, base par base, que les lignes créées (identifiant au-delà du dernier
+  exporté) ou modifiées (date_modification, tenue à jour par trigger) depuis le précédent, et les
+  écrit dans un nouveau fichier par partition touchée. Le premier passage reprend aussi les tables
+  d'archive ; ensuite, les lignes archivées depuis le passage précédent sont relues une fois.
+- Une ligne modifiée est réécrite en entier : à la lecture, seule sa dernière version compte.
+  Une partition qui dépasse --fichiers-max fichiers est compactée (une version par ligne).
+- Ni mot de passe, ni nom, email, téléphone ou adresse (seulement son code postal), ni message.
+Le manifeste (manifeste.json) liste les fichiers valides et les curseurs de chaque base ; il est
+remplacé en dernier : un passage interrompu ne laisse que des fichiers ignorés, supprimés au
+passage suivant. Après un découpage par quartier (identifiants renumérotés), le passage suivant
+repart de zéro ; --complet force une reconstruction (par exemple après un import d'identifiants
+explicites déjà dépassés). À lancer périodiquement (cron), application en marche.
+
+Utilisation :
+    python instantanes.py [--base voisins.db] [--dossier instantanes] [--complet] [--compacter]
+
+Lecture, sans accès à la base (seules les colonnes demandées sont lues) :
+    from instantanes import lire
+    demandes = lire("demandes", ["service_id", "statut"], [("mois", ">=", "2026-01")])
+    services = lire("services", ["id", "categorie"])
+"""
+
+import argparse
+import json
+import os
+import re
+import shutil
+import sys
+import time
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+def dossier_par_defaut(base):
+    return os.environ.get("VOISINS_INSTANTANES", os.path.join(os.path.dirname(os.path.abspath(base)), "instantanes"))
+
+# voisins_db n'est importé que par l'export : la lecture ne dépend pas de la base
+DOSSIER = dossier_par_defaut(os.environ.get("VOISINS_DB", "voisins.db"))
+TAILLE_LOT = 100000
+FICHIERS_MAX = 24
+MANIFESTE = "manifeste.json"
+# Format des fichiers : un changement de colonnes impose de repartir de zéro
+VERSION = 1
+HORODATAGE = pa.timestamp("s")
+# Partition des lignes sans date de création
+MOIS_INCONNU = "0000-00"
+
+# Colonnes écrites pour chaque table (nom, type Arrow), dans l'ordre des requêtes ci-dessous
+COLONNES = {
+    "utilisateurs": [("id", pa.int64()), ("code_postal", pa.string()), ("date_inscription", HORODATAGE),
+                     ("date_modification", HORODATAGE)],
+    "services": [("id", pa.int64()), ("titre", pa.string()), ("categorie", pa.string()),
+                 ("type_service", pa.string()), ("prix", pa.float64()), ("utilisateur_id", pa.int64()),
+                 ("disponible", pa.bool_()), ("date_creation", HORODATAGE), ("date_desactivation", HORODATAGE),
+                 ("date_modification", HORODATAGE)],
+    "demandes": [("id", pa.int64()), ("service_id", pa.int64()), ("demandeur_id", pa.int64()),
+                 ("date_demande", HORODATAGE), ("date_souhaitee", pa.date32()), ("statut", pa.string()),
+                 ("date_modification", HORODATAGE)],
+}
+# Numéro du passage qui a écrit la ligne : départage les versions d'une même ligne
+SCHEMAS = {table: pa.schema(colonnes + [("lot", pa.int32())]) for table, colonnes in COLONNES.items()}
+
+# Sources de chaque table : (table SQLite, colonnes, date des lignes à relire). La table active
+# est relue sur date_modification, l'archive sur date_archivage. Dates normalisées par SQLite ;
+# la dernière colonne est la partition (mois de création).
+SOURCES = {
+    "utilisateurs": [
+        ("utilisateurs", f'''id, adresse, datetime(date_inscription), datetime(date_modification),
+                             COALESCE(strftime('%Y-%m', date_inscription), '{MOIS_INCONNU}')''',
+         "date_modification"),
+    ],
+    "services": [
+        ("services", f'''id, titre, categorie, type_service, prix, utilisateur_id, disponible,
+                         datetime(date_creation), datetime(date_desactivation), datetime(date_modification),
+                         COALESCE(strftime('%Y-%m', date_creation), '{MOIS_INCONNU}')''',
+         "date_modification"),
+        ("services_archive", f'''id, titre, categorie, type_service, prix, utilisateur_id, disponible,
+                                 datetime(date_creation), datetime(date_desactivation), NULL,
+                                 COALESCE(strftime('%Y-%m', date_creation), '{MOIS_INCONNU}')''',
+         "date_archivage"),
+    ],
+    "demandes": [
+        ("demandes", f'''id, service_id, demandeur_id, datetime(date_demande), date(date_souhaitee), statut,
+                         datetime(date_modification),
+                         COALESCE(strftime('%Y-%m', date_demande), '{MOIS_INCONNU}')''',
+         "date_modification"),
+        ("demandes_archive", f'''id, service_id, demandeur_id, datetime(date_demande), date(date_souhaitee),
+                                 statut, NULL, COALESCE(strftime('%Y-%m', date_demande), '{MOIS_INCONNU}')''',
+         "date_archivage"),
+    ],
+}
+
+def code_postal(adresse):
+    # Dernier code postal (5 chiffres) de l'adresse, comme quartier_adresse
+    codes = re.findall(r'(?<!\d)\d{5}(?!\d)', adresse or '')
+    return codes[-1] if codes else None
+
+# Colonnes calculées en Python à partir de la valeur lue
+CONVERSIONS = {"code_postal": code_postal}
+
+# ---------- MANIFESTE ----------
+
+def lire_manifeste(dossier):
+    try:
+        with open(os.path.join(dossier, MANIFESTE), encoding="utf-8") as fichier:
+            return json.load(fichier)
+    except FileNotFoundError:
+        return None
+
+def ecrire_manifeste(dossier, manifeste):
+    # Remplacement atomique : les lecteurs voient l'ancien ou le nouveau manifeste, jamais un mélange
+    chemin = os.path.join(dossier, MANIFESTE)
+    with open(chemin + ".tmp", "w", encoding="utf-8") as fichier:
+        json.dump(manifeste, fichier, ensure_ascii=False, indent=1)
+    os.replace(chemin + ".tmp", chemin)
+
+def nouveau_manifeste(bases):
+    return {"version": VERSION, "bases": bases, "lot": 0, "curseurs": [None] * bases,
+            "tables": {table: {"fichiers": {}, "partitions_modifiees": []} for table in COLONNES}}
+
+def chemin_fichier(dossier, table, mois, nom):
+    return os.path.join(dossier, table, f"mois={mois}", nom)
+
+def nettoyer(dossier, manifeste):
+    # Supprime les fichiers d'un passage interrompu ou d'un compactage (absents du manifeste)
+    for table, etat in manifeste["tables"].items():
+        for racine, _, noms in os.walk(os.path.join(dossier, table)):
+            valides = etat["fichiers"].get(os.path.basename(racine).partition("=")[2], [])
+            for nom in noms:
+                if nom not in valides:
+                    os.remove(os.path.join(racine, nom))
+
+# ---------- ÉCRITURE ----------
+
+def en_table(table, lignes, lot):
+    # Lignes SQLite -> (table Arrow au schéma de la table, mois de partition de chaque ligne)
+    valeurs = list(zip(*lignes))
+    tableaux = []
+    for (nom, type_arrow), colonne in zip(COLONNES[table], valeurs):
+        if nom in CONVERSIONS:
+            colonne = [CONVERSIONS[nom](valeur) for valeur in colonne]
+        if type_arrow in (HORODATAGE, pa.date32()):
+            format_date = "%Y-%m-%d %H:%M:%S" if type_arrow == HORODATAGE else "%Y-%m-%d"
+            tableaux.append(pc.strptime(pa.array(colonne, pa.string()), format=format_date, unit="s").cast(type_arrow))
+        else:
+            tableaux.append(pa.array(colonne).cast(type_arrow))
+    tableaux.append(pa.array([lot] * len(lignes), pa.int32()))
+    return pa.Table.from_arrays(tableaux, schema=SCHEMAS[table]), pa.array(valeurs[-1], pa.string())
+
+class Partitions:
+    """
+    Fichiers écrits par un passage pour une table : un par partition touchée, sous un nom
+    temporaire jusqu'à fermer().
+    """
+
+    def __init__(self, dossier, table, lot):
+        self.dossier, self.table, self.nom = dossier, table, f"lot-{lot:06d}.parquet"
+        self.ecrivains = {}
+
+    def ecrire(self, donnees, mois):
+        # Répartit un lot de lignes par mois ; retourne les mois touchés
+        touches = pc.unique(mois).to_pylist()
+        for valeur in touches:
+            partie = donnees if len(touches) == 1 else donnees.filter(pc.equal(mois, valeur))
+            if valeur not in self.ecrivains:
+                chemin = chemin_fichier(self.dossier, self.table, valeur, self.nom)
+                os.makedirs(os.path.dirname(chemin), exist_ok=True)
+                self.ecrivains[valeur] = pq.ParquetWriter(chemin + ".tmp", SCHEMAS[self.table], compression="zstd")
+            self.ecrivains[valeur].write_table(partie)
+        return set(touches)
+
+    def fermer(self):
+        # Renomme les fichiers complets ; retourne les mois écrits
+        for valeur, ecrivain in self.ecrivains.items():
+            ecrivain.close()
+            chemin = chemin_fichier(self.dossier, self.table, valeur, self.nom)
+            os.replace(chemin + ".tmp", chemin)
+        return list(self.ecrivains)
+
+def dernieres_versions(donnees):
+    """
+    Garde la dernière version (lot le plus récent) de chaque ligne. Un identifiant n'apparaît
+    qu'une fois par lot : seules les lignes dont l'identifiant revient dans un lot plus récent
+    que le plus ancien sont dédoublonnées (regroupement et jointure), pas toute la table.
+    """
+    if donnees.num_rows == 0:
+        return donnees
+    recents = pc.unique(donnees.filter(pc.greater(donnees["lot"], pc.min(donnees["lot"])))["id"])
+    suspectes = pc.is_in(donnees["id"], value_set=recents)
+    doublons = donnees.filter(suspectes)
+    derniers = doublons.group_by("id").aggregate([("lot", "max")]).rename_columns({"lot_max": "lot"})
+    return pa.concat_tables([donnees.filter(pc.invert(suspectes)),
+                             doublons.join(derniers, ["id", "lot"], join_type="inner").select(donnees.column_names)])
+
+def compacter(dossier, table, mois, noms, lot):
+    # Réécrit une partition en un seul fichier, une version par ligne ; retourne son nom
+    donnees = ds.dataset([chemin_fichier(dossier, table, mois, nom) for nom in noms],
+                         schema=SCHEMAS[table], format="parquet").to_table()
+    nom = f"compact-{lot:06d}.parquet"
+    chemin = chemin_fichier(dossier, table, mois, nom)
+    pq.write_table(dernieres_versions(donnees).sort_by("id"), chemin + ".tmp", compression="zstd")
+    os.replace(chemin + ".tmp", chemin)
+    return nom
+
+# ---------- EXPORT INCRÉMENTAL ----------
+
+def etat_base(vdb, numero):
+    """
+    Relève, avant toute lecture, l'horloge de la base et le dernier identifiant de chaque source
+    (identifiants de la base seulement : pas les fiches de contact des autres quartiers). Une
+    ligne créée ou modifiée pendant le passage est lue au suivant.
+    """
+    conn = vdb.connexion_quartier(numero)
+    fin = (numero + 1) << vdb.BITS_QUARTIER
+    return {"horodatage": conn.execute('SELECT CURRENT_TIMESTAMP').fetchone()[0],
+            "bornes": {source: conn.execute(f'SELECT MAX(id) FROM {source} WHERE id < ?', (fin,)).fetchone()[0]
+                       for sources in SOURCES.values() for source, _, _ in sources}}
+
+def exporter_table(vdb, table, dossier, manifeste, etats, lot, taille_lot):
+    # Écrit les lignes nouvelles et modifiées de la table ; retourne (nouvelles, modifiées, mois modifiés)
+    partitions = Partitions(dossier, table, lot)
+    nouvelles = modifiees = 0
+    mois_modifies = set()
+    try:
+        for numero, etat in enumerate(etats):
+            conn = vdb.connexion_quartier(numero)
+            precedent = manifeste["curseurs"][numero]
+            debut = numero << vdb.BITS_QUARTIER
+            apres = precedent["identifiants"][table] if precedent else debut
+            for source, colonnes, date_relecture in SOURCES[table]:
+                active = source == table
+                if active or precedent is None:
+                    # Lignes créées depuis le dernier passage (toute l'archive au premier passage)
+                    borne, dernier = etat["bornes"][source], apres if active else debut
+                    requete = f'SELECT {colonnes} FROM {source} WHERE id > ? AND id <= ? ORDER BY id LIMIT ?'
+                    while borne and dernier < borne and (
+                            lignes := conn.execute(requete, (dernier, borne, taille_lot)).fetchall()):
+                        partitions.ecrire(*en_table(table, lignes, lot))
+                        nouvelles += len(lignes)
+                        dernier = lignes[-1][0]
+                if precedent is not None:
+                    # Lignes modifiées ou archivées depuis : « +id » laisse l'index partiel de la date
+                    # choisir les lignes, la plage d'identifiants écarte les fiches et les nouvelles
+                    curseur = conn.execute(f'''SELECT {colonnes} FROM {source}
+                                               WHERE {date_relecture} >= ? AND +id > ? AND +id <= ?''',
+                                           (precedent["horodatage"], debut, apres))
+                    while lignes := curseur.fetchmany(taille_lot):
+                        mois_modifies |= partitions.ecrire(*en_table(table, lignes, lot))
+                        modifiees += len(lignes)
+    finally:
+        ecrits = partitions.fermer()
+    fichiers = manifeste["tables"][table]["fichiers"]
+    for mois in ecrits:
+        fichiers.setdefault(mois, []).append(partitions.nom)
+    return nouvelles, modifiees, mois_modifies
+
+def exporter(dossier=DOSSIER, complet=False, compacter_tout=False, fichiers_max=FICHIERS_MAX, taille_lot=TAILLE_LOT):
+    """
+    Met à jour les instantanés de toutes les tables et retourne, par table, le nombre de lignes
+    nouvelles, modifiées et de partitions compactées. Repart de zéro si demandé, au premier
+    passage, ou si le format ou le nombre de bases a changé (identifiants renumérotés).
+    """
+    import voisins_db as vdb
+    os.makedirs(dossier, exist_ok=True)
+    manifeste = lire_manifeste(dossier)
+    if (complet or manifeste is None or manifeste["version"] != VERSION
+            or manifeste["bases"] != len(vdb.CHEMINS_QUARTIERS)):
+        for table in COLONNES:
+            shutil.rmtree(os.path.join(dossier, table), ignore_errors=True)
+        manifeste = nouveau_manifeste(len(vdb.CHEMINS_QUARTIERS))
+    nettoyer(dossier, manifeste)
+    lot = manifeste["lot"] + 1
+    etats = vdb.sur_les_quartiers(lambda numero: etat_base(vdb, numero))
+
+    resultat, remplaces = {}, []
+    for table in COLONNES:
+        nouvelles, modifiees, mois_modifies = exporter_table(vdb, table, dossier, manifeste, etats, lot, taille_lot)
+        etat = manifeste["tables"][table]
+        modifies = set(etat["partitions_modifiees"]) | mois_modifies
+        compactees = 0
+        for mois, noms in etat["fichiers"].items():
+            if len(noms) > fichiers_max or (compacter_tout and (len(noms) > 1 or mois in modifies)):
+                etat["fichiers"][mois] = [compacter(dossier, table, mois, noms, lot)]
+                remplaces += [chemin_fichier(dossier, table, mois, nom) for nom in noms]
+                modifies.discard(mois)
+                compactees += 1
+        etat["partitions_modifiees"] = sorted(modifies)
+        resultat[table] = {"nouvelles": nouvelles, "modifiees": modifiees, "compactees": compactees}
+
+    for numero, etat in enumerate(etats):
+        precedent = manifeste["curseurs"][numero]
+        debut = numero << vdb.BITS_QUARTIER
+        manifeste["curseurs"][numero] = {
+            "horodatage": etat["horodatage"],
+            "identifiants": {table: max(precedent["identifiants"][table] if precedent else debut,
+                                        *(etat["bornes"][source] or debut for source, _, _ in SOURCES[table]))
+                             for table in COLONNES}}
+    manifeste["lot"] = lot
+    ecrire_manifeste(dossier, manifeste)
+    for chemin in remplaces:
+        os.remove(chemin)
+    return resultat
+
+# ---------- LECTURE ----------
+
+def expression(filtres):
+    return pq.filters_to_expression(filtres) if filtres else None
+
+def lire(table, colonnes=None, filtres=None, dossier=DOSSIER):
+    """
+    Lit un instantané en DataFrame pandas, sans toucher à la base : seules les colonnes demandées
+    (toutes par défaut) sont lues dans les fichiers, et un filtre sur « mois » (AAAA-MM, mois de
+    création) n'ouvre que les partitions concernées. filtres : liste de (colonne, opérateur,
+    valeur) combinés par ET, comme pour pandas.read_parquet. Chaque ligne apparaît une fois,
+    dans sa dernière version exportée.
+    """
+    manifeste = lire_manifeste(dossier)
+    if manifeste is None:
+        raise FileNotFoundError(f"Aucun instantané dans {dossier} : lancer python instantanes.py")
+    etat = manifeste["tables"][table]
+    colonnes = list(colonnes or [nom for nom, _ in COLONNES[table]])
+    filtres = list(filtres or [])
+    schema = SCHEMAS[table].append(pa.field("mois", pa.string()))
+    partitionnement = ds.partitioning(pa.schema([("mois", pa.string())]), flavor="hive")
+
+    def jeu(modifiees):
+        chemins = [chemin_fichier(dossier, table, mois, nom) for mois, noms in sorted(etat["fichiers"].items())
+                   if (mois in etat["partitions_modifiees"]) == modifiees for nom in noms]
+        return ds.dataset(chemins, schema=schema, format="parquet", partitioning=partitionnement,
+                          partition_base_dir=os.path.join(dossier, table))
+
+    # Partitions à une version par ligne : filtres appliqués pendant la lecture des fichiers
+    parties = [jeu(False).to_table(columns=colonnes, filter=expression(filtres))]
+    if etat["partitions_modifiees"]:
+        # Partitions avec des lignes réécrites : une ancienne version ne doit pas passer le filtre
+        # à la place de la dernière, seul le mois (immuable) est filtré avant le dédoublonnage
+        sur_mois = [filtre for filtre in filtres if filtre[0] == "mois"]
+        autres = [filtre for filtre in filtres if filtre[0] != "mois"]
+        lues = list(dict.fromkeys(colonnes + [filtre[0] for filtre in autres] + ["id", "lot"]))
+        donnees = dernieres_versions(jeu(True).to_table(columns=lues, filter=expression(sur_mois)))
+        if autres:
+            donnees = donnees.filter(expression(autres))
+        parties.append(donnees.select(colonnes))
+    return pa.concat_tables(parties).to_pandas()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base", help="fichier SQLite (défaut : VOISINS_DB ou voisins.db)")
+    parser.add_argument("--dossier", help="dossier des instantanés (défaut : VOISINS_INSTANTANES ou instantanes)")
+    parser.add_argument("--complet", action="store_true", help="supprimer les instantanés et tout réexporter")
+    parser.add_argument("--compacter", action="store_true",
+                        help="compacter toutes les partitions à plusieurs fichiers ou à lignes réécrites")
+    parser.add_argument("--fichiers-max", type=int, default=FICHIERS_MAX,
+                        help="fichiers par partition au-delà desquels elle est compactée")
+    parser.add_argument("--taille-lot", type=int, default=TAILLE_LOT, help="lignes lues par requête")
+    args = parser.parse_args()
+    if args.base:
+        os.environ["VOISINS_DB"] = args.base
+
+    import voisins_db as vdb
+    dossier = args.dossier or dossier_par_defaut(vdb.DB_PATH)
+    vdb.init_database(vdb.DB_PATH)
+    debut = time.perf_counter()
+    resultat = exporter(dossier, args.complet, args.compacter, args.fichiers_max, args.taille_lot)
+    for table, nombres in resultat.items():
+        print(f"{table} : {nombres['nouvelles']} nouvelle(s), {nombres['modifiees']} modifiée(s) ou archivée(s), "
+              f"{nombres['compactees']} partition(s) compactée(s)")
+    print(f"Instantanés à jour dans {dossier} en {time.perf_counter() - debut:.1f} s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+"""
+Recommandations « Pour vous »
+=============================
+Met à jour les suggestions affichées en tête de "Trouver un service" (table recommandations) :
+- par défaut, seuls les voisins qui ont envoyé une demande depuis le dernier passage sont
+  recalculés, avec le modèle enregistré par le dernier calcul complet ;
+- --complet reconstruit le modèle depuis tout l'historique des demandes (services candidats,
+  co-occurrence des catégories et des proposants, popularité) et recalcule tous les voisins.
+Le premier passage, et le premier après un découpage par quartier, est toujours complet.
+À lancer périodiquement (cron), application en marche : incrémental toutes les quelques
+minutes, complet une fois par nuit.
+
+Utilisation : python recommander.py [--base voisins.db] [--complet]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base", help="fichier SQLite (défaut : VOISINS_DB ou voisins.db)")
+    parser.add_argument("--complet", action="store_true", help="reconstruire le modèle et recalculer tous les voisins")
+    args = parser.parse_args()
+    if args.base:
+        os.environ["VOISINS_DB"] = args.base
+
+    import voisins_db as vdb
+    vdb.init_database(vdb.DB_PATH)
+    debut = time.perf_counter()
+    resultat = vdb.rafraichir_recommandations(args.complet)
+    print(f"{resultat['utilisateurs']} voisin(s) recalculé(s) "
+          f"({'calcul complet' if resultat['complet'] else 'incrémental'}) en {time.perf_counter() - debut:.1f} s")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,21 @@
+"""
+Configuration commune des tests : base temporaire répartie sur deux quartiers (75011, 75020),
+coût bcrypt réduit. voisins_db lit ces variables à l'import, elles sont donc posées avant.
+"""
+
+import os
+import tempfile
+
+import pytest
+
+_dossier = tempfile.mkdtemp(prefix="voisins_tests_")
+os.environ["VOISINS_DB"] = os.path.join(_dossier, "voisins.db")
+os.environ["VOISINS_QUARTIERS"] = "75011,75020"
+os.environ["VOISINS_BCRYPT_COUT"] = "4"
+
+import voisins_db  # noqa: E402
+
+@pytest.fixture(scope="session")
+def vdb():
+    voisins_db.init_database(voisins_db.DB_PATH)
+    return voisins_db
@@ -0,0 +1,38 @@
+import threading
+import time
+
+import pytest
+
+@pytest.fixture
+def ecrivain(vdb, monkeypatch):
+    monkeypatch.setattr(vdb, "ECRITURE_DELAI_S", 0.2)
+    return vdb.Ecrivain(vdb.DB_PATH, 10, 10)
+
+def test_ecriture_annulee_si_pas_commencee(ecrivain):
+    # Une écriture restée en file au-delà du délai est annulée : jamais exécutée, donc jamais validée
+    commencee, executees = threading.Event(), []
+    def lente(conn):
+        commencee.set()
+        time.sleep(0.6)
+    thread = threading.Thread(target=ecrivain.ecrire, args=(lente,))
+    thread.start()
+    commencee.wait()
+    with pytest.raises(TimeoutError):
+        ecrivain.ecrire(lambda conn: executees.append(1))
+    thread.join()
+    ecrivain.ecrire(lambda conn: None)
+    assert executees == [] and ecrivain.statistiques()['annulees'] == 1
+
+def test_ecriture_commencee_attendue(ecrivain):
+    # Déjà en cours à l'expiration du délai : l'appelant reçoit le résultat validé
+    def lente(conn):
+        time.sleep(0.4)
+        return 42
+    assert ecrivain.ecrire(lente) == 42
+
+def test_erreur_isolee(ecrivain):
+    def erreur(conn):
+        raise ValueError("refusée")
+    with pytest.raises(ValueError):
+        ecrivain.ecrire(erreur)
+    assert ecrivain.ecrire(lambda conn: conn.execute("SELECT 1").fetchone()[0]) == 1
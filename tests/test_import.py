@@ -0,0 +1,56 @@
+import json
+
+import import_export
+
+def test_import_services(vdb, tmp_path, monkeypatch):
+    monkeypatch.setattr(vdb, "CHEMINS_QUARTIERS", [vdb.DB_PATH])  # Import dans une base non répartie
+    vdb.creer_utilisateur("Import", "Eur", "import@exemple.fr", "secret1", "3 rue de Rivoli 75001 Paris", "")
+    proprietaire = vdb.verifier_connexion("import@exemple.fr", "secret1")[0]
+    service = {"titre": "Tondeuse importée", "categorie": vdb.CATEGORIES[0], "description": "Tondeuse",
+               "type_service": vdb.TYPES_SERVICE[0], "prix": 0, "utilisateur_id": proprietaire}
+    chemin = tmp_path / "services.jsonl"
+    chemin.write_text("\n".join([json.dumps(dict(service, id=900001)), "{pas du json", "", "[1, 2]",
+                                 json.dumps(dict(service, id=900001)), json.dumps(service)]) + "\n",
+                      encoding="utf-8")
+    conn = vdb.obtenir_connexion()
+    schema = conn.execute("PRAGMA schema_version").fetchone()[0]
+    avant = dict(conn.execute("SELECT categorie || type_service, disponibles FROM compteurs_services").fetchall())
+
+    # Lignes illisibles rejetées, identifiant déjà présent ignoré : le reste du lot est importé
+    assert import_export.importer("services", str(chemin), 100, 1, 4) == 1
+    assert conn.execute("SELECT COUNT(*) FROM services WHERE titre = 'Tondeuse importée'").fetchone()[0] == 2
+    # Triggers suspendus sans changer le schéma ; index plein texte et compteurs tenus à jour par lot
+    assert conn.execute("PRAGMA schema_version").fetchone()[0] == schema
+    assert conn.execute("SELECT COUNT(*) FROM parametres WHERE cle = 'import_services'").fetchone()[0] == 0
+    assert conn.execute("SELECT COUNT(*) FROM services_fts WHERE services_fts MATCH 'tondeuse'").fetchone()[0] == 2
+    cle = vdb.CATEGORIES[0] + vdb.TYPES_SERVICE[0]
+    assert conn.execute("SELECT disponibles FROM compteurs_services WHERE categorie || type_service = ?",
+                        (cle,)).fetchone()[0] == avant.get(cle, 0) + 2
+
+def test_import_refuse_dans_une_installation_repartie(vdb, tmp_path, capsys):
+    chemin = tmp_path / "utilisateurs.csv"
+    chemin.write_text("nom,prenom,email,mot_de_passe\nA,B,refuse@exemple.fr,secret1\n", encoding="utf-8")
+    assert import_export.importer("utilisateurs", str(chemin), 100, 1, 4) == 1
+    assert "decouper_quartiers.py" in capsys.readouterr().err
+    assert vdb.chercher_compte("SELECT id FROM utilisateurs WHERE email = ?", ("refuse@exemple.fr",)) is None
+
+def test_export_de_tous_les_quartiers_sans_fiches(vdb, tmp_path):
+    # Un compte par quartier, et une fiche recopiée (demandeur du 75020 chez un proposant du 75011)
+    adresses = ["3 rue de Rivoli 75001 Paris", "1 rue des Lilas 75011 Paris", "5 rue des Pyrénées 75020 Paris"]
+    for numero, adresse in enumerate(adresses):
+        vdb.creer_utilisateur("Export", "Eur", f"export{numero}@exemple.fr", "secret1", adresse, "")
+    proposant = vdb.verifier_connexion("export1@exemple.fr", "secret1")[0]
+    demandeur = vdb.verifier_connexion("export2@exemple.fr", "secret1")[0]
+    vdb.creer_service("Brouette", vdb.CATEGORIES[0], "Brouette", vdb.TYPES_SERVICE[0], 0.0, proposant)
+    service = vdb.connexion_quartier(1).execute(
+        "SELECT MAX(id) FROM services WHERE utilisateur_id = ?", (proposant,)).fetchone()[0]
+    assert vdb.creer_demande(service, demandeur, "2030-01-01", "Bonjour")[0]
+
+    chemin = tmp_path / "utilisateurs.jsonl"
+    assert import_export.exporter("utilisateurs", str(chemin), 2) == 0
+    lignes = [json.loads(ligne) for ligne in chemin.read_text(encoding="utf-8").splitlines()]
+    identifiants = [ligne["id"] for ligne in lignes]
+    assert identifiants == sorted(set(identifiants))  # Chaque compte une seule fois, triés par id
+    assert all(ligne["mot_de_passe_hash"] for ligne in lignes)
+    exportes = {ligne["email"]: ligne["id"] for ligne in lignes}
+    assert {vdb.quartier_de(exportes[f"export{numero}@exemple.fr"]) for numero in range(3)} == {0, 1, 2}
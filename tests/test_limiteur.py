@@ -0,0 +1,63 @@
+import pytest
+
+import voisins_db as vdb
+
+@pytest.fixture
+def horloge(monkeypatch):
+    # Horloge du limiteur avancée à la main
+    instant = [1000.0]
+    monkeypatch.setattr(vdb.time, "monotonic", lambda: instant[0])
+    return instant
+
+def test_blocage_apres_les_tentatives_autorisees(horloge):
+    limiteur = vdb.LimiteurTentatives(100)
+    capacite = vdb.TENTATIVES_EMAIL[0]
+    assert [limiteur.controler('connexion', 'a@x.fr', '1.1.1.1') for _ in range(capacite)] == [0.0] * capacite
+    assert limiteur.controler('connexion', 'A@x.fr ', '1.1.1.1') > 0
+    assert limiteur.statistiques()['refusees'] == {'connexion': 1}
+
+def test_penalite_doublee_a_chaque_refus_apres_le_blocage(horloge):
+    limiteur = vdb.LimiteurTentatives(100)
+    capacite, recharge = vdb.TENTATIVES_EMAIL
+    for _ in range(capacite):
+        limiteur.controler('connexion', 'a@x.fr', '1.1.1.1')
+    assert limiteur.controler('connexion', 'a@x.fr', '1.1.1.1') == recharge
+    # Les refus pendant le blocage ne l'allongent pas
+    for _ in range(50):
+        horloge[0] += 0.5
+        assert limiteur.controler('connexion', 'a@x.fr', '1.1.1.1') <= recharge
+    # Une tentative à la fin du blocage, puis un blocage deux fois plus long
+    horloge[0] = 1000.0 + recharge
+    assert limiteur.controler('connexion', 'a@x.fr', '1.1.1.1') == 0
+    assert limiteur.controler('connexion', 'a@x.fr', '1.1.1.1') == pytest.approx(2 * recharge)
+
+def test_un_client_ne_bloque_pas_le_compte(horloge):
+    # Un attaquant insiste sur un email depuis une adresse ; le titulaire, depuis une autre,
+    # finit par se connecter (une tentative toutes les 10 s pendant 300 s)
+    limiteur = vdb.LimiteurTentatives(100)
+    reussites = 0
+    for pas in range(600):
+        horloge[0] = 1000.0 + pas * 0.5
+        limiteur.controler('connexion', 'victime@x.fr', '6.6.6.6')
+        if pas % 20 == 10:
+            reussites += limiteur.controler('connexion', 'victime@x.fr', '1.2.3.4') == 0
+    assert reussites > 0
+
+def test_refus_non_decomptes_sur_l_email(horloge):
+    # Les tentatives refusées par les seaux du client n'entament pas le seau partagé de l'email
+    limiteur = vdb.LimiteurTentatives(100)
+    capacite = vdb.TENTATIVES_EMAIL[0]
+    for _ in range(capacite + 20):
+        limiteur.controler('connexion', 'c@x.fr', '6.6.6.6')
+    # Le jeton regagné au bout d'une recharge va au client suivant
+    horloge[0] += vdb.TENTATIVES_EMAIL[1]
+    assert limiteur.controler('connexion', 'c@x.fr', '1.2.3.4') == 0
+
+def test_liberer_apres_reussite(horloge):
+    limiteur = vdb.LimiteurTentatives(100)
+    for _ in range(vdb.TENTATIVES_EMAIL[0]):
+        limiteur.controler('connexion', 'b@x.fr', '1.1.1.1')
+    assert limiteur.controler('connexion', 'b@x.fr', '1.1.1.1') > 0
+    horloge[0] += vdb.PENALITE_MAX_S
+    limiteur.liberer('connexion', 'b@x.fr', '1.1.1.1')
+    assert limiteur.controler('connexion', 'b@x.fr', '1.1.1.1') == 0
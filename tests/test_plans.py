@@ -0,0 +1,11 @@
+import os
+import subprocess
+import sys
+
+RACINE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_aucun_parcours_complet():
+    # verifier_plans.py dans un processus séparé : il crée sa propre base temporaire à l'import
+    resultat = subprocess.run([sys.executable, os.path.join(RACINE, "verifier_plans.py")],
+                              cwd=RACINE, capture_output=True, text=True)
+    assert resultat.returncode == 0, resultat.stdout + resultat.stderr
@@ -0,0 +1,53 @@
+import threading
+
+ADRESSES = {0: "3 rue de Rivoli 75001 Paris", 1: "1 rue des Lilas 75011 Paris", 2: "5 rue des Pyrénées 75020 Paris"}
+
+def test_comptes_dans_la_plage_de_leur_quartier(vdb):
+    for numero, adresse in ADRESSES.items():
+        email = f"plage{numero}@exemple.fr"
+        assert vdb.creer_utilisateur("Nom", "Prénom", email, "secret1", adresse, "")[0]
+        user = vdb.verifier_connexion(email, "secret1")
+        assert user is not None and vdb.quartier_de(user[0]) == numero == vdb.quartier_adresse(adresse)
+
+def test_fiches_ne_decalent_pas_les_identifiants(vdb):
+    # Un demandeur du 75020 reçoit une fiche dans la base du 75011 (identifiant plus grand)
+    assert vdb.creer_utilisateur("Pro", "Posant", "proposant@exemple.fr", "secret1", ADRESSES[1], "")[0]
+    assert vdb.creer_utilisateur("De", "Mandeur", "demandeur@exemple.fr", "secret1", ADRESSES[2], "")[0]
+    proposant = vdb.verifier_connexion("proposant@exemple.fr", "secret1")[0]
+    demandeur = vdb.verifier_connexion("demandeur@exemple.fr", "secret1")[0]
+    assert vdb.creer_service("Échelle", vdb.CATEGORIES[0], "Échelle 3 m", vdb.TYPES_SERVICE[0], 0.0, proposant)[0]
+    service = vdb.connexion_quartier(1).execute(
+        "SELECT id FROM services WHERE utilisateur_id = ?", (proposant,)).fetchone()[0]
+    assert vdb.creer_demande(service, demandeur, "2030-01-01", "Bonjour")[0]
+    assert vdb.connexion_quartier(1).execute("SELECT 1 FROM utilisateurs WHERE id = ?", (demandeur,)).fetchone()
+    assert vdb.creer_utilisateur("Après", "Fiche", "apres@exemple.fr", "secret1", ADRESSES[1], "")[0]
+    assert vdb.quartier_de(vdb.verifier_connexion("apres@exemple.fr", "secret1")[0]) == 1
+
+def test_email_unique_entre_quartiers(vdb):
+    assert vdb.creer_utilisateur("A", "B", "unique@exemple.fr", "secret1", ADRESSES[1], "")[0]
+    assert vdb.creer_utilisateur("A", "B", "unique@exemple.fr", "secret1", ADRESSES[2], "") == \
+        (False, "Cet email est déjà utilisé.")
+
+def test_inscriptions_simultanees(vdb):
+    # Le même email inscrit en même temps dans les trois quartiers : une seule inscription réussit
+    resultats, depart = [], threading.Barrier(6)
+    def inscrire(numero):
+        depart.wait()
+        resultats.append(vdb.creer_utilisateur("A", "B", "course@exemple.fr", "secret1", ADRESSES[numero], ""))
+    threads = [threading.Thread(target=inscrire, args=(i % 3,)) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(reussie for reussie, _ in resultats) == 1
+    assert vdb.verifier_connexion("course@exemple.fr", "secret1") is not None
+
+def test_reservation_expiree_reprise(vdb):
+    # Inscription interrompue : la réservation bloque l'email jusqu'à son expiration
+    with vdb.obtenir_connexion() as conn:
+        conn.execute("INSERT INTO emails_comptes (email) VALUES ('encours@exemple.fr')")
+        conn.execute("""INSERT INTO emails_comptes (email, date_reservation)
+                        VALUES ('perdu@exemple.fr', datetime('now', '-1 day'))""")
+        conn.commit()
+    assert not vdb.creer_utilisateur("A", "B", "encours@exemple.fr", "secret1", ADRESSES[1], "")[0]
+    assert vdb.creer_utilisateur("A", "B", "perdu@exemple.fr", "secret1", ADRESSES[1], "")[0]
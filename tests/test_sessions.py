@@ -0,0 +1,37 @@
+import pytest
+
+@pytest.fixture(scope="module")
+def compte(vdb):
+    vdb.creer_utilisateur("Martin", "Jean", "session@exemple.fr", "secret1", "1 rue des Lilas 75011 Paris", "0601020304")
+    return vdb.verifier_connexion("session@exemple.fr", "secret1")
+
+def test_jeton_valide(vdb, compte):
+    jeton = vdb.ouvrir_session(compte[0])
+    assert vdb.restaurer_session(jeton)[0] == compte[0]
+
+@pytest.mark.parametrize("jeton", [None, 42, "", "sans-point", "é" * 10 + "." + "0" * 64,
+                                   "abc." + "0" * 64, "abc." + "Z" * 64, "abc." + "0" * 64 + "\n"])
+def test_jeton_mal_forme_rejete(vdb, compte, jeton):
+    assert vdb.restaurer_session(jeton) is None
+    vdb.fermer_session(jeton)  # Sans effet ni exception
+
+def test_signature_modifiee_rejetee(vdb, compte):
+    jeton = vdb.ouvrir_session(compte[0])
+    aleatoire, _, signature = jeton.partition(".")
+    autre = "0" if signature[0] != "0" else "1"
+    assert vdb.restaurer_session(f"{aleatoire}.{autre}{signature[1:]}") is None
+
+def test_deconnexion(vdb, compte):
+    jeton = vdb.ouvrir_session(compte[0])
+    assert vdb.restaurer_session(jeton) is not None
+    vdb.fermer_session(jeton)
+    assert vdb.restaurer_session(jeton) is None
+
+def test_reinitialisation_revoque_les_sessions(vdb, compte):
+    # Nouveau mot de passe : les anciens jetons sont révoqués, une nouvelle session est ouverte à la connexion
+    ancien = vdb.ouvrir_session(compte[0])
+    assert vdb.reinitialiser_mot_de_passe("session@exemple.fr", "0601020304", "secret2")[0]
+    assert vdb.restaurer_session(ancien) is None
+    user = vdb.verifier_connexion("session@exemple.fr", "secret2")
+    nouveau = vdb.ouvrir_session(user[0])
+    assert nouveau != ancien and vdb.restaurer_session(nouveau)[0] == compte[0]
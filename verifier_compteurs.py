@@ -0,0 +1,37 @@
+"""
+Vérification des compteurs maintenus par triggers
+=================================================
+Recompte les demandes en attente par proposant et les services disponibles par
+catégorie et type, puis compare avec les tables compteurs_demandes et
+compteurs_services. Code de sortie 1 si un écart est trouvé (et non réparé).
+
+Utilisation : python verifier_compteurs.py [--base voisins.db] [--reparer]
+"""
+
+import argparse
+import os
+import sys
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--base", help="fichier SQLite à vérifier (défaut : VOISINS_DB ou voisins.db)")
+    parser.add_argument("--reparer", action="store_true", help="reconstruire les compteurs en cas d'écart")
+    args = parser.parse_args()
+    if args.base:
+        os.environ["VOISINS_DB"] = args.base
+
+    import voisins_db as vdb
+    vdb.init_database(vdb.DB_PATH)
+    ecarts = vdb.verifier_compteurs(reparer=args.reparer)
+    for table, cle, stocke, attendu in ecarts:
+        print(f"{table} {cle} : {stocke} au lieu de {attendu}")
+    if not ecarts:
+        print("Compteurs cohérents")
+        return 0
+    if args.reparer:
+        print(f"{len(ecarts)} écart(s) corrigé(s) : compteurs reconstruits")
+        return 0
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+"""
+Vérification des plans d'exécution des requêtes de voisins_db.py
+=================================================================
+Exécute toutes les fonctions d'accès aux données sur une base temporaire,
+capture chaque requête SQL émise (trace sqlite3) puis lance EXPLAIN QUERY PLAN
+sur chacune. Le script échoue (code de sortie 1) si une requête parcourt
+entièrement (SCAN) la table services ou demandes au lieu d'utiliser un index.
+Le parcours ordonné d'un index (SCAN ... USING INDEX), par exemple la liste
+de tous les services disponibles triés par date, reste autorisé.
+
+Utilisation : python verifier_plans.py
+"""
+
+import os
+import re
+import sys
+import tempfile
+import threading
+
+# Base temporaire : le module lit VOISINS_DB à l'import
+_dossier = tempfile.mkdtemp(prefix="voisins_plans_")
+os.environ["VOISINS_DB"] = os.path.join(_dossier, "voisins.db")
+
+import voisins_db as vdb  # noqa: E402
+import instantanes  # noqa: E402
+
+# Tables qui ne doivent jamais être parcourues entièrement
+TABLES_SURVEILLEES = {"services", "demandes", "evenements", "services_archive", "demandes_archive", "sessions"}
+
+def executer_fonctions():
+    # Appelle chaque fonction d'accès aux données avec toutes les combinaisons de filtres
+    vdb.creer_utilisateur("Martin", "Jean", "jean@exemple.fr", "secret", "1 rue des Lilas 75011 Paris", "0601020304")
+    vdb.creer_utilisateur("Durand", "Zoé", "zoe@exemple.fr", "secret", "2 rue des Lilas 75011 Paris", "0605060708")
+    vdb.verifier_connexion("jean@exemple.fr", "secret")
+    vdb.reinitialiser_mot_de_passe("zoe@exemple.fr", "0605060708", "secret")
+    vdb.creer_service("Perceuse", vdb.CATEGORIES[1], "Perceuse à percussion", vdb.TYPES_SERVICE[0], 0.0, 1)
+    for categorie in [None, vdb.CATEGORIES[1]]:
+        for type_service in [None, vdb.TYPES_SERVICE[0]]:
+            vdb.obtenir_services(categorie, type_service)
+            vdb.obtenir_services(categorie, type_service, apres=("2030-01-01 00:00:00", 10), limite=20)
+            vdb.rechercher_services("perceuse", categorie, type_service, limite=20, decalage=20)
+            vdb.obtenir_services(categorie, type_service, limite=20, centre=(48.8591, 2.3800), rayon_km=2)
+            vdb.rechercher_services("perceuse", categorie, type_service, limite=20,
+                                    centre=(48.8591, 2.3800), rayon_km=2)
+    vdb.creer_demande(1, 2, "2030-01-01", "Bonjour")
+    # Calcul complet des recommandations (parcourt volontairement tout l'historique) dans un autre
+    # thread, dont la connexion n'est pas tracée ; le passage incrémental et l'affichage sont vérifiés
+    calcul_complet = threading.Thread(target=vdb.rafraichir_recommandations, args=(True,))
+    calcul_complet.start()
+    calcul_complet.join()
+    vdb.creer_demande(1, 2, "2030-01-02", "Bonjour à nouveau")
+    vdb.rafraichir_recommandations()
+    vdb.obtenir_recommandations(2)
+    vdb.obtenir_mes_services(1)
+    vdb.obtenir_demandes_recues(1)
+    vdb.obtenir_mes_demandes_initiees(2)
+    vdb.compter_demandes_en_attente(1)
+    vdb.compter_services_disponibles()
+    vdb.position_utilisateur(1)
+    vdb.mettre_a_jour_disponibilite_service(1, 0)
+    vdb.mettre_a_jour_statut_demande(1, "acceptee")
+    vdb.dernier_evenement()
+    vdb.evenements_depuis(2, (0,) * len(vdb.CHEMINS_QUARTIERS))
+    vdb.obtenir_demandes_recues(1, ids=[1])
+    vdb.obtenir_mes_demandes_initiees(2, ids=[1])
+    vdb.mettre_a_jour_utilisateur(1, "Martin", "Jean", "jean@exemple.fr", "1 rue des Lilas 75011 Paris", "0601020304")
+    vdb.archiver()
+    # Premier instantané (toutes les lignes, par plages d'identifiants) puis passage incrémental
+    instantanes.exporter(os.path.join(_dossier, "instantanes"))
+    vdb.mettre_a_jour_statut_demande(1, "refusee")
+    instantanes.exporter(os.path.join(_dossier, "instantanes"))
+    jeton = vdb.ouvrir_session(1)
+    vdb.restaurer_session(jeton)
+    vdb.fermer_session(jeton)
+    vdb.purger_sessions()
+    vdb.obtenir_services_archives(1, 20)
+    vdb.obtenir_demandes_archivees(1, True, 20)
+    vdb.obtenir_demandes_archivees(2, False, 20, 20)
+
+def alias_tables(requete):
+    # Associe chaque alias (ou nom) utilisé dans la requête à sa table surveillée
+    alias = {}
+    for table, nom in re.findall(r"\b(\w+)\s+(?:AS\s+)?(\w+)", requete, flags=re.IGNORECASE):
+        if table.lower() in TABLES_SURVEILLEES:
+            alias[nom.lower()] = table.lower()
+    for table in TABLES_SURVEILLEES:
+        alias[table] = table
+    return alias
+
+def scans_interdits(conn, requete):
+    # Retourne les lignes du plan qui parcourent entièrement une table surveillée
+    alias = alias_tables(requete)
+    lignes = conn.execute("EXPLAIN QUERY PLAN " + requete).fetchall()
+    interdits = []
+    for ligne in lignes:
+        detail = ligne[3]
+        trouve = re.match(r"SCAN (?:TABLE )?(\w+)(?: AS (\w+))?", detail)
+        if not trouve or re.search(r"USING (?:COVERING )?INDEX", detail):
+            continue
+        if alias.get((trouve.group(2) or trouve.group(1)).lower()) in TABLES_SURVEILLEES:
+            interdits.append(detail)
+    return interdits
+
+def main():
+    vdb.init_database(vdb.DB_PATH)
+    conn = vdb.obtenir_connexion()
+    requetes = []
+    conn.set_trace_callback(requetes.append)
+    # Les écritures passent par le thread de l'écrivain unique : tracer aussi sa connexion
+    vdb.ecrire(lambda connexion: connexion.set_trace_callback(requetes.append))
+    executer_fonctions()
+    vdb.ecrire(lambda connexion: connexion.set_trace_callback(None))
+    conn.set_trace_callback(None)
+
+    a_verifier = []
+    for requete in requetes:
+        mot_cle = requete.lstrip().split(None, 1)[0].upper()
+        if mot_cle in ("SELECT", "UPDATE", "DELETE", "WITH") and requete not in a_verifier:
+            a_verifier.append(requete)
+
+    echecs = 0
+    for requete in a_verifier:
+        interdits = scans_interdits(conn, requete)
+        statut = "ÉCHEC" if interdits else "OK"
+        print(f"[{statut}] {' '.join(requete.split())}")
+        for detail in interdits:
+            print(f"        -> {detail}")
+        echecs += bool(interdits)
+
+    print(f"\n{len(a_verifier)} requête(s) vérifiée(s), {echecs} en échec")
+    return 1 if echecs else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2663 @@
+"""
+Couche de données de Voisins Solidaires
+=======================================
+Accès à la base SQLite sans dépendance à Streamlit : l'interface (voisins_sol.py),
+les outils en ligne de commande et les traitements par lots partagent ces fonctions.
+Les erreurs ne sont jamais affichées ici : les écritures retournent (succès, message)
+ou un booléen, les lectures retournent des enregistrements Service / Demande.
+
+Deux API :
+- synchrone : creer_service(...), obtenir_services(...), etc. ;
+- asynchrone : les mêmes fonctions suffixées par _async (await creer_demande_async(...)),
+  exécutées sur un pool de threads borné qui partage les connexions du pool.
+"""
+
+import asyncio
+import csv
+import functools
+import hashlib
+import hmac
+import io
+import itertools
+import json
+import math
+import sqlite3
+import os
+import queue
+import re
+import secrets
+import sys
+import logging
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, asdict
+
+# bcrypt, pandas et numpy sont importés au premier usage (connexion, inscription, export, recommandations) :
+# les pages qui n'en ont pas besoin ne paient pas leur chargement au démarrage.
+
+# ---------- RESSOURCES PARTAGÉES PAR LE PROCESSUS ----------
+
+def ressource(fonction):
+    """
+    Équivalent de st.cache_resource sans Streamlit : un seul résultat par processus et
+    par jeu d'arguments, créé sous verrou (les appels concurrents attendent le premier).
+    Le module étant importé une fois, les ressources survivent aux reruns de l'interface.
+    """
+    resultats = {}
+    verrou = threading.Lock()
+
+    @functools.wraps(fonction)
+    def enveloppe(*args):
+        try:
+            return resultats[args]
+        except KeyError:
+            pass
+        with verrou:
+            if args not in resultats:
+                resultats[args] = fonction(*args)
+            return resultats[args]
+    enveloppe.vider = resultats.clear
+    return enveloppe
+
+# ---------- CONNEXIONS SQLITE ----------
+
+# Chemin du fichier SQLite, configurable par variable d'environnement
+DB_PATH = os.environ.get("VOISINS_DB", "voisins.db")
+# Temps d'attente (en ms) sur un verrou avant de lever "database is locked"
+DB_BUSY_TIMEOUT_MS = int(os.environ.get("VOISINS_DB_BUSY_TIMEOUT_MS", "5000"))
+# Niveau de synchronisation : NORMAL est sûr en mode WAL et évite un fsync par commit
+DB_SYNCHRONOUS = os.environ.get("VOISINS_DB_SYNCHRONOUS", "NORMAL")
+
+class PoolConnexions:
+    """
+    Pool de connexions SQLite partagé par tout le processus.
+    Chaque thread (script Streamlit, travailleur de l'API asynchrone) emprunte une connexion déjà ouverte et configurée
+    (journal WAL, busy_timeout, synchronous) ; quand le thread se termine, sa connexion
+    est remise dans le pool pour le rerun suivant au lieu d'être fermée.
+    """
+
+    def __init__(self, chemin, busy_timeout_ms=DB_BUSY_TIMEOUT_MS, synchronous=DB_SYNCHRONOUS, max_inactives=32):
+        self.chemin = chemin
+        self.busy_timeout_ms = busy_timeout_ms
+        self.synchronous = synchronous
+        self.max_inactives = max_inactives
+        self._local = threading.local()
+        self._verrou = threading.Lock()
+        self._empruntees = {}  # ident du thread -> (thread, connexion)
+        self._inactives = []   # connexions libres, prêtes à être réutilisées
+
+    def _ouvrir(self):
+        # check_same_thread=False : une connexion n'est utilisée que par un thread à la fois,
+        # mais elle peut passer d'un thread de script terminé au suivant
+        conn = sqlite3.connect(self.chemin, timeout=self.busy_timeout_ms / 1000, check_same_thread=False,
+                               factory=ConnexionInstrumentee)
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute(f'PRAGMA synchronous = {self.synchronous}')
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        conn.create_function('distance_km', 4, distance_km, deterministic=True)
+        return conn
+
+    def connexion(self):
+        # Retourne la connexion du thread courant (empruntée au pool au premier appel)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            with self._verrou:
+                self._recycler()
+                conn = self._inactives.pop() if self._inactives else None
+            if conn is None:
+                conn = self._ouvrir()
+            self._local.conn = conn
+            with self._verrou:
+                self._empruntees[threading.get_ident()] = (threading.current_thread(), conn)
+        return conn
+
+    def _recycler(self):
+        # Récupère les connexions des threads terminés (appelé sous verrou)
+        for ident, (thread, conn) in list(self._empruntees.items()):
+            if not thread.is_alive():
+                del self._empruntees[ident]
+                if conn.in_transaction:
+                    conn.rollback()
+                if len(self._inactives) < self.max_inactives:
+                    self._inactives.append(conn)
+                else:
+                    conn.close()
+
+    def fermer(self):
+        # Ferme toutes les connexions du pool (arrêt du processus, outils en ligne de commande)
+        with self._verrou:
+            for _, conn in self._empruntees.values():
+                conn.close()
+            for conn in self._inactives:
+                conn.close()
+            self._empruntees.clear()
+            self._inactives.clear()
+        self._local = threading.local()
+
+@ressource
+def obtenir_pool(chemin=DB_PATH):
+    # Ressource mise en cache : un seul pool par processus et par fichier de base
+    return PoolConnexions(chemin)
+
+def obtenir_connexion():
+    """
+    Retourne la connexion SQLite du thread courant.
+    À utiliser avec 'with obtenir_connexion() as conn:' : le bloc valide (commit) ou annule
+    (rollback) la transaction mais ne ferme pas la connexion, qui reste dans le pool.
+    """
+    return obtenir_pool(DB_PATH).connexion()
+
+# ---------- RÉPARTITION PAR QUARTIER ----------
+
+# Quartiers qui ont leur propre fichier SQLite : codes postaux séparés par des virgules ("75011,75020").
+# Un utilisateur est stocké dans la base du code postal de son adresse, avec ses services, les demandes
+# qu'il reçoit et leurs évènements ; les autres adresses restent dans la base principale DB_PATH,
+# qui garde aussi les données globales (sessions, secret des jetons).
+QUARTIERS = [quartier.strip() for quartier in os.environ.get("VOISINS_QUARTIERS", "").split(",") if quartier.strip()]
+# Base n°0 : DB_PATH ; base n°k : voisins_<k-ième quartier>.db, à côté de la base principale
+_racine, _extension = os.path.splitext(DB_PATH)
+CHEMINS_QUARTIERS = [DB_PATH] + [f"{_racine}_{quartier}{_extension or '.db'}" for quartier in QUARTIERS]
+# Les identifiants (utilisateurs, services, demandes, évènements) de la base n°k commencent à k << 40 :
+# un identifiant suffit à retrouver sa base. La base principale garde les identifiants 1, 2, 3...
+BITS_QUARTIER = 40
+TABLES_IDENTIFIANTS = ('utilisateurs', 'services', 'demandes', 'evenements')
+# Threads qui interrogent les bases en parallèle (requêtes sur tous les quartiers)
+QUARTIERS_TRAVAILLEURS = int(os.environ.get("VOISINS_QUARTIERS_TRAVAILLEURS", str(4 * len(CHEMINS_QUARTIERS))))
+
+def quartier_adresse(adresse):
+    # Numéro de la base d'une adresse : rang de son code postal dans QUARTIERS, 0 (base principale) sinon
+    for code in reversed(re.findall(r'(?<!\d)\d{5}(?!\d)', adresse or '')):
+        if code in QUARTIERS:
+            return QUARTIERS.index(code) + 1
+    return 0
+
+def quartier_de(identifiant):
+    # Numéro de la base qui stocke un utilisateur, un service, une demande ou un évènement
+    return int(identifiant) >> BITS_QUARTIER
+
+def connexion_quartier(numero):
+    # Connexion du thread courant à la base n°numero (même usage que obtenir_connexion)
+    return obtenir_pool(CHEMINS_QUARTIERS[numero]).connexion()
+
+def connexion_de(identifiant):
+    # Connexion à la base qui stocke cet identifiant
+    return connexion_quartier(quartier_de(identifiant))
+
+def reserver_identifiants(conn, numero):
+    # Fait commencer les séquences AUTOINCREMENT de la base n°numero à numero << BITS_QUARTIER,
+    # et ramène dans sa plage une séquence des utilisateurs avancée par une fiche d'un autre quartier
+    debut, fin = numero << BITS_QUARTIER, (numero + 1) << BITS_QUARTIER
+    for table in TABLES_IDENTIFIANTS:
+        if not conn.execute('UPDATE sqlite_sequence SET seq = MAX(seq, ?) WHERE name = ?', (debut, table)).rowcount:
+            conn.execute('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table, debut))
+    conn.execute('''UPDATE sqlite_sequence
+                    SET seq = (SELECT COALESCE(MAX(id), ?) FROM utilisateurs WHERE id >= ? AND id < ?)
+                    WHERE name = 'utilisateurs' AND seq >= ?''', (debut, debut, fin, fin))
+    conn.commit()
+
+def prochain_utilisateur(numero):
+    # Expression SQL de l'identifiant du prochain compte de la base n°numero. AUTOINCREMENT prendrait
+    # MAX(rowid) + 1 : une fiche d'un quartier suivant, d'identifiant plus grand, ferait sortir le compte de sa plage
+    debut, fin = numero << BITS_QUARTIER, (numero + 1) << BITS_QUARTIER
+    return f'''(SELECT MAX(COALESCE(MAX(id), {debut}),
+                           COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'utilisateurs' AND seq < {fin}), {debut})) + 1
+                FROM utilisateurs WHERE id >= {debut} AND id < {fin})'''
+
+@ressource
+def executeur_quartiers():
+    # Pool de threads des lectures réparties : chaque travailleur garde une connexion par base
+    return ThreadPoolExecutor(max_workers=QUARTIERS_TRAVAILLEURS, thread_name_prefix="voisins_quartier")
+
+def sur_les_quartiers(lecture, numeros=None):
+    """
+    Exécute lecture(numero) pour chaque base (toutes par défaut) et retourne les résultats
+    dans l'ordre de numeros. Les bases sont interrogées en parallèle, la première dans le
+    thread appelant ; avec une seule base, l'appel est direct. Le temps SQL des travailleurs
+    reste attribué à la fonction appelante.
+    """
+    numeros = list(range(len(CHEMINS_QUARTIERS)) if numeros is None else numeros)
+    nom = fonction_appelante()
+
+    def attribuee(numero):
+        precedent, _attribution.nom = getattr(_attribution, 'nom', None), nom
+        try:
+            return lecture(numero)
+        finally:
+            _attribution.nom = precedent
+
+    futures = [executeur_quartiers().submit(attribuee, numero) for numero in numeros[1:]]
+    return [attribuee(numero) for numero in numeros[:1]] + [future.result() for future in futures]
+
+def fusionner(pages, ordre, limite=None, decalage=0):
+    """
+    Fusionne les lignes lues dans chaque base en une liste triée selon ordre : liste de
+    (clé, décroissant) du critère principal au dernier départage, comme un ORDER BY.
+    decalage et limite s'appliquent après la fusion (voir bornes_quartier). Avec une
+    seule base, la page est retournée telle quelle (déjà triée et bornée en SQL).
+    """
+    if len(pages) == 1:
+        return pages[0]
+    lignes = [ligne for page in pages for ligne in page]
+    for cle, decroissant in reversed(ordre):
+        lignes.sort(key=cle, reverse=decroissant)  # tris stables : du dernier critère au premier
+    return lignes[decalage:None if limite is None else decalage + limite]
+
+def bornes_quartier(limite, decalage):
+    # (LIMIT, OFFSET) à demander à chaque base : avec plusieurs bases, chacune fournit ses
+    # limite + decalage premières lignes et le décalage ne s'applique qu'après la fusion
+    if len(CHEMINS_QUARTIERS) == 1:
+        return limite, decalage
+    return (None if limite is None else limite + decalage), 0
+
+# Fiche de contact d'un utilisateur recopiée dans les autres bases
+COLONNES_FICHE = 'id, nom, prenom, email, adresse, telephone, date_inscription'
+
+def copier_fiches(conn, fiches):
+    """
+    Recopie (ou met à jour) dans cette base les fiches (COLONNES_FICHE) d'utilisateurs d'autres
+    quartiers qui y envoient des demandes : les jointures sur utilisateurs restent locales.
+    Sans mot de passe ni position, une fiche ne permet pas de se connecter et n'apparaît pas
+    dans la recherche par proximité.
+    """
+    # L'identifiant explicite d'une fiche (plage d'un autre quartier) ferait avancer la séquence
+    # AUTOINCREMENT de cette base : le compte inscrit ensuite serait attribué au mauvais quartier
+    sequence = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'utilisateurs'").fetchone()
+    conn.executemany(f'''INSERT INTO utilisateurs ({COLONNES_FICHE}, mot_de_passe) VALUES (?, ?, ?, ?, ?, ?, ?, '')
+                         ON CONFLICT (id) DO UPDATE SET nom = excluded.nom, prenom = excluded.prenom,
+                             adresse = excluded.adresse, telephone = excluded.telephone''', fiches)
+    if sequence:
+        conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'utilisateurs'", sequence)
+
+# ---------- INSTRUMENTATION DES REQUÊTES ET DES PAGES ----------
+
+# Au-delà de ce seuil (en ms), une requête est journalisée avec la forme de ses paramètres et son plan
+SEUIL_REQUETE_LENTE_MS = float(os.environ.get("VOISINS_SEUIL_REQUETE_LENTE_MS", "100"))
+
+journal_sql = logging.getLogger("voisins_db.sql")
+
+def percentiles(valeurs, rangs=(50, 95, 99)):
+    # Percentiles d'une liste de durées ({'p50': ..., 'p95': ..., 'p99': ...}), None si elle est vide
+    valeurs = sorted(valeurs)
+    return {f'p{p}': valeurs[min(len(valeurs) - 1, len(valeurs) * p // 100)] if valeurs else None
+            for p in rangs}
+
+class Chronometres:
+    # Durées (en ms) des dernières exécutions, regroupées par nom (fonction appelante ou page)
+    def __init__(self, historique=1000):
+        self.historique = historique
+        self._durees = {}
+        self._nombres = {}
+        self._verrou = threading.Lock()
+
+    def enregistrer(self, nom, duree_ms):
+        with self._verrou:
+            if nom not in self._durees:
+                self._durees[nom] = deque(maxlen=self.historique)
+                self._nombres[nom] = 0
+            self._durees[nom].append(duree_ms)
+            self._nombres[nom] += 1
+
+    def statistiques(self):
+        with self._verrou:
+            copie = {nom: list(durees) for nom, durees in self._durees.items()}
+            nombres = dict(self._nombres)
+        return {nom: {'nombre': nombres[nom], **percentiles(durees)} for nom, durees in sorted(copie.items())}
+
+@ressource
+def metriques_sql():
+    return Chronometres()
+
+@ressource
+def requetes_lentes():
+    # Dernières requêtes lentes (les plus récentes à la fin), pour la page d'administration
+    return deque(maxlen=100)
+
+# Fonctions intermédiaires ignorées pour attribuer une requête à la fonction qui l'a demandée
+_INTERMEDIAIRES = frozenset({'fonction_appelante', 'execute', 'executemany', 'fetchone', 'fetchall', 'fetchmany',
+                             '_publier', 'lire_lignes', '<lambda>', 'obtenir', 'ecrire', 'sur_les_quartiers',
+                             'chercher_compte'})
+
+# Fonction de données pour le compte de laquelle l'écrivain unique exécute une écriture
+_attribution = threading.local()
+
+def fonction_appelante():
+    nom = getattr(_attribution, 'nom', None)
+    if nom:
+        return nom
+    cadre = sys._getframe(1)
+    while cadre is not None and cadre.f_code.co_name in _INTERMEDIAIRES:
+        cadre = cadre.f_back
+    return cadre.f_code.co_name if cadre is not None else '?'
+
+def forme_parametres(parametres):
+    # Types des paramètres sans leurs valeurs (pas de données personnelles dans le journal)
+    if isinstance(parametres, dict):
+        return {cle: type(valeur).__name__ for cle, valeur in parametres.items()}
+    return [type(valeur).__name__ for valeur in parametres]
+
+class CurseurInstrumente(sqlite3.Cursor):
+    """
+    Curseur qui chronomètre chaque requête (exécution et lecture des lignes) et l'attribue
+    à la fonction appelante. La mesure est publiée après le fetch, ou dès l'exécution
+    pour les requêtes sans résultat (INSERT, UPDATE...). Un curseur parcouru directement
+    (for ligne in conn.execute(...)) cumule la lecture de chaque ligne et publie la mesure
+    une fois épuisé, fermé ou réutilisé.
+    """
+    _mesure = None
+
+    def execute(self, sql, parametres=()):
+        self._publier()
+        debut = time.perf_counter()
+        try:
+            return super().execute(sql, parametres)
+        finally:
+            self._mesure = [sql, parametres, time.perf_counter() - debut, fonction_appelante()]
+            if self.description is None:
+                self._publier()
+
+    def executemany(self, sql, sequence):
+        self._publier()
+        debut = time.perf_counter()
+        try:
+            return super().executemany(sql, sequence)
+        finally:
+            self._mesure = [sql, (), time.perf_counter() - debut, fonction_appelante()]
+            self._publier()
+
+    def _chronometrer_lecture(self, lecture, *args):
+        debut = time.perf_counter()
+        try:
+            return lecture(*args)
+        finally:
+            if self._mesure is not None:
+                self._mesure[2] += time.perf_counter() - debut
+                self._publier()
+
+    def fetchone(self):
+        return self._chronometrer_lecture(super().fetchone)
+
+    def fetchall(self):
+        return self._chronometrer_lecture(super().fetchall)
+
+    def fetchmany(self, *args):
+        return self._chronometrer_lecture(super().fetchmany, *args)
+
+    def __next__(self):
+        debut, epuise = time.perf_counter(), False
+        try:
+            return super().__next__()
+        except StopIteration:
+            epuise = True
+            raise
+        finally:
+            if self._mesure is not None:
+                self._mesure[2] += time.perf_counter() - debut
+                if epuise:
+                    self._publier()
+
+    def close(self):
+        self._publier()
+        super().close()
+
+    def _publier(self):
+        if self._mesure is None:
+            return
+        sql, parametres, duree, fonction = self._mesure
+        self._mesure = None
+        duree_ms = duree * 1000
+        metriques_sql().enregistrer(fonction, duree_ms)
+        if duree_ms >= SEUIL_REQUETE_LENTE_MS:
+            signaler_requete_lente(self.connection, fonction, sql, parametres, duree_ms)
+
+class ConnexionInstrumentee(sqlite3.Connection):
+    # Connexion dont tous les curseurs (y compris ceux de conn.execute) sont instrumentés
+    def cursor(self, factory=CurseurInstrumente):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametres=()):
+        return self.cursor().execute(sql, parametres)
+
+    def executemany(self, sql, sequence):
+        return self.cursor().executemany(sql, sequence)
+
+def signaler_requete_lente(conn, fonction, sql, parametres, duree_ms):
+    plan = []
+    if sql.lstrip().upper().startswith(('SELECT', 'WITH')):
+        try:
+            # Curseur brut : le plan ne doit pas lui-même être mesuré
+            plan = [ligne[3] for ligne in sqlite3.Cursor(conn).execute('EXPLAIN QUERY PLAN ' + sql, parametres)]
+        except sqlite3.Error:
+            pass
+    entree = {'fonction': fonction, 'duree_ms': round(duree_ms, 2), 'requete': ' '.join(sql.split()),
+              'parametres': forme_parametres(parametres), 'plan': plan, 'date': time.strftime('%Y-%m-%d %H:%M:%S')}
+    requetes_lentes().append(entree)
+    journal_sql.warning("Requête lente (%.1f ms) dans %s : %s | paramètres %s | plan %s",
+                        duree_ms, fonction, entree['requete'], entree['parametres'], plan)
+
+# ---------- ÉCRIVAIN UNIQUE (GROUP COMMIT) ----------
+
+# Taille maximale de la file d'écriture, nombre maximal d'écritures par transaction,
+# attente maximale (en secondes) d'une place dans la file pleine, puis de la validation
+ECRITURE_FILE_MAX = int(os.environ.get("VOISINS_ECRITURE_FILE", "1000"))
+ECRITURE_LOT_MAX = int(os.environ.get("VOISINS_ECRITURE_LOT", "256"))
+ECRITURE_ATTENTE_S = float(os.environ.get("VOISINS_ECRITURE_ATTENTE_S", "5"))
+ECRITURE_DELAI_S = float(os.environ.get("VOISINS_ECRITURE_DELAI_S", "30"))
+
+class FileEcritureSaturee(Exception):
+    # La file d'écriture est restée pleine plus de ECRITURE_ATTENTE_S secondes
+    pass
+
+class Ecrivain:
+    """
+    Thread unique qui exécute les écritures d'une base pour tout le processus. Il prend toutes les
+    écritures en attente (au plus lot_max) et les exécute dans une seule transaction
+    BEGIN IMMEDIATE, un SAVEPOINT par écriture : l'échec de l'une n'annule pas les
+    autres. Un seul COMMIT (et une seule synchronisation disque) par lot, aucune
+    concurrence pour le verrou d'écriture entre les sessions du processus.
+    La file est bornée : quand elle est pleine, les appelants attendent (contre-pression).
+    """
+
+    def __init__(self, chemin, taille_max, lot_max):
+        self.chemin = chemin
+        self.lot_max = lot_max
+        self._file = queue.Queue(maxsize=taille_max)
+        self._verrou = threading.Lock()
+        self._tailles = deque(maxlen=1000)  # taille des derniers lots
+        self.lots = 0
+        self.ecritures = 0
+        self.echouees = 0
+        self.saturations = 0
+        self.annulees = 0
+        self._thread = threading.Thread(target=self._boucle, name="voisins_ecrivain", daemon=True)
+        self._thread.start()
+
+    def ecrire(self, operation):
+        """
+        Exécute operation(conn) dans le prochain lot et attend sa validation (COMMIT).
+        Retourne le résultat de l'opération ou lève son exception ; lève
+        FileEcritureSaturee si la file est restée pleine trop longtemps, TimeoutError
+        si l'opération n'a pas commencé dans les ECRITURE_DELAI_S secondes : elle est
+        alors annulée et ne sera jamais exécutée. Une opération déjà commencée est
+        attendue jusqu'au bout : l'appelant ne signale jamais comme échouée une
+        écriture validée (et invalide ses caches).
+        """
+        future = Future()
+        try:
+            self._file.put((operation, fonction_appelante(), future), timeout=ECRITURE_ATTENTE_S)
+        except queue.Full:
+            with self._verrou:
+                self.saturations += 1
+            raise FileEcritureSaturee("File d'écriture saturée, réessayez dans un instant") from None
+        try:
+            return future.result(timeout=ECRITURE_DELAI_S)
+        except TimeoutError:
+            if future.cancel():
+                raise TimeoutError("Écriture non confirmée à temps, réessayez dans un instant") from None
+        return future.result()
+
+    def _boucle(self):
+        # Aucune exception ne doit arrêter le thread : les appelants en file attendraient sans fin
+        while True:
+            lot = [self._file.get()]
+            while len(lot) < self.lot_max:
+                try:
+                    lot.append(self._file.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._executer(lot)
+            except Exception as e:
+                logging.getLogger(__name__).exception("Lot d'écritures interrompu")
+                for _, _, future in lot:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _executer(self, lot):
+        # Les écritures annulées par leur appelant (délai dépassé) ne sont pas exécutées
+        retenues = [ecriture for ecriture in lot if ecriture[2].set_running_or_notify_cancel()]
+        with self._verrou:
+            self.annulees += len(lot) - len(retenues)
+        lot = retenues
+        if not lot:
+            return
+        resultats = []
+        conn = None
+        try:
+            conn = obtenir_pool(self.chemin).connexion()
+            conn.execute('BEGIN IMMEDIATE')
+            for operation, nom, _ in lot:
+                _attribution.nom = nom  # Requêtes mesurées au nom de la fonction appelante
+                conn.execute('SAVEPOINT ecriture')
+                try:
+                    resultats.append((operation(conn), None))
+                    conn.execute('RELEASE ecriture')
+                except Exception as e:
+                    conn.execute('ROLLBACK TO ecriture')
+                    conn.execute('RELEASE ecriture')
+                    resultats.append((None, e))
+            _attribution.nom = None
+            conn.commit()
+        except Exception as e:
+            _attribution.nom = None
+            try:
+                if conn is not None and conn.in_transaction:
+                    conn.rollback()
+            except Exception:
+                logging.getLogger(__name__).exception("Annulation du lot d'écritures impossible")
+            resultats = [(None, e)] * len(lot)
+        echouees = sum(erreur is not None for _, erreur in resultats)
+        with self._verrou:
+            self.lots += 1
+            self.ecritures += len(lot)
+            self.echouees += echouees
+            self._tailles.append(len(lot))
+        # Les appelants ne sont libérés qu'après le COMMIT : une écriture rendue est durable
+        for (_, _, future), (valeur, erreur) in zip(lot, resultats):
+            if erreur is None:
+                future.set_result(valeur)
+            else:
+                future.set_exception(erreur)
+
+    def statistiques(self):
+        with self._verrou:
+            stats = {'en_file': self._file.qsize(), 'lots': self.lots, 'ecritures': self.ecritures,
+                     'echouees': self.echouees, 'saturations': self.saturations, 'annulees': self.annulees}
+            tailles = list(self._tailles)
+        stats.update({f'taille_lot_{rang}': valeur for rang, valeur in percentiles(tailles).items()})
+        return stats
+
+@ressource
+def ecrivain(chemin):
+    # Écrivain unique d'une base (thread démarré au premier appel) : les quartiers écrivent en parallèle
+    return Ecrivain(chemin, ECRITURE_FILE_MAX, ECRITURE_LOT_MAX)
+
+def ecrire(operation, numero=0):
+    # Envoie une écriture à l'écrivain unique de la base n°numero : voir Ecrivain.ecrire
+    return ecrivain(CHEMINS_QUARTIERS[numero]).ecrire(operation)
+
+def statistiques_ecritures():
+    # Statistiques de l'écrivain de chaque base, par nom de fichier
+    return {os.path.basename(chemin): ecrivain(chemin).statistiques() for chemin in CHEMINS_QUARTIERS}
+
+# ---------- GÉOLOCALISATION (CENTROÏDES DES CODES POSTAUX) ----------
+
+# Table hors ligne code_postal,commune,latitude,longitude livrée avec l'application ; elle peut être
+# remplacée par la base officielle complète des codes postaux (mêmes colonnes) via VOISINS_CENTROIDES
+CENTROIDES_PATH = os.environ.get(
+    "VOISINS_CENTROIDES", os.path.join(os.path.dirname(os.path.abspath(__file__)), "codes_postaux.csv"))
+RAYON_TERRE_KM = 6371.0
+KM_PAR_DEGRE = math.pi * RAYON_TERRE_KM / 180
+
+def distance_km(lat1, lon1, lat2, lon2):
+    # Distance à vol d'oiseau (formule de haversine), aussi disponible en SQL : distance_km(...)
+    if None in (lat1, lon1, lat2, lon2):
+        return None
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * RAYON_TERRE_KM * math.asin(math.sqrt(min(1.0, a)))
+
+def normaliser_commune(texte):
+    # "Le Pré-Saint-Gervais" -> "le pre saint gervais"
+    sans_accents = unicodedata.normalize('NFKD', texte).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(re.findall(r'[a-z0-9]+', sans_accents.lower()))
+
+@ressource
+def table_centroides(chemin=CENTROIDES_PATH):
+    # ({code postal: (lat, lon)}, {commune normalisée: (lat, lon)}), chargées une fois par processus
+    par_code, par_commune = {}, {}
+    with open(chemin, newline='', encoding='utf-8') as fichier:
+        for ligne in csv.DictReader(fichier):
+            position = (float(ligne['latitude']), float(ligne['longitude']))
+            par_code.setdefault(ligne['code_postal'].strip(), position)
+            par_commune.setdefault(normaliser_commune(ligne['commune']), position)
+    return par_code, par_commune
+
+def geocoder(adresse):
+    """
+    Position (latitude, longitude) d'une adresse libre : centroïde de son code postal,
+    à défaut celui de la commune citée (le nom le plus long l'emporte). None si inconnue.
+    """
+    if not adresse:
+        return None
+    par_code, par_commune = table_centroides(CENTROIDES_PATH)
+    for code in reversed(re.findall(r'(?<!\d)\d{5}(?!\d)', adresse)):
+        if code in par_code:
+            return par_code[code]
+    mots = normaliser_commune(adresse).split()
+    for taille in range(min(len(mots), 6), 0, -1):
+        for i in range(len(mots) - taille + 1):
+            position = par_commune.get(' '.join(mots[i:i + taille]))
+            if position is not None:
+                return position
+    return None
+
+def positionner_utilisateurs(conn, lignes):
+    """
+    Géocode des couples (id utilisateur, adresse) et met à jour l'index utilisateurs_position
+    (un point par utilisateur ; supprimé si l'adresse n'est plus localisable).
+    À appeler dans la transaction qui écrit les adresses. Retourne le nombre de positions écrites.
+    """
+    positions, inconnus = [], []
+    for utilisateur_id, adresse in lignes:
+        position = geocoder(adresse)
+        if position is None:
+            inconnus.append((utilisateur_id,))
+        else:
+            lat, lon = position
+            positions.append((utilisateur_id, lat, lat, lon, lon))
+    conn.executemany('DELETE FROM utilisateurs_position WHERE id = ?', inconnus)
+    conn.executemany('INSERT OR REPLACE INTO utilisateurs_position VALUES (?, ?, ?, ?, ?)', positions)
+    return len(positions)
+
+def _positionner_existants(conn):
+    # Migration 5 : positions des utilisateurs déjà inscrits
+    positionner_utilisateurs(conn, conn.execute('SELECT id, adresse FROM utilisateurs').fetchall())
+
+# Recomptages complets des compteurs (remplissage initial, vérification et reconstruction)
+COMPTAGE_DEMANDES_EN_ATTENTE = '''SELECT s.utilisateur_id, COUNT(*) FROM demandes d JOIN services s ON d.service_id = s.id
+                                  WHERE d.statut = 'en_attente' AND s.utilisateur_id IS NOT NULL
+                                  GROUP BY s.utilisateur_id'''
+COMPTAGE_SERVICES_DISPONIBLES = '''SELECT categorie, type_service, COUNT(*) FROM services
+                                   WHERE disponible = 1 GROUP BY categorie, type_service'''
+
+# ---------- MIGRATIONS DU SCHÉMA ----------
+
+# Liste ordonnée des migrations : (version, description, instructions SQL).
+# Une migration livrée ne doit plus être modifiée : toute évolution du schéma
+# (index, nouvelles tables...) s'ajoute en fin de liste avec la version suivante.
+MIGRATIONS = [
+    (1, "Tables utilisateurs, services et demandes", [
+        # Table utilisateurs - Gère les inscriptions et les connexions
+        '''CREATE TABLE IF NOT EXISTS utilisateurs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nom TEXT NOT NULL,
+            prenom TEXT NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            mot_de_passe TEXT NOT NULL,
+            adresse TEXT,
+            telephone TEXT,
+            date_inscription TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        # Table services - pour "proposer un service" et "trouver un service"
+        '''CREATE TABLE IF NOT EXISTS services (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            titre TEXT NOT NULL,
+            categorie TEXT NOT NULL,
+            description TEXT NOT NULL,
+            type_service TEXT NOT NULL,
+            prix REAL,
+            utilisateur_id INTEGER,
+            disponible INTEGER DEFAULT 1,
+            date_creation TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (utilisateur_id) REFERENCES utilisateurs (id)
+        )''',
+        # Table demandes - Gère les demandes de service dans "Mon compte"
+        '''CREATE TABLE IF NOT EXISTS demandes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            service_id INTEGER,
+            demandeur_id INTEGER,
+            date_demande TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            date_souhaitee TEXT,
+            statut TEXT DEFAULT 'en_attente', -- Statuts possibles: en_attente, acceptee, refusee
+            message TEXT,
+            FOREIGN KEY (service_id) REFERENCES services (id),
+            FOREIGN KEY (demandeur_id) REFERENCES utilisateurs (id)
+        )''',
+    ]),
+    (2, "Index des chemins d'accès services/demandes", [
+        # "Trouver un service" : services disponibles triés par date, avec ou sans filtres.
+        # Index partiels (WHERE disponible = 1) : seules les annonces actives y sont stockées.
+        '''CREATE INDEX IF NOT EXISTS idx_services_dispo_date
+           ON services (date_creation) WHERE disponible = 1''',
+        '''CREATE INDEX IF NOT EXISTS idx_services_dispo_categorie_date
+           ON services (categorie, date_creation) WHERE disponible = 1''',
+        '''CREATE INDEX IF NOT EXISTS idx_services_dispo_type_date
+           ON services (type_service, date_creation) WHERE disponible = 1''',
+        '''CREATE INDEX IF NOT EXISTS idx_services_dispo_categorie_type_date
+           ON services (categorie, type_service, date_creation) WHERE disponible = 1''',
+        # "Mon compte" : services d'un proposant et jointures des demandes reçues
+        '''CREATE INDEX IF NOT EXISTS idx_services_utilisateur_date
+           ON services (utilisateur_id, date_creation)''',
+        '''CREATE INDEX IF NOT EXISTS idx_demandes_service_date
+           ON demandes (service_id, date_demande)''',
+        '''CREATE INDEX IF NOT EXISTS idx_demandes_demandeur_date
+           ON demandes (demandeur_id, date_demande)''',
+    ]),
+    (3, "Recherche plein texte FTS5 sur les services disponibles", [
+        # Index plein texte à contenu externe : le texte reste dans services,
+        # seuls les services disponibles sont indexés (synchronisés par triggers)
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS services_fts USING fts5(
+            titre, description,
+            content='services', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )''',
+        '''CREATE TRIGGER IF NOT EXISTS services_fts_insertion AFTER INSERT ON services
+           WHEN new.disponible = 1 BEGIN
+               INSERT INTO services_fts (rowid, titre, description)
+               VALUES (new.id, new.titre, new.description);
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS services_fts_suppression AFTER DELETE ON services
+           WHEN old.disponible = 1 BEGIN
+               INSERT INTO services_fts (services_fts, rowid, titre, description)
+               VALUES ('delete', old.id, old.titre, old.description);
+           END''',
+        # Activation/désactivation ou modification du texte : on retire l'ancienne
+        # version si elle était indexée, puis on indexe la nouvelle si disponible
+        '''CREATE TRIGGER IF NOT EXISTS services_fts_modification
+           AFTER UPDATE OF titre, description, disponible ON services BEGIN
+               INSERT INTO services_fts (services_fts, rowid, titre, description)
+               SELECT 'delete', old.id, old.titre, old.description WHERE old.disponible = 1;
+               INSERT INTO services_fts (rowid, titre, description)
+               SELECT new.id, new.titre, new.description WHERE new.disponible = 1;
+           END''',
+        '''INSERT INTO services_fts (rowid, titre, description)
+           SELECT id, titre, description FROM services WHERE disponible = 1''',
+    ]),
+    (4, "Compteurs maintenus par triggers (badges de navigation, filtres)", [
+        # Demandes en attente reçues par chaque proposant (badge "Demandes reçues")
+        '''CREATE TABLE IF NOT EXISTS compteurs_demandes (
+            utilisateur_id INTEGER PRIMARY KEY,
+            en_attente INTEGER NOT NULL DEFAULT 0
+        )''',
+        # Services disponibles par catégorie et type (nombres affichés dans les filtres)
+        '''CREATE TABLE IF NOT EXISTS compteurs_services (
+            categorie TEXT NOT NULL,
+            type_service TEXT NOT NULL,
+            disponibles INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (categorie, type_service)
+        ) WITHOUT ROWID''',
+        '''CREATE TRIGGER IF NOT EXISTS compteurs_demandes_insertion AFTER INSERT ON demandes
+           WHEN new.statut = 'en_attente' BEGIN
+               INSERT INTO compteurs_demandes (utilisateur_id, en_attente)
+               SELECT utilisateur_id, 1 FROM services WHERE id = new.service_id AND utilisateur_id IS NOT NULL
+               ON CONFLICT (utilisateur_id) DO UPDATE SET en_attente = en_attente + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS compteurs_demandes_suppression AFTER DELETE ON demandes
+           WHEN old.statut = 'en_attente' BEGIN
+               UPDATE compteurs_demandes SET en_attente = en_attente - 1
+               WHERE utilisateur_id = (SELECT utilisateur_id FROM services WHERE id = old.service_id);
+           END''',
+        # Acceptation / refus d'une demande, ou demande rattachée à un autre service
+        '''CREATE TRIGGER IF NOT EXISTS compteurs_demandes_modification
+           AFTER UPDATE OF statut, service_id ON demandes
+           WHEN old.statut = 'en_attente' OR new.statut = 'en_attente' BEGIN
+               UPDATE compteurs_demandes SET en_attente = en_attente - 1
+               WHERE old.statut = 'en_attente'
+                 AND utilisateur_id = (SELECT utilisateur_id FROM services WHERE id = old.service_id);
+               INSERT INTO compteurs_demandes (utilisateur_id, en_attente)
+               SELECT utilisateur_id, 1 FROM services
+               WHERE new.statut = 'en_attente' AND id = new.service_id AND utilisateur_id IS NOT NULL
+               ON CONFLICT (utilisateur_id) DO UPDATE SET en_attente = en_attente + 1;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS compteurs_services_insertion AFTER INSERT ON services
+           WHEN new.disponible = 1 BEGIN
+               INSERT INTO compteurs_services (categorie, type_service, disponibles)
+               VALUES (new.categorie, new.type_service, 1)
+               ON CONFLICT (categorie, type_service) DO UPDATE SET disponibles = disponibles + 1;
+           END''',
+        # Suppression d'un service : ses demandes en attente ne sont plus comptées chez le proposant
+        '''CREATE TRIGGER IF NOT EXISTS compteurs_services_suppression AFTER DELETE ON services BEGIN
+               UPDATE compteurs_services SET disponibles = disponibles - 1
+               WHERE old.disponible = 1 AND categorie = old.categorie AND type_service = old.type_service;
+               UPDATE compteurs_demandes
+               SET en_attente = en_attente - (SELECT COUNT(*) FROM demandes
+                                              WHERE service_id = old.id AND statut = 'en_attente')
+               WHERE utilisateur_id = old.utilisateur_id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS compteurs_services_modification
+           AFTER UPDATE OF disponible, categorie, type_service ON services BEGIN
+               UPDATE compteurs_services SET disponibles = disponibles - 1
+               WHERE old.disponible = 1 AND categorie = old.categorie AND type_service = old.type_service;
+               INSERT INTO compteurs_services (categorie, type_service, disponibles)
+               SELECT new.categorie, new.type_service, 1 WHERE new.disponible = 1
+               ON CONFLICT (categorie, type_service) DO UPDATE SET disponibles = disponibles + 1;
+           END''',
+        # Changement de proposant : les demandes en attente du service le suivent
+        '''CREATE TRIGGER IF NOT EXISTS compteurs_services_proprietaire
+           AFTER UPDATE OF utilisateur_id ON services
+           WHEN old.utilisateur_id IS NOT new.utilisateur_id BEGIN
+               UPDATE compteurs_demandes
+               SET en_attente = en_attente - (SELECT COUNT(*) FROM demandes
+                                              WHERE service_id = old.id AND statut = 'en_attente')
+               WHERE utilisateur_id = old.utilisateur_id;
+               INSERT INTO compteurs_demandes (utilisateur_id, en_attente)
+               SELECT new.utilisateur_id, COUNT(*) FROM demandes
+               WHERE service_id = new.id AND statut = 'en_attente' AND new.utilisateur_id IS NOT NULL
+               GROUP BY service_id
+               ON CONFLICT (utilisateur_id) DO UPDATE SET en_attente = en_attente + excluded.en_attente;
+           END''',
+        'INSERT INTO compteurs_demandes (utilisateur_id, en_attente) ' + COMPTAGE_DEMANDES_EN_ATTENTE,
+        'INSERT INTO compteurs_services (categorie, type_service, disponibles) ' + COMPTAGE_SERVICES_DISPONIBLES,
+    ]),
+    (5, "Index R*Tree des positions des utilisateurs (recherche par proximité)", [
+        # Un point par utilisateur (boîte de taille nulle) : centroïde du code postal de son adresse
+        '''CREATE VIRTUAL TABLE IF NOT EXISTS utilisateurs_position
+           USING rtree(id, min_lat, max_lat, min_lon, max_lon)''',
+        '''CREATE TRIGGER IF NOT EXISTS utilisateurs_position_suppression AFTER DELETE ON utilisateurs BEGIN
+               DELETE FROM utilisateurs_position WHERE id = old.id;
+           END''',
+        # Recherche par proximité : services disponibles d'un proposant, triés sans lire la table
+        '''CREATE INDEX IF NOT EXISTS idx_services_dispo_utilisateur
+           ON services (utilisateur_id, categorie, type_service, date_creation) WHERE disponible = 1''',
+        _positionner_existants,
+    ]),
+    (6, "Flux d'évènements des demandes (création, changement de statut)", [
+        # Séquence croissante (AUTOINCREMENT : un identifiant n'est jamais réutilisé) lue par
+        # les sessions depuis leur dernier curseur, au lieu de relire toutes leurs demandes
+        '''CREATE TABLE IF NOT EXISTS evenements (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL, -- 'demande' (création) ou 'statut' (acceptation, refus)
+            demande_id INTEGER NOT NULL,
+            proposant_id INTEGER,
+            demandeur_id INTEGER,
+            statut TEXT,
+            date_evenement TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE INDEX IF NOT EXISTS idx_evenements_proposant ON evenements (proposant_id, id)''',
+        '''CREATE INDEX IF NOT EXISTS idx_evenements_demandeur ON evenements (demandeur_id, id)''',
+    ]),
+    (7, "Archivage des demandes closes et des services inactifs", [
+        # Date de désactivation d'un service, tenue à jour par trigger quel que soit l'écrivain.
+        # Services déjà inactifs : le délai de rétention part de la migration.
+        '''ALTER TABLE services ADD COLUMN date_desactivation TIMESTAMP''',
+        '''UPDATE services SET date_desactivation = CURRENT_TIMESTAMP WHERE disponible = 0''',
+        '''CREATE TRIGGER IF NOT EXISTS services_desactivation
+           AFTER UPDATE OF disponible ON services
+           WHEN old.disponible IS NOT new.disponible BEGIN
+               UPDATE services SET date_desactivation = CASE WHEN new.disponible = 0 THEN CURRENT_TIMESTAMP END
+               WHERE id = new.id;
+           END''',
+        # Candidats à l'archivage, sans parcourir les tables actives (index partiels)
+        '''CREATE INDEX IF NOT EXISTS idx_services_inactifs
+           ON services (COALESCE(date_desactivation, date_creation)) WHERE disponible = 0''',
+        """CREATE INDEX IF NOT EXISTS idx_demandes_closes_date
+           ON demandes (date_demande) WHERE statut <> 'en_attente'""",
+        # Tables d'archive : mêmes identifiants (AUTOINCREMENT, jamais réutilisés). Une demande archivée
+        # garde le proposant et le titre du service : l'historique se lit sans le service d'origine.
+        '''CREATE TABLE IF NOT EXISTS services_archive (
+            id INTEGER PRIMARY KEY,
+            titre TEXT NOT NULL,
+            categorie TEXT NOT NULL,
+            description TEXT NOT NULL,
+            type_service TEXT NOT NULL,
+            prix REAL,
+            utilisateur_id INTEGER,
+            disponible INTEGER,
+            date_creation TIMESTAMP,
+            date_desactivation TIMESTAMP,
+            date_archivage TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE INDEX IF NOT EXISTS idx_services_archive_utilisateur_date
+           ON services_archive (utilisateur_id, date_creation)''',
+        '''CREATE TABLE IF NOT EXISTS demandes_archive (
+            id INTEGER PRIMARY KEY,
+            service_id INTEGER,
+            demandeur_id INTEGER,
+            proposant_id INTEGER,
+            titre TEXT,
+            date_demande TIMESTAMP,
+            date_souhaitee TEXT,
+            statut TEXT,
+            message TEXT,
+            date_archivage TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )''',
+        '''CREATE INDEX IF NOT EXISTS idx_demandes_archive_proposant_date
+           ON demandes_archive (proposant_id, date_demande)''',
+        '''CREATE INDEX IF NOT EXISTS idx_demandes_archive_demandeur_date
+           ON demandes_archive (demandeur_id, date_demande)''',
+    ]),
+    (8, "Sessions persistantes (jetons signés)", [
+        # Secret de signature des jetons, tiré une fois par base (partagé par tous les processus)
+        '''CREATE TABLE IF NOT EXISTS parametres (
+            cle TEXT PRIMARY KEY,
+            valeur TEXT NOT NULL
+        )''',
+        '''INSERT OR IGNORE INTO parametres (cle, valeur) VALUES ('secret_sessions', lower(hex(randomblob(32))))''',
+        # Seule l'empreinte SHA-256 du jeton est stockée : une copie de la base ne permet pas d'usurper une session
+        '''CREATE TABLE IF NOT EXISTS sessions (
+            empreinte TEXT PRIMARY KEY,
+            utilisateur_id INTEGER NOT NULL,
+            date_creation TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            date_expiration TIMESTAMP NOT NULL,
+            FOREIGN KEY (utilisateur_id) REFERENCES utilisateurs (id)
+        ) WITHOUT ROWID''',
+        '''CREATE INDEX IF NOT EXISTS idx_sessions_expiration ON sessions (date_expiration)''',
+        '''CREATE INDEX IF NOT EXISTS idx_sessions_utilisateur ON sessions (utilisateur_id)''',
+    ]),
+    (9, "Recommandations précalculées (« Pour vous »)", [
+        # Suggestions classées de chaque utilisateur, dans la base de son quartier, réécrites par
+        # rafraichir_recommandations ; utilisateur 0 : services populaires (voisins sans historique)
+        '''CREATE TABLE IF NOT EXISTS recommandations (
+            utilisateur_id INTEGER NOT NULL,
+            rang INTEGER NOT NULL,
+            service_id INTEGER NOT NULL,
+            score REAL NOT NULL,
+            PRIMARY KEY (utilisateur_id, rang)
+        ) WITHOUT ROWID''',
+    ]),
+    (10, "Date de modification (instantanés analytiques incrémentaux)", [
+        # Dernière modification d'une ligne après sa création, tenue à jour par trigger quel que soit
+        # l'écrivain (NULL si jamais modifiée) : instantanes.py ne relit que les lignes nouvelles (id)
+        # ou modifiées depuis son dernier passage
+        '''ALTER TABLE utilisateurs ADD COLUMN date_modification TIMESTAMP''',
+        '''ALTER TABLE services ADD COLUMN date_modification TIMESTAMP''',
+        '''ALTER TABLE demandes ADD COLUMN date_modification TIMESTAMP''',
+        '''CREATE TRIGGER IF NOT EXISTS utilisateurs_modification
+           AFTER UPDATE OF nom, prenom, email, adresse, telephone ON utilisateurs
+           WHEN old.nom IS NOT new.nom OR old.prenom IS NOT new.prenom OR old.email IS NOT new.email
+             OR old.adresse IS NOT new.adresse OR old.telephone IS NOT new.telephone BEGIN
+               UPDATE utilisateurs SET date_modification = CURRENT_TIMESTAMP WHERE id = new.id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS services_modification
+           AFTER UPDATE OF titre, categorie, description, type_service, prix, utilisateur_id, disponible ON services
+           WHEN old.titre IS NOT new.titre OR old.categorie IS NOT new.categorie
+             OR old.description IS NOT new.description OR old.type_service IS NOT new.type_service
+             OR old.prix IS NOT new.prix OR old.utilisateur_id IS NOT new.utilisateur_id
+             OR old.disponible IS NOT new.disponible BEGIN
+               UPDATE services SET date_modification = CURRENT_TIMESTAMP WHERE id = new.id;
+           END''',
+        '''CREATE TRIGGER IF NOT EXISTS demandes_modification
+           AFTER UPDATE OF service_id, demandeur_id, date_souhaitee, statut, message ON demandes
+           WHEN old.service_id IS NOT new.service_id OR old.demandeur_id IS NOT new.demandeur_id
+             OR old.date_souhaitee IS NOT new.date_souhaitee OR old.statut IS NOT new.statut
+             OR old.message IS NOT new.message BEGIN
+               UPDATE demandes SET date_modification = CURRENT_TIMESTAMP WHERE id = new.id;
+           END''',
+        # Index partiels : seules les lignes modifiées y figurent
+        '''CREATE INDEX IF NOT EXISTS idx_utilisateurs_modification
+           ON utilisateurs (date_modification) WHERE date_modification IS NOT NULL''',
+        '''CREATE INDEX IF NOT EXISTS idx_services_modification
+           ON services (date_modification) WHERE date_modification IS NOT NULL''',
+        '''CREATE INDEX IF NOT EXISTS idx_demandes_modification
+           ON demandes (date_modification) WHERE date_modification IS NOT NULL''',
+        # Lignes archivées depuis le dernier instantané
+        '''CREATE INDEX IF NOT EXISTS idx_services_archive_date ON services_archive (date_archivage)''',
+        '''CREATE INDEX IF NOT EXISTS idx_demandes_archive_date ON demandes_archive (date_archivage)''',
+    ]),
+    (11, "Réservation des emails et fiches de contact à recopier (quartiers)", [
+        # Dans la base principale : l'email de chaque compte, réservé avant l'insertion dans la base
+        # du quartier (utilisateur_id NULL tant que l'inscription n'est pas terminée). Les comptes
+        # des autres quartiers sont repris par init_database.
+        '''CREATE TABLE IF NOT EXISTS emails_comptes (
+            email TEXT PRIMARY KEY,
+            utilisateur_id INTEGER,
+            date_reservation TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        ) WITHOUT ROWID''',
+        """INSERT OR IGNORE INTO emails_comptes (email, utilisateur_id)
+           SELECT email, id FROM utilisateurs WHERE mot_de_passe <> ''""",
+        # Dans la base principale : profils modifiés dont les fiches recopiées dans les autres
+        # quartiers restent à mettre à jour (version : une modification pendant la recopie la relance)
+        '''CREATE TABLE IF NOT EXISTS fiches_a_recopier (
+            utilisateur_id INTEGER PRIMARY KEY,
+            version INTEGER NOT NULL DEFAULT 1
+        )''',
+    ]),
+    (12, "Date de clôture des demandes (archivage)", [
+        # Date à laquelle une demande a quitté 'en_attente', tenue à jour par trigger quel que soit
+        # l'écrivain, comme date_desactivation pour les services : la rétention part de la clôture
+        '''ALTER TABLE demandes ADD COLUMN date_cloture TIMESTAMP''',
+        '''CREATE TRIGGER IF NOT EXISTS demandes_cloture
+           AFTER UPDATE OF statut ON demandes
+           WHEN old.statut IS NOT new.statut BEGIN
+               UPDATE demandes SET date_cloture = CASE WHEN new.statut <> 'en_attente' THEN CURRENT_TIMESTAMP END
+               WHERE id = new.id;
+           END''',
+        # Demandes déjà closes : date du dernier changement de statut journalisé, sinon de la
+        # dernière modification, sinon de la migration
+        """UPDATE demandes SET date_cloture = e.date_statut
+           FROM (SELECT demande_id, MAX(date_evenement) AS date_statut FROM evenements
+                 WHERE type = 'statut' GROUP BY demande_id) AS e
+           WHERE e.demande_id = demandes.id AND demandes.statut <> 'en_attente'""",
+        """UPDATE demandes SET date_cloture = COALESCE(date_modification, CURRENT_TIMESTAMP)
+           WHERE statut <> 'en_attente' AND date_cloture IS NULL""",
+        '''DROP INDEX IF EXISTS idx_demandes_closes_date''',
+        """CREATE INDEX IF NOT EXISTS idx_demandes_closes
+           ON demandes (COALESCE(date_cloture, date_demande)) WHERE statut <> 'en_attente'""",
+    ]),
+    (13, "Triggers d'insertion des services suspendus pendant l'import en masse", [
+        # L'import écrit la ligne 'import_services' de parametres et l'efface dans la transaction
+        # de chaque lot : aucune autre connexion ne la voit, les triggers restent actifs pour elles
+        '''DROP TRIGGER IF EXISTS services_fts_insertion''',
+        """CREATE TRIGGER services_fts_insertion AFTER INSERT ON services
+           WHEN new.disponible = 1 AND NOT EXISTS (SELECT 1 FROM parametres WHERE cle = 'import_services') BEGIN
+               INSERT INTO services_fts (rowid, titre, description)
+               VALUES (new.id, new.titre, new.description);
+           END""",
+        '''DROP TRIGGER IF EXISTS compteurs_services_insertion''',
+        """CREATE TRIGGER compteurs_services_insertion AFTER INSERT ON services
+           WHEN new.disponible = 1 AND NOT EXISTS (SELECT 1 FROM parametres WHERE cle = 'import_services') BEGIN
+               INSERT INTO compteurs_services (categorie, type_service, disponibles)
+               VALUES (new.categorie, new.type_service, 1)
+               ON CONFLICT (categorie, type_service) DO UPDATE SET disponibles = disponibles + 1;
+           END""",
+    ]),
+]
+
+def version_schema(conn):
+    # Version du schéma actuellement appliquée (0 pour une base vide)
+    c = conn.cursor()
+    c.execute('''CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        description TEXT,
+        date_application TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    c.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version')
+    return c.fetchone()[0]
+
+def appliquer_migrations(conn, migrations=MIGRATIONS):
+    """
+    Applique dans l'ordre les migrations dont la version est supérieure à celle de la base.
+    Une instruction est une requête SQL ou une fonction appelée avec la connexion
+    (remplissage qui demande du Python, comme le géocodage).
+    BEGIN IMMEDIATE prend le verrou d'écriture SQLite : si plusieurs processus démarrent
+    en même temps, un seul applique les migrations et les autres relisent la version à jour.
+    Retourne la version du schéma après application.
+    """
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        version = version_schema(conn)
+        for numero, description, instructions in sorted(migrations, key=lambda m: m[0]):
+            if numero <= version:
+                continue
+            for instruction in instructions:
+                if callable(instruction):
+                    instruction(conn)
+                else:
+                    conn.execute(instruction)
+            conn.execute('INSERT INTO schema_version (version, description) VALUES (?, ?)',
+                         (numero, description))
+            version = numero
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return version
+
+@ressource
+def init_database(chemin=DB_PATH):
+    """
+    Met le schéma de la base à jour une seule fois par processus.
+    @ressource sérialise les appels concurrents : les reruns suivants
+    retrouvent le résultat en cache sans aucune requête SQL.
+    Pour la base principale, les bases des quartiers sont créées ou mises à jour aussi.
+    """
+    version = appliquer_migrations(obtenir_pool(chemin).connexion())
+    if chemin == DB_PATH and len(CHEMINS_QUARTIERS) > 1:
+        reserver_identifiants(obtenir_pool(chemin).connexion(), 0)
+        for numero, chemin_quartier in enumerate(CHEMINS_QUARTIERS[1:], 1):
+            conn = obtenir_pool(chemin_quartier).connexion()
+            appliquer_migrations(conn)
+            reserver_identifiants(conn, numero)
+        _reprendre_emails_quartiers()
+    return version
+
+def _reprendre_emails_quartiers():
+    # Une seule fois : réserve dans la base principale les emails des comptes déjà inscrits
+    # dans les autres quartiers (la migration 11 ne voit que la base où elle s'applique)
+    conn = obtenir_pool(DB_PATH).connexion()
+    if conn.execute("SELECT 1 FROM parametres WHERE cle = 'emails_comptes_repris'").fetchone():
+        return
+    comptes = []
+    for numero in range(1, len(CHEMINS_QUARTIERS)):
+        debut = numero << BITS_QUARTIER
+        comptes += connexion_quartier(numero).execute(
+            """SELECT email, id FROM utilisateurs WHERE id > ? AND id < ? AND mot_de_passe <> ''""",
+            (debut, debut + (1 << BITS_QUARTIER))).fetchall()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        conn.executemany('INSERT OR IGNORE INTO emails_comptes (email, utilisateur_id) VALUES (?, ?)', comptes)
+        conn.execute("INSERT OR IGNORE INTO parametres (cle, valeur) VALUES ('emails_comptes_repris', '1')")
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+# ---------- CACHE DU CATALOGUE DE SERVICES ----------
+
+# Nombre maximal de résultats gardés en cache et durée de vie (en secondes) d'un résultat
+CACHE_CATALOGUE_TAILLE = int(os.environ.get("VOISINS_CACHE_TAILLE", "256"))
+CACHE_CATALOGUE_TTL = float(os.environ.get("VOISINS_CACHE_TTL", "60"))
+CACHE_COMPTES_TAILLE = int(os.environ.get("VOISINS_CACHE_COMPTES_TAILLE", "1024"))
+
+class CacheLRU:
+    """
+    Cache en mémoire partagé entre les sessions, borné en taille (éviction du moins
+    récemment utilisé) et en durée de vie. Les valeurs sont partagées : ne pas les modifier.
+    """
+
+    def __init__(self, taille_max, ttl_secondes):
+        self.taille_max = taille_max
+        self.ttl_secondes = ttl_secondes
+        self._entrees = OrderedDict()  # clé -> (instant d'expiration, valeur)
+        self._verrou = threading.Lock()
+        self.succes = 0
+        self.echecs = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def obtenir(self, cle, calcul):
+        # Retourne la valeur en cache pour cette clé, ou la calcule et la mémorise
+        maintenant = time.monotonic()
+        with self._verrou:
+            entree = self._entrees.get(cle)
+            if entree is not None and entree[0] > maintenant:
+                self._entrees.move_to_end(cle)
+                self.succes += 1
+                return entree[1]
+            self.echecs += 1
+            generation = self.invalidations
+        valeur = calcul()
+        with self._verrou:
+            # Une écriture a invalidé le cache pendant le calcul : on ne mémorise pas un résultat périmé
+            if generation == self.invalidations:
+                self._entrees[cle] = (maintenant + self.ttl_secondes, valeur)
+                self._entrees.move_to_end(cle)
+                while len(self._entrees) > self.taille_max:
+                    self._entrees.popitem(last=False)
+                    self.evictions += 1
+        return valeur
+
+    def invalider(self, cle=None):
+        # Vide le cache (ou la seule entrée cle) après une écriture qui modifie les données mises en cache
+        with self._verrou:
+            if cle is None:
+                self._entrees.clear()
+            else:
+                self._entrees.pop(cle, None)
+            self.invalidations += 1
+
+    def statistiques(self):
+        with self._verrou:
+            return {'entrees': len(self._entrees), 'succes': self.succes, 'echecs': self.echecs,
+                    'evictions': self.evictions, 'invalidations': self.invalidations}
+
+@ressource
+def cache_catalogue():
+    """
+    Cache des listes de services (obtenir_services, rechercher_services), commun à toutes
+    les sessions du processus. Invalidé par creer_service, mettre_a_jour_disponibilite_service
+    et mettre_a_jour_utilisateur ; le TTL couvre les écritures faites par un autre processus.
+    """
+    return CacheLRU(CACHE_CATALOGUE_TAILLE, CACHE_CATALOGUE_TTL)
+
+@ressource
+def cache_comptes():
+    """
+    Cache des données propres à un utilisateur (page "Mon compte"), une entrée par
+    utilisateur. Seule l'entrée de l'utilisateur qui écrit est invalidée (creer_service,
+    mettre_a_jour_disponibilite_service) ; le TTL couvre les autres processus.
+    """
+    return CacheLRU(CACHE_COMPTES_TAILLE, CACHE_CATALOGUE_TTL)
+
+# ---------- LIGNES RETOURNÉES PAR LES FONCTIONS DE DONNÉES ----------
+
+# Enregistrements compacts (slots, immuables) construits directement depuis le curseur SQLite :
+# les pages les parcourent sans DataFrame, et ils peuvent être partagés par le cache.
+
+@dataclass(frozen=True, slots=True)
+class Service:
+    id: int
+    titre: str
+    categorie: str
+    description: str
+    type_service: str
+    prix: float
+    utilisateur_id: int
+    disponible: int
+    date_creation: str
+    # Coordonnées du proposant (renseignées par les requêtes du catalogue)
+    prenom: str = None
+    nom: str = None
+    email: str = None
+    telephone: str = None
+    # Distance en km au centre d'une recherche par proximité
+    distance: float = None
+    # Score bm25 d'une recherche plein texte (plus petit = plus pertinent)
+    pertinence: float = None
+
+@dataclass(frozen=True, slots=True)
+class Demande:
+    id: int
+    service_id: int
+    demandeur_id: int
+    date_demande: str
+    date_souhaitee: str
+    statut: str
+    message: str
+    titre: str
+    # Coordonnées de l'autre partie (demandeur ou proposant selon la requête)
+    prenom: str
+    nom: str
+    email: str
+    telephone: str
+
+@dataclass(frozen=True, slots=True)
+class Evenement:
+    id: int
+    type: str
+    demande_id: int
+    proposant_id: int
+    demandeur_id: int
+    statut: str
+    date_evenement: str
+
+COLONNES_SERVICE = '''s.id, s.titre, s.categorie, s.description, s.type_service, s.prix,
+                      s.utilisateur_id, s.disponible, s.date_creation'''
+COLONNES_CATALOGUE = COLONNES_SERVICE + ', u.prenom, u.nom, u.email, u.telephone'
+COLONNES_DEMANDE = '''d.id, d.service_id, d.demandeur_id, d.date_demande, d.date_souhaitee,
+                      d.statut, d.message, s.titre, u.prenom, u.nom, u.email, u.telephone'''
+COLONNES_DEMANDE_ARCHIVE = COLONNES_DEMANDE.replace('s.titre', 'd.titre')
+
+def lire_lignes(conn, classe, query, params=()):
+    # Exécute la requête et construit un enregistrement par ligne, au fil du curseur
+    c = conn.cursor()
+    c.row_factory = lambda _curseur, ligne: classe(*ligne)
+    c.execute(query, params)
+    return c.fetchall()
+
+def en_dataframe(lignes):
+    """
+    Convertit une liste d'enregistrements en DataFrame pandas.
+    Réservé aux analyses et exports : les pages travaillent directement sur les enregistrements.
+    """
+    import pandas as pd
+    return pd.DataFrame.from_records([asdict(ligne) for ligne in lignes])
+
+# ---------- MOTS DE PASSE (BCRYPT) ----------
+
+# Facteur de coût bcrypt (2^cout itérations) et nombre de hachages simultanés au maximum
+BCRYPT_COUT = int(os.environ.get("VOISINS_BCRYPT_COUT", "12"))
+BCRYPT_TRAVAILLEURS = int(os.environ.get("VOISINS_BCRYPT_TRAVAILLEURS", str(os.cpu_count() or 2)))
+
+@ressource
+def pool_bcrypt():
+    """
+    Pool de threads borné dédié à bcrypt (qui libère le GIL pendant le calcul) :
+    un pic de connexions ne peut pas occuper plus de BCRYPT_TRAVAILLEURS cœurs,
+    les autres reruns restent servis.
+    """
+    return ThreadPoolExecutor(max_workers=BCRYPT_TRAVAILLEURS, thread_name_prefix="bcrypt")
+
+class MetriquesConnexion:
+    # Durées (en ms) des dernières connexions : lecture SQL, bcrypt et total
+    def __init__(self, historique=1000):
+        self._mesures = deque(maxlen=historique)
+        self._verrou = threading.Lock()
+        self.reussies = 0
+        self.echouees = 0
+        self.rehachages = 0
+
+    def enregistrer(self, lecture_ms, bcrypt_ms, total_ms, reussie, rehachage=False):
+        with self._verrou:
+            self._mesures.append((lecture_ms, bcrypt_ms, total_ms))
+            self.reussies += reussie
+            self.echouees += not reussie
+            self.rehachages += rehachage
+
+    def statistiques(self):
+        with self._verrou:
+            mesures = list(self._mesures)
+            stats = {'reussies': self.reussies, 'echouees': self.echouees, 'rehachages': self.rehachages}
+        for i, nom in enumerate(('lecture_ms', 'bcrypt_ms', 'total_ms')):
+            for rang, valeur in percentiles([m[i] for m in mesures]).items():
+                stats[f'{nom}_{rang}'] = valeur
+        return stats
+
+@ressource
+def metriques_connexion():
+    return MetriquesConnexion()
+
+# ---------- LIMITATION DES TENTATIVES (CONNEXION, RÉINITIALISATION) ----------
+
+# (capacité, secondes pour regagner une tentative) des seaux à jetons, par email (seul ou avec le client)
+# et par client (adresse IP).
+# Le seau client est plus large : plusieurs voisins peuvent partager une même adresse.
+TENTATIVES_EMAIL = (int(os.environ.get("VOISINS_TENTATIVES_EMAIL", "5")), 60.0)
+TENTATIVES_CLIENT = (int(os.environ.get("VOISINS_TENTATIVES_CLIENT", "20")), 15.0)
+PENALITE_MAX_S = float(os.environ.get("VOISINS_PENALITE_MAX_S", "900"))
+LIMITEUR_TAILLE = int(os.environ.get("VOISINS_LIMITEUR_TAILLE", "10000"))
+
+class TropDeTentatives(Exception):
+    # Tentative refusée par le limiteur, avant tout calcul bcrypt ou écriture
+    def __init__(self, attente_s):
+        super().__init__(f"Trop de tentatives : réessayez dans {math.ceil(attente_s)} s.")
+        self.attente_s = attente_s
+
+class LimiteurTentatives:
+    """
+    Seaux à jetons par clé ((action, 'email', 'email_client' ou 'client', valeur)).
+    Les seaux du couple (email, client) et du client sont propres au client : chaque
+    tentative, autorisée ou non, y est décomptée ; une fois vides, ils bloquent la clé
+    pendant un délai qui double à chaque refus (plafonné à PENALITE_MAX_S), sans
+    recharge pendant le blocage : une seule tentative à la fin du blocage. Les refus
+    sont oubliés quand le seau est de nouveau plein.
+    Le seau de l'email seul, partagé par tous les clients, est un simple seau à jetons ;
+    il n'est entamé que par les tentatives que les seaux du client autorisent. Un client
+    qui insiste ne bloque donc que lui-même, pas le compte visé.
+    Les clés sont gardées dans l'ordre d'utilisation et les plus anciennes évincées
+    au-delà de taille_max : la mémoire reste bornée face à des emails aléatoires.
+    """
+
+    def __init__(self, taille_max):
+        self.taille_max = taille_max
+        self._seaux = OrderedDict()  # clé -> [jetons, dernier instant, refus consécutifs, bloquée jusqu'à]
+        self._verrou = threading.Lock()
+        self.autorisees = 0
+        self.refusees = {}  # action -> nombre de tentatives refusées
+        self.evictions = 0
+
+    def _seau(self, cle, capacite, recharge_s, maintenant):
+        # Seau de la clé, rechargé jusqu'à maintenant (appelé sous le verrou)
+        seau = self._seaux.get(cle)
+        if seau is None:
+            seau = self._seaux[cle] = [float(capacite), maintenant, 0, 0.0]
+            while len(self._seaux) > self.taille_max:
+                self._seaux.popitem(last=False)
+                self.evictions += 1
+            return seau
+        self._seaux.move_to_end(cle)
+        # Pendant un blocage, le dernier instant est dans le futur : pas de recharge
+        seau[0] = min(capacite, seau[0] + max(0.0, maintenant - seau[1]) / recharge_s)
+        seau[1] = max(seau[1], maintenant)
+        if seau[0] >= capacite:
+            seau[2] = 0
+        return seau
+
+    def controler(self, action, email, client=None):
+        # Décompte la tentative ; retourne l'attente la plus longue (0 si autorisée)
+        email = (email or '').strip().lower()
+        propres = [((action, 'email_client', (email, client)), *TENTATIVES_EMAIL)]
+        if client:
+            propres.append(((action, 'client', client), *TENTATIVES_CLIENT))
+        maintenant = time.monotonic()
+        with self._verrou:
+            attente = 0.0
+            for cle, capacite, recharge_s in propres:
+                seau = self._seau(cle, capacite, recharge_s, maintenant)
+                if seau[3] > maintenant:
+                    attente = max(attente, seau[3] - maintenant)
+                elif seau[0] >= 1:
+                    seau[0] -= 1
+                else:
+                    seau[2] += 1
+                    seau[3] = maintenant + min(PENALITE_MAX_S, recharge_s * 2 ** (seau[2] - 1))
+                    seau[1] = seau[3] - recharge_s  # Un jeton disponible à la fin du blocage
+                    attente = max(attente, seau[3] - maintenant)
+            if not attente:
+                commun = self._seau((action, 'email', email), *TENTATIVES_EMAIL, maintenant)
+                if commun[0] >= 1:
+                    commun[0] -= 1
+                else:
+                    attente = (1 - commun[0]) * TENTATIVES_EMAIL[1]
+            if attente:
+                self.refusees[action] = self.refusees.get(action, 0) + 1
+            else:
+                self.autorisees += 1
+        return attente
+
+    def liberer(self, action, email, client=None):
+        # Après une tentative réussie, l'email (et ce client pour cet email) retrouve toutes ses tentatives
+        email = (email or '').strip().lower()
+        with self._verrou:
+            self._seaux.pop((action, 'email', email), None)
+            self._seaux.pop((action, 'email_client', (email, client)), None)
+
+    def statistiques(self):
+        with self._verrou:
+            return {'cles': len(self._seaux), 'autorisees': self.autorisees,
+                    'refusees': dict(self.refusees), 'evictions': self.evictions}
+
+@ressource
+def limiteur_tentatives():
+    return LimiteurTentatives(LIMITEUR_TAILLE)
+
+def hash_password(password):
+    # Hachage exécuté sur le pool bcrypt avec le coût configuré
+    import bcrypt  # type: ignore
+    salt = bcrypt.gensalt(rounds=BCRYPT_COUT)
+    hachage = pool_bcrypt().submit(bcrypt.hashpw, password.encode('utf-8'), salt).result()
+    # Le hash est encodé en utf-8 pour le stockage en TEXT dans SQLite
+    return hachage.decode('utf-8')
+
+def cout_hash(user_hash):
+    # Facteur de coût d'un hash bcrypt ("$2b$12$..." -> 12), None si le format est inconnu
+    try:
+        return int(user_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
+
+# ---------- FONCTIONS POUR "S'INSCRIRE" ----------
+
+# Délai (en secondes) après lequel la réservation d'un email par une inscription interrompue expire
+EMAIL_RESERVATION_S = int(os.environ.get("VOISINS_EMAIL_RESERVATION_S", "300"))
+
+def creer_utilisateur(nom, prenom, email, mot_de_passe, adresse, telephone): #Crée un nouveau compte utilisateur dans la base de données.
+    
+    numero = quartier_adresse(adresse) # Le compte est créé dans la base de son quartier
+    try:
+        # L'email est unique dans toutes les bases : il est réservé dans la base principale avant
+        # l'insertion, deux inscriptions simultanées dans deux quartiers ne réussissent pas toutes les deux
+        if not _reserver_email(email):
+            return False, "Cet email est déjà utilisé."
+        # Réservation reprise après une inscription interrompue : le compte a pu être créé
+        compte = chercher_compte('SELECT id FROM utilisateurs WHERE email = ?', (email,))
+        if compte:
+            _confirmer_email(email, compte[0])
+            return False, "Cet email est déjà utilisé."
+        try:
+            with connexion_quartier(numero) as conn:
+                c = conn.cursor()
+                c.execute(f'''INSERT INTO utilisateurs (id, nom, prenom, email, mot_de_passe, adresse, telephone)
+                              VALUES ({prochain_utilisateur(numero)}, ?, ?, ?, ?, ?, ?)''',
+                          (nom, prenom, email, hash_password(mot_de_passe), adresse, telephone))
+                utilisateur_id = c.lastrowid
+                positionner_utilisateurs(conn, [(utilisateur_id, adresse)])
+                conn.commit()
+        except Exception:
+            _liberer_email(email)
+            raise
+        _confirmer_email(email, utilisateur_id)
+        return True, "Inscription réussie !"
+    except sqlite3.IntegrityError:
+        return False, "Cet email est déjà utilisé."
+    except Exception as e:
+        return False, f"Erreur : {str(e)}"
+
+def _reserver_email(email):
+    # Réserve l'email dans la base principale ; False s'il appartient à un compte ou à une inscription
+    # en cours. Une réservation jamais confirmée (inscription interrompue) expire après EMAIL_RESERVATION_S.
+    with obtenir_connexion() as conn:
+        reservee = conn.execute('''INSERT INTO emails_comptes (email) VALUES (?)
+                                   ON CONFLICT (email) DO UPDATE SET date_reservation = CURRENT_TIMESTAMP
+                                   WHERE utilisateur_id IS NULL AND date_reservation < datetime('now', ?)''',
+                                (email, f'-{EMAIL_RESERVATION_S} seconds')).rowcount
+        conn.commit()
+    return reservee == 1
+
+def _confirmer_email(email, utilisateur_id):
+    with obtenir_connexion() as conn:
+        conn.execute('UPDATE emails_comptes SET utilisateur_id = ? WHERE email = ?', (utilisateur_id, email))
+        conn.commit()
+
+def _liberer_email(email):
+    with obtenir_connexion() as conn:
+        conn.execute('DELETE FROM emails_comptes WHERE email = ? AND utilisateur_id IS NULL', (email,))
+        conn.commit()
+
+def chercher_compte(requete, params):
+    """
+    Ligne d'un compte cherché dans toutes les bases (requete sélectionne l'id en premier).
+    Seule la ligne de la base d'origine du compte compte : les fiches recopiées dans
+    les autres quartiers n'ont pas de mot de passe.
+    """
+    def lire(numero):
+        with connexion_quartier(numero) as conn:
+            return conn.execute(requete, params).fetchone()
+    lignes = sur_les_quartiers(lire)
+    return next((ligne for numero, ligne in enumerate(lignes) if ligne and quartier_de(ligne[0]) == numero), None)
+
+# ---------- FONCTIONS POUR "SE CONNECTER" ----------
+
+def verifier_connexion(email, mot_de_passe, client=None):
+    """
+    Vérifie les identifiants de connexion avec bcrypt.
+    Retourne les données utilisateur si la connexion est réussie, sinon None.
+    L'utilisateur est lu en une seule requête ; si son hash n'a pas le coût configuré
+    (BCRYPT_COUT), le mot de passe est haché à nouveau après une connexion réussie.
+    Lève TropDeTentatives, avant toute lecture ou calcul bcrypt, si l'email ou le
+    client (adresse IP) a épuisé ses tentatives.
+    """
+    attente = limiteur_tentatives().controler('connexion', email, client)
+    if attente:
+        raise TropDeTentatives(attente)
+    import bcrypt  # type: ignore
+    debut = time.perf_counter()
+    # 1. Récupérer l'utilisateur et son hash en une seule requête (par base)
+    try:
+        user = chercher_compte('SELECT * FROM utilisateurs WHERE email = ?', (email,))
+    except Exception:
+        return None # Erreur de connexion DB
+    fin_lecture = time.perf_counter()
+
+    valide = False
+    if user:
+        user_hash = user[4]
+        try:
+            # 2. Comparer le mot de passe fourni avec le hash stocké (sur le pool bcrypt)
+            valide = pool_bcrypt().submit(
+                bcrypt.checkpw, mot_de_passe.encode('utf-8'), user_hash.encode('utf-8')).result()
+        except ValueError:
+            valide = False # Hash invalide
+    fin_bcrypt = time.perf_counter()
+
+    # 3. Mise à niveau transparente du hash si le coût configuré a changé
+    rehachage = valide and cout_hash(user_hash) != BCRYPT_COUT
+    if rehachage:
+        try:
+            with connexion_de(user[0]) as conn:
+                conn.execute('UPDATE utilisateurs SET mot_de_passe = ? WHERE id = ?',
+                             (hash_password(mot_de_passe), user[0]))
+                conn.commit()
+        except Exception:
+            rehachage = False # La connexion reste valide avec l'ancien hash
+
+    metriques_connexion().enregistrer(
+        (fin_lecture - debut) * 1000, (fin_bcrypt - fin_lecture) * 1000,
+        (time.perf_counter() - debut) * 1000, valide, rehachage)
+    if valide:
+        limiteur_tentatives().liberer('connexion', email, client)
+    return user if valide else None
+
+# ---------- SESSIONS PERSISTANTES (JETONS SIGNÉS) ----------
+
+# Durée de validité d'une session, durée de vie du cache devant la table sessions,
+# et intervalle entre deux purges des sessions expirées (en secondes)
+SESSIONS_DUREE_JOURS = int(os.environ.get("VOISINS_SESSIONS_JOURS", "30"))
+SESSIONS_CACHE_TTL = float(os.environ.get("VOISINS_SESSIONS_CACHE_TTL", "60"))
+SESSIONS_PURGE_S = float(os.environ.get("VOISINS_SESSIONS_PURGE_S", "3600"))
+# Forme des jetons produits par ouvrir_session : vérifiée avant tout hachage (cookie arbitraire)
+FORMAT_JETON = re.compile(r'[A-Za-z0-9_-]+\.[0-9a-f]{64}')
+
+@ressource
+def secret_sessions():
+    # Clé HMAC des jetons : VOISINS_SECRET_SESSIONS, sinon le secret tiré par la migration 8
+    secret = os.environ.get("VOISINS_SECRET_SESSIONS")
+    if not secret:
+        with obtenir_connexion() as conn:
+            secret = conn.execute("SELECT valeur FROM parametres WHERE cle = 'secret_sessions'").fetchone()[0]
+    return secret.encode('utf-8')
+
+@ressource
+def cache_sessions():
+    """
+    Cache empreinte du jeton -> (utilisateur, expiration) : un rechargement de page ne lit
+    pas la table sessions. fermer_session invalide l'entrée ; le TTL borne le délai
+    de prise en compte d'une déconnexion faite par un autre processus.
+    """
+    return CacheLRU(CACHE_COMPTES_TAILLE, SESSIONS_CACHE_TTL)
+
+def _signature(aleatoire):
+    return hmac.new(secret_sessions(), aleatoire.encode('ascii'), hashlib.sha256).hexdigest()
+
+def _empreinte(jeton):
+    return hashlib.sha256(jeton.encode('ascii')).hexdigest()
+
+def ouvrir_session(utilisateur_id):
+    # Crée une session pour l'utilisateur et retourne son jeton signé ("aléatoire.signature")
+    aleatoire = secrets.token_urlsafe(32)
+    jeton = f"{aleatoire}.{_signature(aleatoire)}"
+    with obtenir_connexion() as conn:
+        conn.execute('''INSERT INTO sessions (empreinte, utilisateur_id, date_expiration)
+                        VALUES (?, ?, datetime('now', ?))''',
+                     (_empreinte(jeton), utilisateur_id, f'+{SESSIONS_DUREE_JOURS} days'))
+        conn.commit()
+    return jeton
+
+def restaurer_session(jeton):
+    """
+    Retourne l'utilisateur (même ligne que verifier_connexion) d'un jeton valide et non
+    expiré, sinon None. Aucun calcul bcrypt ; un jeton mal formé ou mal signé est
+    rejeté sans lecture de la base.
+    """
+    if not isinstance(jeton, str) or not FORMAT_JETON.fullmatch(jeton):
+        return None
+    aleatoire, _, signature = jeton.partition('.')
+    if not hmac.compare_digest(signature, _signature(aleatoire)):
+        return None
+    empreinte = _empreinte(jeton)
+
+    def lire():
+        # La session est dans la base principale, l'utilisateur dans la base de son quartier
+        with obtenir_connexion() as conn:
+            session = conn.execute(
+                '''SELECT CAST(strftime('%s', date_expiration) AS INTEGER), utilisateur_id
+                   FROM sessions WHERE empreinte = ?''', (empreinte,)).fetchone()
+        if session is None:
+            return None, 0
+        with connexion_de(session[1]) as conn:
+            user = conn.execute('SELECT * FROM utilisateurs WHERE id = ?', (session[1],)).fetchone()
+        return (user, session[0]) if user else (None, 0)
+
+    user, expiration = cache_sessions().obtenir(empreinte, lire)
+    return user if expiration > time.time() else None
+
+def fermer_session(jeton):
+    # Déconnexion explicite : le jeton est invalidé en base et dans le cache
+    if not isinstance(jeton, str) or not FORMAT_JETON.fullmatch(jeton):
+        return
+    empreinte = _empreinte(jeton)
+    with obtenir_connexion() as conn:
+        conn.execute('DELETE FROM sessions WHERE empreinte = ?', (empreinte,))
+        conn.commit()
+    cache_sessions().invalider(empreinte)
+
+def fermer_sessions_utilisateur(conn, utilisateur_id):
+    # Révoque toutes les sessions d'un utilisateur (conn : base principale, transaction de l'appelant)
+    conn.execute('DELETE FROM sessions WHERE utilisateur_id = ?', (utilisateur_id,))
+
+def purger_sessions():
+    # Supprime les sessions expirées ; retourne leur nombre
+    with obtenir_connexion() as conn:
+        supprimees = conn.execute("DELETE FROM sessions WHERE date_expiration < datetime('now')").rowcount
+        conn.commit()
+    return supprimees
+
+@ressource
+def nettoyage_sessions():
+    """
+    Thread d'arrière-plan (un par processus) qui purge les sessions expirées toutes les
+    SESSIONS_PURGE_S secondes, hors des reruns des pages, et retente la recopie des fiches
+    de contact restées en attente (recopier_fiches).
+    """
+    def boucle():
+        while True:
+            try:
+                purger_sessions()
+            except Exception:
+                logging.getLogger(__name__).exception("Purge des sessions expirées impossible")
+            if len(CHEMINS_QUARTIERS) > 1:
+                try:
+                    recopier_fiches()
+                except Exception:
+                    logging.getLogger(__name__).exception("Recopie des fiches de contact impossible")
+            time.sleep(SESSIONS_PURGE_S)
+    thread = threading.Thread(target=boucle, name="voisins_sessions", daemon=True)
+    thread.start()
+    return thread
+
+# ---------- FONCTION POUR RÉINITIALISER LE MOT DE PASSE ----------
+
+def reinitialiser_mot_de_passe(email, telephone, nouveau_mot_de_passe, client=None): # Vérifie l'email et le téléphone pour l'identité, puis met à jour le mot de passe haché.
+  
+    # Tentatives limitées par email et par client, avant toute lecture, hachage ou écriture
+    attente = limiteur_tentatives().controler('reinitialisation', email, client)
+    if attente:
+        return False, str(TropDeTentatives(attente))
+    try:
+        # 1. Vérifier si l'utilisateur existe et si le téléphone correspond (dans toutes les bases)
+        user_id = chercher_compte('SELECT id FROM utilisateurs WHERE email = ? AND telephone = ?', (email, telephone))
+        
+        if user_id:
+            # 2. Hacher le nouveau mot de passe
+            nouveau_hash = hash_password(nouveau_mot_de_passe)
+            
+            # 3. Mettre à jour le mot de passe (base du quartier de l'utilisateur)
+            with connexion_de(user_id[0]) as conn:
+                conn.execute('UPDATE utilisateurs SET mot_de_passe = ? WHERE id = ?', (nouveau_hash, user_id[0]))
+                conn.commit()
+            # 4. Les sessions ouvertes avec l'ancien mot de passe sont révoquées (base principale)
+            with obtenir_connexion() as conn:
+                fermer_sessions_utilisateur(conn, user_id[0])
+                conn.commit()
+            cache_sessions().invalider()
+            limiteur_tentatives().liberer('reinitialisation', email, client)
+            return True, "Votre mot de passe a été réinitialisé avec succès !"
+        else:
+            return False, "Email ou numéro de téléphone non reconnu."
+    except Exception as e:
+        return False, f"Erreur lors de la réinitialisation : {str(e)}"
+
+# ---------- FONCTIONS POUR "PROPOSER UN SERVICE" ----------
+
+def creer_service(titre, categorie, description, type_service, prix, utilisateur_id):
+    # Crée une nouvelle annonce de service. Retourne (succès, message).
+    def ecriture(conn):
+        conn.execute('''INSERT INTO services (titre, categorie, description, type_service, prix, utilisateur_id)
+                        VALUES (?, ?, ?, ?, ?, ?)''',
+                     (titre, categorie, description, type_service, prix, utilisateur_id))
+    try:
+        # Écrivain unique de la base du proposant : validé avec les autres écritures en attente
+        ecrire(ecriture, quartier_de(utilisateur_id))
+        cache_catalogue().invalider()
+        cache_comptes().invalider(('mes_services', utilisateur_id))
+        return True, "Service publié avec succès !"
+    except Exception as e:
+        return False, f"Erreur lors de la publication : {e}"
+
+# ---------- FONCTIONS POUR "TROUVER UN SERVICE" ----------
+
+def obtenir_services(categorie=None, type_service=None, apres=None, limite=None,
+                     centre=None, rayon_km=None, decalage=0):
+    """
+    Services disponibles, du plus récent au plus ancien (pagination par clé).
+    apres : couple (date_creation, id) du dernier service de la page précédente ;
+    limite : nombre maximal de services retournés (None = tous).
+    centre, rayon_km : seuls les services proposés à moins de rayon_km du point
+    (latitude, longitude) sont retournés, du plus proche au plus éloigné ;
+    la pagination se fait alors par decalage.
+    Tous les quartiers sont interrogés en parallèle et leurs pages fusionnées dans le même ordre.
+    Le résultat est servi par le cache du catalogue quand il y est déjà.
+    """
+    if centre is None or rayon_km is None:
+        centre = rayon_km = None
+    cle = ('services', categorie, type_service, apres, limite, centre, rayon_km, decalage)
+    return cache_catalogue().obtenir(
+        cle, lambda: _lire_services(categorie, type_service, apres, limite, centre, rayon_km, decalage))
+
+def carre_englobant(centre, rayon_km):
+    # [lat min, lat max, lon min, lon max] du carré qui contient le cercle (contraintes de l'index R*Tree)
+    lat, lon = centre
+    ecart_lat = rayon_km / KM_PAR_DEGRE
+    ecart_lon = rayon_km / (KM_PAR_DEGRE * max(math.cos(math.radians(lat)), 0.01))
+    return [lat - ecart_lat, lat + ecart_lat, lon - ecart_lon, lon + ecart_lon]
+
+def _lire_services(categorie, type_service, apres, limite, centre=None, rayon_km=None, decalage=0):
+    if centre is not None:
+        return _lire_services_proches(categorie, type_service, limite, centre, rayon_km, decalage)
+    # Jointure avec la table utilisateurs pour afficher le nom du proposant
+    query = f'''SELECT {COLONNES_CATALOGUE}
+               FROM services s JOIN utilisateurs u ON s.utilisateur_id = u.id 
+               WHERE s.disponible = 1''' # N'affiche que les services marqués 'disponible'
+    params = []
+    
+    # Appliquer les filtres de recherche
+    if categorie and categorie != "Toutes":
+        query += ' AND s.categorie = ?'
+        params.append(categorie)
+    if type_service and type_service != "Tous":
+        query += ' AND s.type_service = ?'
+        params.append(type_service)
+    
+    # Reprise après le dernier service affiché : l'index est parcouru à partir de cette clé
+    if apres is not None:
+        query += ' AND (s.date_creation, s.id) < (?, ?)'
+        params.extend(apres)
+    
+    query += ' ORDER BY s.date_creation DESC, s.id DESC'
+    if limite is not None:
+        query += ' LIMIT ?'
+        params.append(limite)
+
+    def lire(numero):
+        with connexion_quartier(numero) as conn:
+            return lire_lignes(conn, Service, query, params)
+    # Chaque quartier fournit sa page après la même clé : la fusion garde les limite plus récents
+    return fusionner(sur_les_quartiers(lire), [(lambda s: (s.date_creation, s.id), True)], limite)
+
+def _lire_services_proches(categorie, type_service, limite, centre, rayon_km, decalage):
+    """
+    Services disponibles à moins de rayon_km du centre, du plus proche au plus récent.
+    La distance est calculée une fois par proposant trouvé par l'index R*Tree, la page est
+    triée sur l'index couvrant idx_services_dispo_utilisateur, et seules ses lignes sont
+    lues en entier. Le cercle est d'abord réduit (1/8, 1/4, 1/2 du rayon) : ses services
+    précèdent tous les autres, donc une page complète y est exacte sans lire les plus lointains.
+    """
+    filtres, params_filtres = '', []
+    if categorie and categorie != "Toutes":
+        filtres += ' AND s.categorie = ?'
+        params_filtres.append(categorie)
+    if type_service and type_service != "Tous":
+        filtres += ' AND s.type_service = ?'
+        params_filtres.append(type_service)
+    query = f'''WITH proches AS MATERIALIZED (
+                   SELECT id, distance_km(?, ?, min_lat, min_lon) AS distance FROM utilisateurs_position
+                   WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?),
+               page AS MATERIALIZED (
+                   SELECT s.id, p.distance FROM proches p JOIN services s ON s.utilisateur_id = p.id
+                   WHERE p.distance <= ? AND s.disponible = 1{filtres}
+                   ORDER BY p.distance, s.date_creation DESC, s.id DESC LIMIT ? OFFSET ?)
+               SELECT {COLONNES_CATALOGUE}, page.distance
+               FROM page JOIN services s ON s.id = page.id JOIN utilisateurs u ON s.utilisateur_id = u.id
+               ORDER BY page.distance, s.date_creation DESC, s.id DESC'''
+    limite_quartier, decalage_quartier = bornes_quartier(limite, decalage)
+    rayons = [rayon_km / 8, rayon_km / 4, rayon_km / 2, rayon_km] if limite is not None else [rayon_km]
+
+    def lire(numero):
+        with connexion_quartier(numero) as conn:
+            for rayon in rayons:
+                params = [*centre, *carre_englobant(centre, rayon), rayon, *params_filtres,
+                          -1 if limite_quartier is None else limite_quartier, decalage_quartier]
+                services = lire_lignes(conn, Service, query, params)
+                if limite_quartier is not None and len(services) == limite_quartier:
+                    break
+        return services
+    return fusionner(sur_les_quartiers(lire),
+                     [(lambda s: s.distance, False), (lambda s: (s.date_creation, s.id), True)], limite, decalage)
+
+def requete_fts(texte):
+    """
+    Transforme la saisie libre en requête FTS5 : chaque mot devient un préfixe
+    entre guillemets ("perc"* trouve "perceuse"), tous les mots doivent être présents.
+    Retourne None si la saisie ne contient aucun mot.
+    """
+    mots = re.findall(r'\w+', texte or '')
+    if not mots:
+        return None
+    return ' '.join(f'"{mot}"*' for mot in mots)
+
+def rechercher_services(texte, categorie=None, type_service=None, limite=None, decalage=0,
+                        centre=None, rayon_km=None):
+    """
+    Recherche plein texte dans les titres et descriptions des services disponibles,
+    classée par pertinence (bm25, le titre pèse plus que la description).
+    Accepte les mêmes filtres que obtenir_services ; decalage sert à la pagination.
+    Avec centre et rayon_km, seuls les services proches sont retenus (toujours classés par pertinence).
+    Avec plusieurs quartiers, les résultats sont fusionnés par score bm25, calculé dans chaque base.
+    """
+    if centre is None or rayon_km is None:
+        centre = rayon_km = None
+    requete = requete_fts(texte)
+    if requete is None:
+        return obtenir_services(categorie, type_service, limite=limite, centre=centre, rayon_km=rayon_km,
+                                decalage=decalage if centre is not None else 0)
+    cle = ('recherche', requete, categorie, type_service, limite, decalage, centre, rayon_km)
+    return cache_catalogue().obtenir(
+        cle, lambda: _lire_recherche(requete, categorie, type_service, limite, decalage, centre, rayon_km))
+
+def _lire_recherche(requete, categorie, type_service, limite, decalage, centre=None, rayon_km=None):
+    proches = jointure = ''
+    colonne = ', NULL'
+    params = []
+    if centre is not None:
+        # Résultats restreints aux proposants du cercle, dont la distance est calculée une seule fois
+        proches = '''WITH proches AS MATERIALIZED (
+                         SELECT id, distance_km(?, ?, min_lat, min_lon) AS distance FROM utilisateurs_position
+                         WHERE max_lat >= ? AND min_lat <= ? AND max_lon >= ? AND min_lon <= ?)
+                     '''
+        colonne, jointure = ', p.distance', ' JOIN proches p ON p.id = s.utilisateur_id AND p.distance <= ?'
+        params = [*centre, *carre_englobant(centre, rayon_km), rayon_km]
+    query = f'''{proches}SELECT {COLONNES_CATALOGUE}{colonne}, bm25(services_fts, 5.0, 1.0) AS pertinence
+               FROM services_fts f
+               JOIN services s ON s.id = f.rowid
+               JOIN utilisateurs u ON s.utilisateur_id = u.id{jointure}
+               WHERE services_fts MATCH ? AND s.disponible = 1'''
+    params.append(requete)
+    
+    if categorie and categorie != "Toutes":
+        query += ' AND s.categorie = ?'
+        params.append(categorie)
+    if type_service and type_service != "Tous":
+        query += ' AND s.type_service = ?'
+        params.append(type_service)
+    
+    limite_quartier, decalage_quartier = bornes_quartier(limite, decalage)
+    query += ' ORDER BY pertinence, s.id DESC LIMIT ? OFFSET ?'
+    params.extend([-1 if limite_quartier is None else limite_quartier, decalage_quartier])
+
+    def lire(numero):
+        with connexion_quartier(numero) as conn:
+            return lire_lignes(conn, Service, query, params)
+    return fusionner(sur_les_quartiers(lire), [(lambda s: s.pertinence, False), (lambda s: s.id, True)],
+                     limite, decalage)
+
+# Crée une demande de réservation pour un service. Retourne (succès, message).
+def creer_demande(service_id, demandeur_id, date_souhaitee, message):
+    # La demande est stockée avec le service ; un demandeur d'un autre quartier y laisse sa fiche de contact
+    numero = quartier_de(service_id)
+    fiches = []
+    if quartier_de(demandeur_id) != numero:
+        with connexion_de(demandeur_id) as conn:
+            fiches = conn.execute(f'SELECT {COLONNES_FICHE} FROM utilisateurs WHERE id = ?', (demandeur_id,)).fetchall()
+
+    def ecriture(conn):
+        copier_fiches(conn, fiches)
+        c = conn.execute('''INSERT INTO demandes (service_id, demandeur_id, date_souhaitee, message)
+                            VALUES (?, ?, ?, ?)''',
+                         (service_id, demandeur_id, date_souhaitee, message))
+        # Évènement écrit dans la même transaction que la demande
+        conn.execute('''INSERT INTO evenements (type, demande_id, proposant_id, demandeur_id, statut)
+                        SELECT 'demande', ?, utilisateur_id, ?, 'en_attente' FROM services WHERE id = ?''',
+                     (c.lastrowid, demandeur_id, service_id))
+    try:
+        ecrire(ecriture, numero)
+        cache_comptes().invalider(('recommandations', demandeur_id)) # Le service demandé quitte « Pour vous »
+        return True, "Demande envoyée !"
+    except Exception as e:
+        return False, f"Erreur lors de la création de la demande : {e}"
+
+# ---------- FONCTIONS POUR "MON COMPTE" ----------
+
+def obtenir_mes_services(utilisateur_id):
+    # Récupère les services proposés par l'utilisateur connecté (mémorisés jusqu'à sa prochaine écriture).
+    return cache_comptes().obtenir(('mes_services', utilisateur_id), lambda: _lire_mes_services(utilisateur_id))
+
+def _lire_mes_services(utilisateur_id):
+    with connexion_de(utilisateur_id) as conn:
+        return lire_lignes(
+            conn, Service,
+            f'SELECT {COLONNES_SERVICE} FROM services s WHERE s.utilisateur_id = ? ORDER BY s.date_creation DESC',
+            (utilisateur_id,)
+        )
+
+def mettre_a_jour_disponibilite_service(service_id, disponible):
+    # Met à jour la disponibilité d'un service (0=non disponible, 1=disponible).
+    def ecriture(conn):
+        return conn.execute('''UPDATE services SET disponible = ? WHERE id = ? RETURNING utilisateur_id''',
+                            (disponible, service_id)).fetchall()
+    try:
+        proprietaires = ecrire(ecriture, quartier_de(service_id))
+        cache_catalogue().invalider()
+        for (proprietaire,) in proprietaires:
+            cache_comptes().invalider(('mes_services', proprietaire))
+        return True
+    except Exception:
+        return False
+
+def obtenir_demandes_recues(utilisateur_id, ids=None):
+    # Récupère les demandes reçues pour les services de l'utilisateur (celui qui propose).
+    # ids : ne relire que ces demandes (mise à jour d'après le flux d'évènements)
+    with connexion_de(utilisateur_id) as conn: # Stockées avec ses services, dans la base de son quartier
+        query = f'''SELECT {COLONNES_DEMANDE}
+                   FROM demandes d
+                   JOIN services s ON d.service_id = s.id
+                   JOIN utilisateurs u ON d.demandeur_id = u.id
+                   WHERE s.utilisateur_id = ?'''
+        params = [utilisateur_id]
+        if ids is not None:
+            query += ' AND d.id IN (SELECT value FROM json_each(?))'
+            params.append(json.dumps(list(ids)))
+        query += ' ORDER BY d.date_demande DESC'
+        return lire_lignes(conn, Demande, query, params)
+
+def obtenir_mes_demandes_initiees(demandeur_id, ids=None):
+    """
+    Récupère les demandes faites par l'utilisateur (en tant que demandeur).
+    ids : ne relire que ces demandes (mise à jour d'après le flux d'évènements).
+    Les demandes sont stockées avec les services demandés : tous les quartiers sont
+    interrogés (seulement ceux de ids s'il est donné).
+    """
+    query = f'''SELECT {COLONNES_DEMANDE}
+               FROM demandes d
+               JOIN services s ON d.service_id = s.id
+               JOIN utilisateurs u ON s.utilisateur_id = u.id
+               WHERE d.demandeur_id = ?'''
+    params = [demandeur_id]
+    numeros = None
+    if ids is not None:
+        query += ' AND d.id IN (SELECT value FROM json_each(?))'
+        params.append(json.dumps(list(ids)))
+        numeros = sorted({quartier_de(i) for i in ids}) or [0]
+    query += ' ORDER BY d.date_demande DESC'
+
+    def lire(numero):
+        with connexion_quartier(numero) as conn:
+            return lire_lignes(conn, Demande, query, params)
+    return fusionner(sur_les_quartiers(lire, numeros), [(lambda d: d.date_demande, True)])
+
+def mettre_a_jour_statut_demande(demande_id, nouveau_statut):
+    """Met à jour le statut d'une demande de service (en_attente, acceptee, refusee)."""
+    def ecriture(conn):
+        if conn.execute('''UPDATE demandes SET statut = ? WHERE id = ?''', (nouveau_statut, demande_id)).rowcount:
+            conn.execute('''INSERT INTO evenements (type, demande_id, proposant_id, demandeur_id, statut)
+                            SELECT 'statut', d.id, s.utilisateur_id, d.demandeur_id, d.statut
+                            FROM demandes d JOIN services s ON d.service_id = s.id WHERE d.id = ?''',
+                         (demande_id,))
+    try:
+        ecrire(ecriture, quartier_de(demande_id))
+        return True
+    except Exception as e:
+        return False
+
+def mettre_a_jour_utilisateur(user_id, nom, prenom, email, adresse, telephone):
+   # Met à jour les informations de profil de l'utilisateur.
+   # Le compte reste dans la base de son quartier d'inscription, même si l'adresse change.
+    try:
+        with connexion_de(user_id) as conn:
+            c = conn.cursor()
+            c.execute('''UPDATE utilisateurs 
+                         SET nom = ?, prenom = ?, adresse = ?, telephone = ?
+                         WHERE id = ?''',
+                      (nom, prenom, adresse, telephone, user_id))
+            positionner_utilisateurs(conn, [(user_id, adresse)])
+            conn.commit()
+        if len(CHEMINS_QUARTIERS) > 1:
+            # Fiches de contact des autres quartiers : mises à jour ensuite, retentées en cas d'échec
+            with obtenir_connexion() as conn:
+                conn.execute('''INSERT INTO fiches_a_recopier (utilisateur_id) VALUES (?)
+                                ON CONFLICT (utilisateur_id) DO UPDATE SET version = version + 1''', (user_id,))
+                conn.commit()
+            recopier_fiches([user_id])
+        cache_catalogue().invalider() # Le catalogue affiche le nom et les coordonnées du proposant
+        cache_sessions().invalider() # Les sessions restaurées reprennent le profil à jour
+        return True, "Profil mis à jour avec succès !"
+    except sqlite3.IntegrityError:
+        return False, "Cet email est déjà utilisé par un autre compte."
+    except Exception as e:
+        return False, f"Erreur de mise à jour : {str(e)}"
+
+def recopier_fiches(utilisateur_ids=None):
+    """
+    Met à jour, dans les autres quartiers, les fiches de contact des profils en attente
+    (fiches_a_recopier, tous par défaut). Un profil dont une base échoue reste en attente :
+    il est retenté par le thread de nettoyage_sessions. Retourne le nombre de profils restants.
+    """
+    with obtenir_connexion() as conn:
+        attente = conn.execute('SELECT utilisateur_id, version FROM fiches_a_recopier').fetchall()
+    if utilisateur_ids is not None:
+        attente = [(i, version) for i, version in attente if i in utilisateur_ids]
+    restants = 0
+    for utilisateur_id, version in attente:
+        numero = quartier_de(utilisateur_id)
+        with connexion_quartier(numero) as conn:
+            fiche = conn.execute('SELECT nom, prenom, adresse, telephone, id FROM utilisateurs WHERE id = ?',
+                                 (utilisateur_id,)).fetchone()
+
+        def recopier(autre):
+            with connexion_quartier(autre) as conn:
+                conn.execute('UPDATE utilisateurs SET nom = ?, prenom = ?, adresse = ?, telephone = ? WHERE id = ?',
+                             fiche)
+                conn.commit()
+        try:
+            if fiche:
+                sur_les_quartiers(recopier, [autre for autre in range(len(CHEMINS_QUARTIERS)) if autre != numero])
+        except Exception:
+            logging.getLogger(__name__).exception("Recopie des fiches de l'utilisateur %s impossible", utilisateur_id)
+            restants += 1
+            continue
+        with obtenir_connexion() as conn:
+            conn.execute('DELETE FROM fiches_a_recopier WHERE utilisateur_id = ? AND version = ?',
+                         (utilisateur_id, version))
+            conn.commit()
+    return restants
+
+def position_utilisateur(utilisateur_id):
+    # (latitude, longitude) d'un utilisateur d'après son adresse, None si elle n'est pas localisée
+    with connexion_de(utilisateur_id) as conn:
+        ligne = conn.execute('SELECT min_lat, min_lon FROM utilisateurs_position WHERE id = ?',
+                             (utilisateur_id,)).fetchone()
+    return tuple(ligne) if ligne else None
+
+# ---------- FLUX D'ÉVÈNEMENTS DES DEMANDES ----------
+
+def _dernier_evenement(numero):
+    with connexion_quartier(numero) as conn:
+        return conn.execute('SELECT COALESCE(MAX(id), 0) FROM evenements').fetchone()[0]
+
+def dernier_evenement():
+    # Curseur de départ du flux : identifiant du dernier évènement écrit dans chaque base (0 si aucun)
+    return tuple(sur_les_quartiers(_dernier_evenement))
+
+def evenements_depuis(utilisateur_id, curseur):
+    """
+    Évènements postérieurs à curseur (un identifiant par base, voir dernier_evenement) qui
+    concernent l'utilisateur (comme proposant ou comme demandeur). Retourne (évènements,
+    nouveau curseur). Le dernier identifiant de chaque base est lu d'abord sur la clé
+    primaire : sans nouvel évènement, rien d'autre n'est lu.
+    """
+    def lire(numero):
+        with connexion_quartier(numero) as conn:
+            dernier = conn.execute('SELECT COALESCE(MAX(id), 0) FROM evenements').fetchone()[0]
+            if dernier <= curseur[numero]:
+                return [], curseur[numero]
+            evenements = lire_lignes(
+                conn, Evenement,
+                '''SELECT id, type, demande_id, proposant_id, demandeur_id, statut, date_evenement
+                   FROM evenements WHERE id > ? AND id <= ? AND (proposant_id = ? OR demandeur_id = ?)
+                   ORDER BY id''',
+                (curseur[numero], dernier, utilisateur_id, utilisateur_id))
+        return evenements, dernier
+    resultats = sur_les_quartiers(lire)
+    evenements = fusionner([evenements for evenements, _ in resultats], [(lambda e: (e.date_evenement, e.id), False)])
+    return evenements, tuple(dernier for _, dernier in resultats)
+
+# ---------- COMPTEURS (BADGES ET FILTRES) ----------
+
+def compter_demandes_en_attente(utilisateur_id):
+    # Demandes en attente reçues par un proposant : une ligne lue par clé primaire, sans COUNT(*)
+    with connexion_de(utilisateur_id) as conn:
+        ligne = conn.execute('SELECT en_attente FROM compteurs_demandes WHERE utilisateur_id = ?',
+                             (utilisateur_id,)).fetchone()
+    return ligne[0] if ligne else 0
+
+def compter_services_disponibles():
+    # {(categorie, type_service): nombre de services disponibles}, servi par le cache du catalogue
+    return cache_catalogue().obtenir(('compteurs',), _lire_compteurs_services)
+
+def _lire_compteurs_services():
+    def lire(numero):
+        with connexion_quartier(numero) as conn:
+            return conn.execute('SELECT categorie, type_service, disponibles FROM compteurs_services').fetchall()
+    compteurs = {}
+    for lignes in sur_les_quartiers(lire): # Somme des compteurs de chaque quartier
+        for categorie, type_service, nombre in lignes:
+            compteurs[(categorie, type_service)] = compteurs.get((categorie, type_service), 0) + nombre
+    return compteurs
+
+def verifier_compteurs(reparer=False):
+    """
+    Compare les tables de compteurs à un recomptage complet des demandes et des services.
+    Retourne la liste des écarts (table, clé, valeur stockée, valeur attendue) ; avec
+    reparer=True, les deux tables sont reconstruites dans la même transaction.
+    Chaque base de quartier est vérifiée (et réparée) séparément.
+    """
+    ecarts = []
+    for numero in range(len(CHEMINS_QUARTIERS)):
+        with connexion_quartier(numero) as conn:
+            conn.execute('BEGIN IMMEDIATE')  # instantané cohérent : aucune écriture pendant le recomptage
+            try:
+                ecarts_base = []
+                for table, comptage, stockes in (
+                        ('compteurs_demandes', COMPTAGE_DEMANDES_EN_ATTENTE,
+                         'SELECT utilisateur_id, en_attente FROM compteurs_demandes'),
+                        ('compteurs_services', COMPTAGE_SERVICES_DISPONIBLES,
+                         'SELECT categorie, type_service, disponibles FROM compteurs_services')):
+                    attendus = {tuple(ligne[:-1]): ligne[-1] for ligne in conn.execute(comptage).fetchall()}
+                    actuels = {tuple(ligne[:-1]): ligne[-1] for ligne in conn.execute(stockes).fetchall()}
+                    for cle in sorted(attendus.keys() | actuels.keys(), key=str):
+                        if attendus.get(cle, 0) != actuels.get(cle, 0):
+                            ecarts_base.append((table, cle, actuels.get(cle, 0), attendus.get(cle, 0)))
+                if reparer and ecarts_base:
+                    conn.execute('DELETE FROM compteurs_demandes')
+                    conn.execute('DELETE FROM compteurs_services')
+                    conn.execute('INSERT INTO compteurs_demandes (utilisateur_id, en_attente) ' + COMPTAGE_DEMANDES_EN_ATTENTE)
+                    conn.execute('INSERT INTO compteurs_services (categorie, type_service, disponibles) '
+                                 + COMPTAGE_SERVICES_DISPONIBLES)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        ecarts.extend(ecarts_base)
+    if reparer and ecarts:
+        cache_catalogue().invalider()
+    return ecarts
+
+# ---------- ARCHIVAGE (DONNÉES FROIDES) ----------
+
+# Rétention dans les tables actives, en jours, et nombre de lignes déplacées par transaction
+ARCHIVE_JOURS_DEMANDES = int(os.environ.get("VOISINS_ARCHIVE_JOURS_DEMANDES", "180"))
+ARCHIVE_JOURS_SERVICES = int(os.environ.get("VOISINS_ARCHIVE_JOURS_SERVICES", "365"))
+ARCHIVE_TAILLE_LOT = int(os.environ.get("VOISINS_ARCHIVE_TAILLE_LOT", "1000"))
+
+# Candidats à l'archivage, les plus anciens d'abord (index partiels idx_services_inactifs
+# et idx_demandes_closes, sur la date de clôture). Un service qui a encore une demande en attente reste actif.
+SERVICES_A_ARCHIVER = '''SELECT s.id FROM services s
+    WHERE s.disponible = 0 AND COALESCE(s.date_desactivation, s.date_creation) < datetime('now', ?)
+      AND NOT EXISTS (SELECT 1 FROM demandes d WHERE d.service_id = s.id AND d.statut = 'en_attente')
+    ORDER BY COALESCE(s.date_desactivation, s.date_creation) LIMIT ?'''
+DEMANDES_A_ARCHIVER = '''SELECT id FROM demandes
+    WHERE statut <> 'en_attente' AND COALESCE(date_cloture, date_demande) < datetime('now', ?)
+    ORDER BY COALESCE(date_cloture, date_demande) LIMIT ?'''
+
+def _archiver_demandes(conn, condition, lot):
+    # Copie dans demandes_archive (avec proposant et titre du service) puis supprime les demandes du lot
+    conn.execute(f'''INSERT INTO demandes_archive
+                        (id, service_id, demandeur_id, proposant_id, titre, date_demande, date_souhaitee, statut, message)
+                     SELECT d.id, d.service_id, d.demandeur_id, s.utilisateur_id, s.titre, d.date_demande,
+                            d.date_souhaitee, d.statut, d.message
+                     FROM demandes d LEFT JOIN services s ON d.service_id = s.id
+                     WHERE d.{condition} IN (SELECT value FROM json_each(?))''', (lot,))
+    conn.execute(f'DELETE FROM demandes WHERE {condition} IN (SELECT value FROM json_each(?))', (lot,))
+
+def archiver(jours_demandes=ARCHIVE_JOURS_DEMANDES, jours_services=ARCHIVE_JOURS_SERVICES,
+             taille_lot=ARCHIVE_TAILLE_LOT):
+    """
+    Déplace vers les tables d'archive, par transactions de taille_lot lignes au plus :
+    - les services désactivés depuis plus de jours_services jours (sans demande en
+      attente), avec toutes leurs demandes ;
+    - les demandes acceptées ou refusées depuis plus de jours_demandes jours.
+    Les demandes en attente et les services disponibles ne sont jamais archivés : les
+    compteurs, l'index plein texte et les index partiels du catalogue ne changent pas.
+    Chaque lot est une transaction courte : l'application continue d'écrire entre deux lots.
+    Les bases des quartiers sont archivées l'une après l'autre.
+    Retourne le nombre de services et de demandes archivés.
+    """
+    totaux = {'services': 0, 'demandes': 0}
+    for numero in range(len(CHEMINS_QUARTIERS)):
+        with connexion_quartier(numero) as conn:
+            for table, requete, jours in (('services', SERVICES_A_ARCHIVER, jours_services),
+                                          ('demandes', DEMANDES_A_ARCHIVER, jours_demandes)):
+                while True:
+                    conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        ids = [ligne[0] for ligne in conn.execute(requete, (f'-{jours} days', taille_lot)).fetchall()]
+                        lot = json.dumps(ids)
+                        if table == 'services':
+                            _archiver_demandes(conn, 'service_id', lot)
+                            conn.execute('''INSERT INTO services_archive
+                                                (id, titre, categorie, description, type_service, prix, utilisateur_id,
+                                                 disponible, date_creation, date_desactivation)
+                                             SELECT id, titre, categorie, description, type_service, prix, utilisateur_id,
+                                                    disponible, date_creation, date_desactivation
+                                             FROM services WHERE id IN (SELECT value FROM json_each(?))''', (lot,))
+                            conn.execute('DELETE FROM services WHERE id IN (SELECT value FROM json_each(?))', (lot,))
+                        else:
+                            _archiver_demandes(conn, 'id', lot)
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                    totaux[table] += len(ids)
+                    if len(ids) < taille_lot:
+                        break
+    if totaux['services']:
+        cache_comptes().invalider()
+    return totaux
+
+def obtenir_services_archives(utilisateur_id, limite, decalage=0):
+    # Historique des services archivés de l'utilisateur, du plus récent au plus ancien
+    with connexion_de(utilisateur_id) as conn:
+        return lire_lignes(
+            conn, Service,
+            f'''SELECT {COLONNES_SERVICE} FROM services_archive s WHERE s.utilisateur_id = ?
+                ORDER BY s.date_creation DESC LIMIT ? OFFSET ?''',
+            (utilisateur_id, limite, decalage))
+
+def obtenir_demandes_archivees(utilisateur_id, recues, limite, decalage=0):
+    """
+    Historique des demandes archivées : reçues (recues=True, coordonnées du demandeur)
+    ou envoyées (coordonnées du proposant), de la plus récente à la plus ancienne.
+    Les demandes reçues sont dans la base du quartier de l'utilisateur ; les demandes
+    envoyées sont cherchées dans tous les quartiers.
+    """
+    jointure, filtre = ('d.demandeur_id', 'd.proposant_id') if recues else ('d.proposant_id', 'd.demandeur_id')
+    limite_quartier, decalage_quartier = (limite, decalage) if recues else bornes_quartier(limite, decalage)
+
+    def lire(numero):
+        with connexion_quartier(numero) as conn:
+            return lire_lignes(
+                conn, Demande,
+                f'''SELECT {COLONNES_DEMANDE_ARCHIVE}
+                    FROM demandes_archive d JOIN utilisateurs u ON {jointure} = u.id
+                    WHERE {filtre} = ?
+                    ORDER BY d.date_demande DESC LIMIT ? OFFSET ?''',
+                (utilisateur_id, limite_quartier, decalage_quartier))
+    if recues:
+        return lire(quartier_de(utilisateur_id))
+    return fusionner(sur_les_quartiers(lire), [(lambda d: d.date_demande, True)], limite, decalage)
+
+# ---------- RECOMMANDATIONS (« POUR VOUS ») ----------
+
+# Suggestions enregistrées par utilisateur ; services candidats, toutes bases confondues (les plus
+# demandés, et les plus récents pour que les nouvelles annonces aient leur chance) ; proposants
+# retenus dans la matrice de co-occurrence (les plus demandés parmi ceux des candidats)
+RECOMMANDATIONS_PAR_UTILISATEUR = int(os.environ.get("VOISINS_RECOMMANDATIONS", "20"))
+RECOMMANDATIONS_CANDIDATS = int(os.environ.get("VOISINS_RECOMMANDATIONS_CANDIDATS", "2000"))
+RECOMMANDATIONS_RECENTS = int(os.environ.get("VOISINS_RECOMMANDATIONS_RECENTS", "500"))
+RECOMMANDATIONS_PROPOSANTS = int(os.environ.get("VOISINS_RECOMMANDATIONS_PROPOSANTS", "512"))
+# Utilisateurs calculés ensemble (matrices de RECOMMANDATIONS_BLOC lignes) et écrits par transaction
+RECOMMANDATIONS_BLOC = 4096
+RECOMMANDATIONS_LOT_ECRITURE = 1000
+# Score = affinité pour la catégorie + POIDS_PROPOSANT × affinité pour le proposant + POIDS_POPULARITE × popularité
+POIDS_PROPOSANT = 1.0
+POIDS_POPULARITE = 0.2
+
+# Candidats d'une base : (id, catégorie, proposant, nombre de demandes, date de création)
+SERVICES_POPULAIRES = '''SELECT s.id, s.categorie, s.utilisateur_id, p.n, s.date_creation
+    FROM (SELECT service_id, COUNT(*) AS n FROM demandes GROUP BY service_id ORDER BY n DESC LIMIT ?) p
+    JOIN services s ON s.id = p.service_id WHERE s.disponible = 1'''
+SERVICES_RECENTS = '''SELECT s.id, s.categorie, s.utilisateur_id, 0, s.date_creation FROM services s
+    WHERE s.disponible = 1 ORDER BY s.date_creation DESC, s.id DESC LIMIT ?'''
+
+def _indices(tries, valeurs):
+    # Position de chaque valeur dans le tableau trié tries, -1 si elle n'y est pas
+    import numpy as np
+    if not len(tries):
+        return np.full(len(valeurs), -1, dtype=np.int64)
+    positions = np.minimum(np.searchsorted(tries, valeurs), len(tries) - 1)
+    return np.where(tries[positions] == valeurs, positions, -1)
+
+def _creuse(utilisateurs, demandeurs, colonnes, poids):
+    # Matrice creuse (lignes triées, colonnes, poids) : une ligne par utilisateur (rang dans utilisateurs)
+    import numpy as np
+    garder = colonnes >= 0
+    lignes = np.searchsorted(utilisateurs, demandeurs[garder])
+    ordre = np.argsort(lignes, kind='stable')
+    return lignes[ordre], colonnes[garder][ordre], poids[garder][ordre]
+
+def _bloc_dense(matrice, debut, fin, largeur):
+    # Lignes [debut, fin) d'une matrice creuse, en tableau dense float32
+    import numpy as np
+    lignes, colonnes, poids = matrice
+    a, b = np.searchsorted(lignes, (debut, fin))
+    bloc = np.bincount((lignes[a:b] - debut) * largeur + colonnes[a:b], weights=poids[a:b],
+                       minlength=(fin - debut) * largeur)
+    return bloc.reshape(fin - debut, largeur).astype(np.float32)
+
+def _normaliser_lignes(bloc):
+    # Chaque ligne divisée par sa somme (répartition des demandes), lignes vides laissées à zéro
+    import numpy as np
+    sommes = bloc.sum(axis=1, keepdims=True)
+    return np.divide(bloc, sommes, out=np.zeros_like(bloc), where=sommes > 0)
+
+def _cosinus(cooccurrence):
+    # Co-occurrence normalisée : nombre de voisins communs / racine du produit des effectifs
+    import numpy as np
+    norme = np.sqrt(np.diag(cooccurrence))
+    produit = np.outer(norme, norme)
+    return np.divide(cooccurrence, produit, out=np.zeros_like(cooccurrence), where=produit > 0).astype(np.float32)
+
+def _lire_candidats(numero):
+    with connexion_quartier(numero) as conn:
+        return (conn.execute(SERVICES_POPULAIRES, (2 * RECOMMANDATIONS_CANDIDATS,)).fetchall(),
+                conn.execute(SERVICES_RECENTS, (RECOMMANDATIONS_RECENTS,)).fetchall())
+
+def _construire_modele():
+    """
+    Services candidats du modèle (tableaux NumPy triés par identifiant) : catégorie, proposant,
+    popularité (log du nombre de demandes, ramené entre 0 et 1) et proposants retenus.
+    None si aucun service n'est disponible.
+    """
+    import numpy as np
+    lus = sur_les_quartiers(_lire_candidats)
+    populaires = sorted((ligne for lignes, _ in lus for ligne in lignes), key=lambda l: (l[3], l[0]), reverse=True)
+    recents = sorted((ligne for _, lignes in lus for ligne in lignes), key=lambda l: (l[4], l[0]), reverse=True)
+    candidats = {}
+    for ligne in populaires[:RECOMMANDATIONS_CANDIDATS] + recents[:RECOMMANDATIONS_RECENTS]:
+        candidats.setdefault(ligne[0], ligne)
+    if not candidats:
+        return None
+    lignes = sorted(candidats.values())
+    index_categories = {categorie: i for i, categorie in enumerate(CATEGORIES)}
+    proprietaires = np.array([ligne[2] for ligne in lignes], dtype=np.int64)
+    demandes = np.log1p(np.array([ligne[3] for ligne in lignes], dtype=np.float64))
+    # Proposants retenus : ceux dont les services candidats totalisent le plus de demandes
+    uniques, inverse = np.unique(proprietaires, return_inverse=True)
+    totaux = np.bincount(inverse, weights=demandes, minlength=len(uniques))
+    proposants = np.sort(uniques[np.argsort(-totaux, kind='stable')[:RECOMMANDATIONS_PROPOSANTS]])
+    position = _indices(proposants, proprietaires)
+    return {
+        'bases': np.array(len(CHEMINS_QUARTIERS)),
+        'candidats': np.array([ligne[0] for ligne in lignes], dtype=np.int64),
+        'candidats_categorie': np.array([index_categories.get(ligne[1], len(CATEGORIES) - 1) for ligne in lignes]),
+        # Proposant non retenu : colonne nulle ajoutée après les proposants retenus
+        'candidats_proposant': np.where(position >= 0, position, len(proposants)),
+        'candidats_proprietaire': proprietaires,
+        'popularite': (demandes / max(demandes.max(), 1.0)).astype(np.float32),
+        'proposants': proposants,
+    }
+
+def _tableau(curseur, largeur):
+    # Lignes (entières) du curseur en tableau NumPy, converties par paquets pour borner la mémoire
+    import numpy as np
+    morceaux = [np.array(lignes, dtype=np.int64) for lignes in iter(lambda: curseur.fetchmany(100000), [])]
+    return np.concatenate(morceaux) if morceaux else np.zeros((0, largeur), dtype=np.int64)
+
+def _lire_historique(modele, demandeurs=None):
+    """
+    Historique des demandeurs (tous, ou seulement ceux de demandeurs) en matrices creuses dont les
+    lignes suivent 'utilisateurs' : demandes par catégorie, par proposant retenu (une demande acceptée
+    compte double) et candidats déjà demandés. Chaque base fournit ses demandes et les services
+    demandés, joints avec NumPy : sur tout l'historique, c'est bien plus rapide qu'une jointure SQL.
+    """
+    import numpy as np
+    conditions, filtre = ['demandeur_id IS NOT NULL'], []
+    if demandeurs is not None:
+        conditions.append('demandeur_id IN (SELECT value FROM json_each(?))')
+        filtre.append(json.dumps(demandeurs))
+    condition = ' AND '.join(conditions)
+    categorie = 'CASE categorie ' + ' '.join('WHEN ? THEN ?' for _ in CATEGORIES) + f' ELSE {len(CATEGORIES) - 1} END'
+    params_categorie = [valeur for rang, nom in enumerate(CATEGORIES) for valeur in (nom, rang)]
+
+    def lire(numero):
+        with connexion_quartier(numero) as conn:
+            demandes = _tableau(conn.execute(
+                f"SELECT demandeur_id, service_id, 1 + (statut = 'acceptee') FROM demandes WHERE {condition}",
+                filtre), 3)
+            services = _tableau(conn.execute(
+                f'''SELECT id, COALESCE(utilisateur_id, 0), {categorie} FROM services
+                    {'' if demandeurs is None else f'WHERE id IN (SELECT service_id FROM demandes WHERE {condition})'}
+                    ORDER BY id''', params_categorie + filtre), 3)
+        # Jointure demandes -> services (les demandes d'un service archivé sont ignorées)
+        rang = _indices(services[:, 0], demandes[:, 1])
+        return demandes[rang >= 0], services[rang[rang >= 0]]
+    lus = sur_les_quartiers(lire)
+    demandes = np.concatenate([demandes for demandes, _ in lus])
+    services = np.concatenate([services for _, services in lus])
+    utilisateurs, poids = np.unique(demandes[:, 0]), demandes[:, 2].astype(np.float64)
+    return {
+        'utilisateurs': utilisateurs,
+        'categories': _creuse(utilisateurs, demandes[:, 0], services[:, 2], poids),
+        'proposants': _creuse(utilisateurs, demandes[:, 0], _indices(modele['proposants'], services[:, 1]), poids),
+        'faites': _creuse(utilisateurs, demandes[:, 0], _indices(modele['candidats'], demandes[:, 1]), poids)[:2],
+    }
+
+def _cooccurrences(modele, historique):
+    # Matrices de co-occurrence (cosinus) des catégories et des proposants retenus, calculées par blocs
+    # d'utilisateurs : deux colonnes co-occurrent quand un même voisin a demandé dans les deux
+    import numpy as np
+    nombre, largeurs = len(historique['utilisateurs']), {'categories': len(CATEGORIES), 'proposants': len(modele['proposants'])}
+    for nom, largeur in largeurs.items():
+        cooccurrence = np.zeros((largeur, largeur), dtype=np.float32)
+        for debut in range(0, nombre, RECOMMANDATIONS_BLOC):
+            bloc = (_bloc_dense(historique[nom], debut, min(debut + RECOMMANDATIONS_BLOC, nombre), largeur) > 0)
+            bloc = bloc.astype(np.float32)
+            cooccurrence += bloc.T @ bloc
+        modele[f'cooccurrence_{nom}'] = _cosinus(cooccurrence)
+
+def _suggestions(modele, historique):
+    """
+    Meilleurs candidats de chaque utilisateur de l'historique, calculés par blocs de matrices :
+    l'affinité d'un voisin pour une catégorie (un proposant) est sa répartition de demandes
+    multipliée par la matrice de co-occurrence. Ses propres services et ceux qu'il a déjà
+    demandés sont exclus. Produit (utilisateur_id, [(service_id, score), ...]).
+    """
+    import numpy as np
+    utilisateurs = historique['utilisateurs']
+    nombre = min(RECOMMANDATIONS_PAR_UTILISATEUR, len(modele['candidats']))
+    popularite = POIDS_POPULARITE * modele['popularite']
+    for debut in range(0, len(utilisateurs), RECOMMANDATIONS_BLOC):
+        fin = min(debut + RECOMMANDATIONS_BLOC, len(utilisateurs))
+        categories = _normaliser_lignes(_bloc_dense(historique['categories'], debut, fin, len(CATEGORIES)))
+        proposants = _normaliser_lignes(_bloc_dense(historique['proposants'], debut, fin, len(modele['proposants'])))
+        affinite_categories = categories @ modele['cooccurrence_categories']
+        affinite_proposants = np.hstack([proposants @ modele['cooccurrence_proposants'],
+                                         np.zeros((fin - debut, 1), dtype=np.float32)])
+        scores = (affinite_categories[:, modele['candidats_categorie']]
+                  + POIDS_PROPOSANT * affinite_proposants[:, modele['candidats_proposant']] + popularite)
+        scores[modele['candidats_proprietaire'][None, :] == utilisateurs[debut:fin, None]] = -np.inf
+        lignes, colonnes = historique['faites']
+        a, b = np.searchsorted(lignes, (debut, fin))
+        scores[lignes[a:b] - debut, colonnes[a:b]] = -np.inf
+        # Sélection partielle des meilleurs, puis tri de ces seuls candidats
+        meilleurs = np.argpartition(-scores, nombre - 1, axis=1)[:, :nombre]
+        meilleurs = np.take_along_axis(
+            meilleurs, np.argsort(-np.take_along_axis(scores, meilleurs, axis=1), axis=1, kind='stable'), axis=1)
+        valeurs = np.take_along_axis(scores, meilleurs, axis=1).tolist()
+        services = modele['candidats'][meilleurs].tolist()
+        for i, utilisateur in enumerate(utilisateurs[debut:fin].tolist()):
+            yield utilisateur, [(service, score) for service, score in zip(services[i], valeurs[i])
+                                if score != -math.inf]
+
+def _populaires(modele):
+    # Suggestions des voisins sans historique (utilisateur 0) : les candidats les plus demandés
+    import numpy as np
+    ordre = np.lexsort((-modele['candidats'], -modele['popularite']))[:RECOMMANDATIONS_PAR_UTILISATEUR]
+    return 0, list(zip(modele['candidats'][ordre].tolist(), modele['popularite'][ordre].tolist()))
+
+def _enregistrer_suggestions(suggestions):
+    """
+    Remplace les suggestions de ces utilisateurs dans la base de leur quartier, par transactions
+    de RECOMMANDATIONS_LOT_ECRITURE utilisateurs : l'application continue d'écrire entre deux lots.
+    Retourne le nombre d'utilisateurs écrits.
+    """
+    lots, nombre = {}, 0
+
+    def vider(numero):
+        utilisateurs, lignes = lots.pop(numero)
+        with connexion_quartier(numero) as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.execute('DELETE FROM recommandations WHERE utilisateur_id IN (SELECT value FROM json_each(?))',
+                             (json.dumps(utilisateurs),))
+                conn.executemany('INSERT INTO recommandations (utilisateur_id, rang, service_id, score) VALUES (?, ?, ?, ?)',
+                                 lignes)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    for utilisateur, services in suggestions:
+        numero = quartier_de(utilisateur)
+        utilisateurs, lignes = lots.setdefault(numero, ([], []))
+        utilisateurs.append(utilisateur)
+        lignes.extend((utilisateur, rang, service, score) for rang, (service, score) in enumerate(services))
+        nombre += 1
+        if len(utilisateurs) >= RECOMMANDATIONS_LOT_ECRITURE:
+            vider(numero)
+    for numero in list(lots):
+        vider(numero)
+    return nombre
+
+def _charger_modele():
+    # Modèle enregistré par le dernier calcul complet (None s'il manque ou date d'un autre découpage)
+    import numpy as np
+    with connexion_quartier(0) as conn:
+        ligne = conn.execute("SELECT valeur FROM parametres WHERE cle = 'recommandations_modele'").fetchone()
+    if ligne is None:
+        return None
+    with np.load(io.BytesIO(ligne[0])) as archive:
+        modele = {cle: archive[cle] for cle in archive.files}
+    return modele if int(modele['bases']) == len(CHEMINS_QUARTIERS) else None
+
+def _etat_recommandations(numero):
+    # (dernière demande traitée, None au premier passage ; dernière demande de la base)
+    with connexion_quartier(numero) as conn:
+        ligne = conn.execute("SELECT valeur FROM parametres WHERE cle = 'recommandations_curseur'").fetchone()
+        return (int(ligne[0]) if ligne else None,
+                conn.execute('SELECT COALESCE(MAX(id), 0) FROM demandes').fetchone()[0])
+
+def _nouveaux_demandeurs(numero, curseur, borne):
+    with connexion_quartier(numero) as conn:
+        return [demandeur for (demandeur,) in conn.execute(
+            'SELECT DISTINCT demandeur_id FROM demandes WHERE id > ? AND id <= ?', (curseur, borne)).fetchall()]
+
+def rafraichir_recommandations(complet=False):
+    """
+    Met à jour les suggestions « Pour vous » (table recommandations), à lancer périodiquement :
+    - complet, ou sans modèle enregistré : les services candidats et les matrices de co-occurrence
+      des catégories et des proposants sont reconstruits depuis tout l'historique des demandes,
+      puis tous les demandeurs sont recalculés (et la liste des services populaires, utilisateur 0) ;
+    - sinon, seuls les demandeurs qui ont envoyé une demande depuis le dernier passage (curseur
+      par base) sont recalculés, avec le modèle enregistré par le dernier calcul complet.
+    Les calculs sont vectorisés (NumPy, blocs de RECOMMANDATIONS_BLOC utilisateurs).
+    Retourne {'complet': ..., 'utilisateurs': nombre d'utilisateurs recalculés}.
+    """
+    import numpy as np
+    etats = sur_les_quartiers(_etat_recommandations)
+    modele = None if complet or any(curseur is None for curseur, _ in etats) else _charger_modele()
+    complet = modele is None
+    demandeurs = None
+    if complet:
+        modele = _construire_modele()
+    else:
+        nouveaux = sur_les_quartiers(lambda numero: _nouveaux_demandeurs(numero, *etats[numero]))
+        demandeurs = sorted({demandeur for lus in nouveaux for demandeur in lus})
+
+    nombre = 0
+    if modele is not None and demandeurs != []:
+        historique = _lire_historique(modele, demandeurs)
+        if complet:
+            _cooccurrences(modele, historique)
+        suggestions = _suggestions(modele, historique)
+        nombre = _enregistrer_suggestions(itertools.chain([_populaires(modele)], suggestions) if complet
+                                          else suggestions)
+        if complet:
+            tampon = io.BytesIO()
+            np.savez(tampon, **modele)
+            with connexion_quartier(0) as conn:
+                conn.execute("INSERT OR REPLACE INTO parametres (cle, valeur) VALUES ('recommandations_modele', ?)",
+                             (tampon.getvalue(),))
+                conn.commit()
+
+    def avancer(numero):
+        curseur, borne = etats[numero]
+        with connexion_quartier(numero) as conn:
+            conn.execute("INSERT OR REPLACE INTO parametres (cle, valeur) VALUES ('recommandations_curseur', ?)",
+                         (str(max(curseur or 0, borne)),))
+            conn.commit()
+    sur_les_quartiers(avancer)
+    cache_comptes().invalider()
+    return {'complet': complet, 'utilisateurs': nombre}
+
+def obtenir_recommandations(utilisateur_id):
+    """
+    Suggestions « Pour vous » d'un utilisateur, du meilleur score au moins bon : services
+    précalculés par rafraichir_recommandations, encore disponibles et pas encore demandés.
+    Un voisin sans historique reçoit les services les plus demandés (utilisateur 0).
+    Mémorisées jusqu'à sa prochaine demande (cache des comptes).
+    """
+    return cache_comptes().obtenir(('recommandations', utilisateur_id),
+                                   lambda: _lire_recommandations(utilisateur_id))
+
+def _lire_recommandations(utilisateur_id):
+    requete = 'SELECT service_id FROM recommandations WHERE utilisateur_id = ? ORDER BY rang'
+    with connexion_de(utilisateur_id) as conn:
+        ids = [service for (service,) in conn.execute(requete, (utilisateur_id,)).fetchall()]
+    if not ids:
+        with connexion_quartier(0) as conn:
+            ids = [service for (service,) in conn.execute(requete, (0,)).fetchall()]
+    if not ids:
+        return []
+    rangs = {service: rang for rang, service in enumerate(ids)}
+    query = f'''SELECT {COLONNES_CATALOGUE}
+               FROM json_each(?) j
+               JOIN services s ON s.id = j.value
+               JOIN utilisateurs u ON s.utilisateur_id = u.id
+               WHERE s.disponible = 1 AND s.utilisateur_id <> ?
+                 AND NOT EXISTS (SELECT 1 FROM demandes d WHERE d.service_id = s.id AND d.demandeur_id = ?)
+               ORDER BY j.key'''
+
+    def lire(numero):
+        with connexion_quartier(numero) as conn:
+            return lire_lignes(conn, Service, query, (json.dumps([i for i in ids if quartier_de(i) == numero]),
+                                                      utilisateur_id, utilisateur_id))
+    return fusionner(sur_les_quartiers(lire, sorted({quartier_de(i) for i in ids})),
+                     [(lambda service: rangs[service.id], False)])
+
+# ---------- CONSTANTES ----------
+
+# Catégories de services disponibles
+CATEGORIES = ["Jardinage", "Bricolage", "Courses", "Garde d'enfants", 
+              "Garde d'animaux", "Aide aux devoirs", "Covoiturage", "Aide à domicile", "Autre"]
+
+# Types de services proposés
+TYPES_SERVICE = ["Service gratuit", "Location payante", "Service rémunéré", "Échange"]
+
+# Nombre de services affichés par page dans "Trouver un service"
+TAILLE_PAGE_SERVICES = 20
+
+# Nombre de suggestions affichées dans « Pour vous »
+TAILLE_POUR_VOUS = 5
+
+# ---------- API ASYNCHRONE ----------
+
+# Nombre de threads qui exécutent les appels asynchrones (et donc de connexions SQLite qu'ils partagent)
+ASYNC_TRAVAILLEURS = int(os.environ.get("VOISINS_ASYNC_TRAVAILLEURS", "8"))
+
+@ressource
+def executeur_async():
+    """
+    Pool de threads dédié à l'API asynchrone. Chaque travailleur garde sa connexion du pool :
+    des milliers de coroutines concurrentes se partagent ASYNC_TRAVAILLEURS connexions,
+    sans bloquer la boucle d'événements pendant les requêtes ni pendant bcrypt.
+    """
+    return ThreadPoolExecutor(max_workers=ASYNC_TRAVAILLEURS, thread_name_prefix="voisins_async")
+
+def asynchrone(fonction):
+    # Version coroutine d'une fonction de données, exécutée sur executeur_async()
+    @functools.wraps(fonction)
+    async def coroutine(*args, **kwargs):
+        boucle = asyncio.get_running_loop()
+        return await boucle.run_in_executor(executeur_async(), functools.partial(fonction, *args, **kwargs))
+    coroutine.__name__ = coroutine.__qualname__ = fonction.__name__ + '_async'
+    return coroutine
+
+creer_utilisateur_async = asynchrone(creer_utilisateur)
+verifier_connexion_async = asynchrone(verifier_connexion)
+reinitialiser_mot_de_passe_async = asynchrone(reinitialiser_mot_de_passe)
+creer_service_async = asynchrone(creer_service)
+obtenir_services_async = asynchrone(obtenir_services)
+rechercher_services_async = asynchrone(rechercher_services)
+creer_demande_async = asynchrone(creer_demande)
+obtenir_mes_services_async = asynchrone(obtenir_mes_services)
+mettre_a_jour_disponibilite_service_async = asynchrone(mettre_a_jour_disponibilite_service)
+obtenir_demandes_recues_async = asynchrone(obtenir_demandes_recues)
+obtenir_mes_demandes_initiees_async = asynchrone(obtenir_mes_demandes_initiees)
+mettre_a_jour_statut_demande_async = asynchrone(mettre_a_jour_statut_demande)
+mettre_a_jour_utilisateur_async = asynchrone(mettre_a_jour_utilisateur)
+compter_demandes_en_attente_async = asynchrone(compter_demandes_en_attente)
+compter_services_disponibles_async = asynchrone(compter_services_disponibles)
+position_utilisateur_async = asynchrone(position_utilisateur)
+dernier_evenement_async = asynchrone(dernier_evenement)
+evenements_depuis_async = asynchrone(evenements_depuis)
+obtenir_services_archives_async = asynchrone(obtenir_services_archives)
+obtenir_demandes_archivees_async = asynchrone(obtenir_demandes_archivees)
+ouvrir_session_async = asynchrone(ouvrir_session)
+restaurer_session_async = asynchrone(restaurer_session)
+fermer_session_async = asynchrone(fermer_session)
+obtenir_recommandations_async = asynchrone(obtenir_recommandations)
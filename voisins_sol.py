@@ -18,22 +18,30 @@ STRUCTURE DU MENU :
 """
 
 import streamlit as st
-import sqlite3
-import bcrypt  # type: ignore
-import pandas as pd
-from datetime import datetime
+import os
+import json
+import time
+
+# Toute la couche de données (connexions, migrations, cache, requêtes) est dans voisins_db,
+# importable sans Streamlit par les outils et traitements par lots
+from voisins_db import (
+    DB_PATH, CATEGORIES, TYPES_SERVICE, TAILLE_PAGE_SERVICES, TAILLE_POUR_VOUS, SEUIL_REQUETE_LENTE_MS,
+    Chronometres, init_database, cache_catalogue, cache_comptes, metriques_sql, requetes_lentes, metriques_connexion,
+    limiteur_tentatives, TropDeTentatives, statistiques_ecritures,
+    creer_utilisateur, verifier_connexion, reinitialiser_mot_de_passe, creer_service,
+    obtenir_services, rechercher_services, requete_fts, creer_demande, obtenir_mes_services,
+    mettre_a_jour_disponibilite_service, obtenir_demandes_recues, obtenir_mes_demandes_initiees,
+    mettre_a_jour_statut_demande, mettre_a_jour_utilisateur,
+    compter_demandes_en_attente, compter_services_disponibles, position_utilisateur, geocoder,
+    dernier_evenement, evenements_depuis, obtenir_services_archives, obtenir_demandes_archivees,
+    SESSIONS_DUREE_JOURS, ouvrir_session, restaurer_session, fermer_session, nettoyage_sessions,
+    obtenir_recommandations,
+)
 
 # ==================== CONFIGURATION DE L'APPLICATION ====================
 
-st.set_page_config(
-    page_title="Voisins Solidaires",
-    page_icon="🏘️",
-    layout="wide",
-    initial_sidebar_state="collapsed"
-)
-
 # Styles CSS personnalisés pour masquer la barre latérale Streamlit et définir un fond
-st.markdown("""
+STYLE_CSS = """
     <style>  
         [data-testid="stSidebar"], [data-testid="collapsedControl"] {display: none;}
         .stApp {background-color: #B3E5FC;}
@@ -79,277 +87,149 @@ st.markdown("""
         }
         
     </style>
-""", unsafe_allow_html=True)
+"""
 
-# ==================== GESTION DE LA BASE DE DONNÉES SQLITE3====================
+def configurer_page():
+    # Configuration de la page et styles, appliqués en tête de main() : le module reste importable
+    # (outils, bancs d'essai) sans déclencher d'appel à l'interface
+    st.set_page_config(
+        page_title="Voisins Solidaires",
+        page_icon="🏘️",
+        layout="wide",
+        initial_sidebar_state="collapsed"
+    )
+    st.markdown(STYLE_CSS, unsafe_allow_html=True)
+
+# ==================== SUIVI DES PERFORMANCES ====================
+
+# Emails des comptes ayant accès à la page "Administration" (séparés par des virgules)
+ADMINS = {e.strip().lower() for e in os.environ.get("VOISINS_ADMINS", "").split(",") if e.strip()}
+
+@st.cache_resource
+def metriques_pages():
+    return Chronometres()
+
+def exporter_metriques():
+    # Instantané lisible par machine de toutes les mesures (page d'administration, supervision)
+    return {
+        'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'requetes': metriques_sql().statistiques(),
+        'pages': metriques_pages().statistiques(),
+        'requetes_lentes': list(requetes_lentes()),
+        'connexions': metriques_connexion().statistiques(),
+        'tentatives': limiteur_tentatives().statistiques(),
+        'ecritures': statistiques_ecritures(),
+        'cache_catalogue': cache_catalogue().statistiques(),
+        'cache_comptes': cache_comptes().statistiques(),
+    }
 
-def init_database():
-    """
-    Initialise la base de données SQLite avec les 3 tables nécessaires.
-    Utilise 'with sqlite3.connect' pour garantir la fermeture de la connexion.
-    """
-    with sqlite3.connect('voisins.db') as conn:
-        c = conn.cursor()
-        
-        # Table utilisateurs - Gère les inscriptions et les connexions
-        c.execute('''CREATE TABLE IF NOT EXISTS utilisateurs (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            nom TEXT NOT NULL,
-            prenom TEXT NOT NULL,
-            email TEXT UNIQUE NOT NULL,
-            mot_de_passe TEXT NOT NULL,
-            adresse TEXT,
-            telephone TEXT,
-            date_inscription TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )''')
-        
-        # Table services - pour "proposer un service" et "trouver un service"
-        c.execute('''CREATE TABLE IF NOT EXISTS services (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            titre TEXT NOT NULL,
-            categorie TEXT NOT NULL,
-            description TEXT NOT NULL,
-            type_service TEXT NOT NULL,
-            prix REAL,
-            utilisateur_id INTEGER,
-            disponible INTEGER DEFAULT 1,
-            date_creation TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (utilisateur_id) REFERENCES utilisateurs (id)
-        )''')
-        
-        # Table demandes - Gère les demandes de service dans "Mon compte"
-        c.execute('''CREATE TABLE IF NOT EXISTS demandes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            service_id INTEGER,
-            demandeur_id INTEGER,
-            date_demande TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            date_souhaitee TEXT,
-            statut TEXT DEFAULT 'en_attente', -- Statuts possibles: en_attente, acceptee, refusee
-            message TEXT,
-            FOREIGN KEY (service_id) REFERENCES services (id),
-            FOREIGN KEY (demandeur_id) REFERENCES utilisateurs (id)
-        )''')
-        
-        conn.commit()
 
-# Gestion des mots de passe cryptés avec bcrypt
-def hash_password(password):
-    salt = bcrypt.gensalt()
-    # Le hash est encodé en utf-8 pour le stockage en TEXT dans SQLite
-    return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+# ==================== SUIVI DES DEMANDES (FLUX D'ÉVÈNEMENTS) ====================
 
-# ---------- FONCTIONS POUR "S'INSCRIRE" ----------
+# Intervalle (en secondes) entre deux lectures du flux d'évènements par une session connectée
+SONDAGE_EVENEMENTS_S = float(os.environ.get("VOISINS_SONDAGE_S", "15"))
+STATUTS_NOTIFIES = {'acceptee': 'acceptée', 'refusee': 'refusée'}
 
-def creer_utilisateur(nom, prenom, email, mot_de_passe, adresse, telephone): #Crée un nouveau compte utilisateur dans la base de données.
-    
-    try:
-        with sqlite3.connect('voisins.db') as conn:
-            c = conn.cursor()
-            c.execute('''INSERT INTO utilisateurs (nom, prenom, email, mot_de_passe, adresse, telephone)
-                         VALUES (?, ?, ?, ?, ?, ?)''',
-                      (nom, prenom, email, hash_password(mot_de_passe), adresse, telephone))
-            conn.commit()
-        return True, "Inscription réussie !"
-    except sqlite3.IntegrityError:
-        return False, "Cet email est déjà utilisé."
-    except Exception as e:
-        return False, f"Erreur : {str(e)}"
-
-# ---------- FONCTIONS POUR "SE CONNECTER" ----------
-
-def verifier_connexion(email, mot_de_passe):
+def fusionner_demandes(demandes, mises_a_jour):
+    # Remplace les demandes relues (même id), ajoute les nouvelles, garde l'ordre du plus récent au plus ancien
+    par_id = {demande.id: demande for demande in demandes}
+    par_id.update((demande.id, demande) for demande in mises_a_jour)
+    return sorted(par_id.values(), key=lambda d: (d.date_demande, d.id), reverse=True)
+
+def demandes_suivies(utilisateur_id):
     """
-    Vérifie les identifiants de connexion avec bcrypt.
-    Retourne les données utilisateur si la connexion est réussie, sinon None.
+    Demandes reçues et envoyées de l'utilisateur, conservées dans la session.
+    Le premier appel les lit en entier ; les suivants n'appliquent que les évènements
+    postérieurs au curseur, en relisant uniquement les demandes concernées.
     """
-    user_hash = None
-    # 1. Récupérer le hash stocké
-    try:
-        with sqlite3.connect('voisins.db') as conn:
-            c = conn.cursor()
-            c.execute('SELECT mot_de_passe FROM utilisateurs WHERE email = ?', (email,))
-            result = c.fetchone()
-            if result:
-                user_hash = result[0]
-    except Exception:
-        return None # Erreur de connexion DB
-
-    if user_hash:
-        try:
-            # 2. Comparer le mot de passe fourni avec le hash stocké
-            if bcrypt.checkpw(mot_de_passe.encode('utf-8'), user_hash.encode('utf-8')):
-                # 3. Si OK, récupérer l'utilisateur complet
-                with sqlite3.connect('voisins.db') as conn:
-                    c = conn.cursor()
-                    c.execute('SELECT * FROM utilisateurs WHERE email = ?', (email,))
-                    user = c.fetchone()
-                    return user
-        except ValueError:
-            return None # Hash invalide
-    return None
-
-# ---------- FONCTION POUR RÉINITIALISER LE MOT DE PASSE ----------
-
-def reinitialiser_mot_de_passe(email, telephone, nouveau_mot_de_passe): # Vérifie l'email et le téléphone pour l'identité, puis met à jour le mot de passe haché.
-  
-    try:
-        with sqlite3.connect('voisins.db') as conn:
-            c = conn.cursor()
-            
-            # 1. Vérifier si l'utilisateur existe et si le téléphone correspond
-            c.execute('SELECT id FROM utilisateurs WHERE email = ? AND telephone = ?', (email, telephone))
-            user_id = c.fetchone()
-            
-            if user_id:
-                # 2. Hacher le nouveau mot de passe
-                nouveau_hash = hash_password(nouveau_mot_de_passe)
-                
-                # 3. Mettre à jour le mot de passe
-                c.execute('UPDATE utilisateurs SET mot_de_passe = ? WHERE id = ?', (nouveau_hash, user_id[0]))
-                conn.commit()
-                return True, "Votre mot de passe a été réinitialisé avec succès !"
-            else:
-                return False, "Email ou numéro de téléphone non reconnu."
-    except Exception as e:
-        return False, f"Erreur lors de la réinitialisation : {str(e)}"
+    suivi = st.session_state.get('suivi_demandes')
+    if suivi is None or suivi['utilisateur_id'] != utilisateur_id:
+        # Curseur lu avant les listes : un évènement concurrent sera au pire appliqué deux fois
+        suivi = st.session_state.suivi_demandes = {
+            'utilisateur_id': utilisateur_id,
+            'curseur': dernier_evenement(),
+            'recues': obtenir_demandes_recues(utilisateur_id),
+            'envoyees': obtenir_mes_demandes_initiees(utilisateur_id),
+        }
+        return suivi['recues'], suivi['envoyees']
+
+    evenements, suivi['curseur'] = evenements_depuis(utilisateur_id, suivi['curseur'])
+    recues = {e.demande_id for e in evenements if e.proposant_id == utilisateur_id}
+    envoyees = {e.demande_id for e in evenements if e.demandeur_id == utilisateur_id}
+    if recues:
+        suivi['recues'] = fusionner_demandes(suivi['recues'], obtenir_demandes_recues(utilisateur_id, ids=recues))
+    if envoyees:
+        suivi['envoyees'] = fusionner_demandes(suivi['envoyees'], obtenir_mes_demandes_initiees(utilisateur_id, ids=envoyees))
+    return suivi['recues'], suivi['envoyees']
+
+@st.fragment(run_every=SONDAGE_EVENEMENTS_S)
+def surveiller_evenements():
+    """
+    Sondage léger du flux : seul ce fragment est réexécuté à chaque intervalle.
+    La page n'est relancée que si un évènement concerne l'utilisateur (nouvelle demande
+    reçue, réponse à une demande envoyée) ; sinon rien n'est redessiné.
+    """
+    utilisateur_id = st.session_state.utilisateur['id']
+    if 'curseur_notifications' not in st.session_state:
+        st.session_state.curseur_notifications = dernier_evenement()
+        return
+    evenements, st.session_state.curseur_notifications = evenements_depuis(
+        utilisateur_id, st.session_state.curseur_notifications)
+    notifications = [
+        "📬 Nouvelle demande reçue" if e.type == 'demande'
+        else f"📨 Votre demande a été {STATUTS_NOTIFIES.get(e.statut, e.statut)}"
+        for e in evenements
+        if (e.type == 'demande' and e.proposant_id == utilisateur_id)
+        or (e.type == 'statut' and e.demandeur_id == utilisateur_id)
+    ]
+    if notifications:
+        st.session_state.setdefault('notifications', []).extend(notifications)
+        st.rerun()
 
-# ---------- FONCTIONS POUR "PROPOSER UN SERVICE" ----------
 
-def creer_service(titre, categorie, description, type_service, prix, utilisateur_id):
-    # Crée une nouvelle annonce de service.
-    try:
-        with sqlite3.connect('voisins.db') as conn:
-            c = conn.cursor()
-            c.execute('''INSERT INTO services (titre, categorie, description, type_service, prix, utilisateur_id)
-                         VALUES (?, ?, ?, ?, ?, ?)''',
-                      (titre, categorie, description, type_service, prix, utilisateur_id))
-            conn.commit()
-        return True
-    except Exception as e:
-        st.error(f"Erreur DB : {e}")
-        return False
-
-# ---------- FONCTIONS POUR "TROUVER UN SERVICE" ----------
-
-def obtenir_services(categorie=None, type_service=None):
-    with sqlite3.connect('voisins.db') as conn:
-        # Jointure avec la table utilisateurs pour afficher le nom du proposant
-        query = '''SELECT s.*, u.prenom, u.nom, u.email, u.telephone 
-                   FROM services s JOIN utilisateurs u ON s.utilisateur_id = u.id 
-                   WHERE s.disponible = 1''' # N'affiche que les services marqués 'disponible'
-        params = []
-        
-        # Appliquer les filtres de recherche
-        if categorie and categorie != "Toutes":
-            query += ' AND s.categorie = ?'
-            params.append(categorie)
-        if type_service and type_service != "Tous":
-            query += ' AND s.type_service = ?'
-            params.append(type_service)
-        
-        query += ' ORDER BY s.date_creation DESC'
-        df = pd.read_sql_query(query, conn, params=params)
-        return df
+# ==================== SESSIONS PERSISTANTES ====================
 
-# Crée une demande de réservation pour un service.
-def creer_demande(service_id, demandeur_id, date_souhaitee, message):
-    try:
-        with sqlite3.connect('voisins.db') as conn:
-            c = conn.cursor()
-            c.execute('''INSERT INTO demandes (service_id, demandeur_id, date_souhaitee, message)
-                         VALUES (?, ?, ?, ?)''',
-                      (service_id, demandeur_id, date_souhaitee, message))
-            conn.commit()
-        return True
-    except Exception as e:
-        st.error(f"Erreur lors de la création de la demande: {e}")
-        return False
-
-# ---------- FONCTIONS POUR "MON COMPTE" ----------
-
-def obtenir_mes_services(utilisateur_id):
-    # Récupère les services proposés par l'utilisateur connecté.
-    with sqlite3.connect('voisins.db') as conn:
-        df = pd.read_sql_query(
-            'SELECT * FROM services WHERE utilisateur_id = ? ORDER BY date_creation DESC',
-            conn, params=(utilisateur_id,)
-        )
-        return df
-
-def mettre_a_jour_disponibilite_service(service_id, disponible):
-    # Met à jour la disponibilité d'un service (0=non disponible, 1=disponible).
-    try:
-        with sqlite3.connect('voisins.db') as conn:
-            c = conn.cursor()
-            c.execute('''UPDATE services SET disponible = ? WHERE id = ?''', 
-                      (disponible, service_id))
-            conn.commit()
-        return True
-    except Exception:
-        return False
-
-def obtenir_demandes_recues(utilisateur_id):
-    # Récupère les demandes reçues pour les services de l'utilisateur (celui qui propose).
-    with sqlite3.connect('voisins.db') as conn:
-        query = '''SELECT d.*, s.titre, u.prenom, u.nom, u.email, u.telephone
-                   FROM demandes d
-                   JOIN services s ON d.service_id = s.id
-                   JOIN utilisateurs u ON d.demandeur_id = u.id
-                   WHERE s.utilisateur_id = ?
-                   ORDER BY d.date_demande DESC'''
-        df = pd.read_sql_query(query, conn, params=(utilisateur_id,))
-        return df
-
-def obtenir_mes_demandes_initiees(demandeur_id):
+# Cookie du navigateur qui porte le jeton de session (rechargement, nouvel onglet)
+COOKIE_SESSION = "voisins_session"
+
+def connecter(user, jeton):
+    # Ouvre la session Streamlit à partir d'une ligne utilisateur et mémorise le jeton (écrit en cookie)
+    st.session_state.utilisateur = {
+        'id': user[0], 'nom': user[1], 'prenom': user[2],
+        'email': user[3], 'adresse': user[5], 'telephone': user[6]
+    }
+    st.session_state.jeton_session = jeton
+    st.session_state.cookie_session = jeton
+
+def restaurer_depuis_cookie():
     """
-    Récupère les demandes faites par l'utilisateur (en tant que demandeur).
+    Une fois par session Streamlit : restaure l'utilisateur depuis le cookie du navigateur,
+    sans formulaire de connexion ni calcul bcrypt. Les cookies lus (st.context) sont ceux
+    de l'ouverture de la page : après une déconnexion, ils ne sont plus consultés.
     """
-    with sqlite3.connect('voisins.db') as conn:
-        query = '''SELECT d.*, s.titre, u.prenom, u.nom, u.email, u.telephone
-                   FROM demandes d
-                   JOIN services s ON d.service_id = s.id
-                   JOIN utilisateurs u ON s.utilisateur_id = u.id
-                   WHERE d.demandeur_id = ?
-                   ORDER BY d.date_demande DESC'''
-        df = pd.read_sql_query(query, conn, params=(demandeur_id,))
-        return df
-
-def mettre_a_jour_statut_demande(demande_id, nouveau_statut):
-    """Met à jour le statut d'une demande de service (en_attente, acceptee, refusee)."""
-    try:
-        with sqlite3.connect('voisins.db') as conn:
-            c = conn.cursor()
-            c.execute('''UPDATE demandes SET statut = ? WHERE id = ?''', 
-                      (nouveau_statut, demande_id))
-            conn.commit()
-        return True
-    except Exception as e:
-        return False
-
-def mettre_a_jour_utilisateur(user_id, nom, prenom, email, adresse, telephone):
-   # Met à jour les informations de profil de l'utilisateur.
-    try:
-        with sqlite3.connect('voisins.db') as conn:
-            c = conn.cursor()
-            c.execute('''UPDATE utilisateurs 
-                         SET nom = ?, prenom = ?, adresse = ?, telephone = ?
-                         WHERE id = ?''',
-                      (nom, prenom, adresse, telephone, user_id))
-            conn.commit()
-        return True, "Profil mis à jour avec succès !"
-    except sqlite3.IntegrityError:
-        return False, "Cet email est déjà utilisé par un autre compte."
-    except Exception as e:
-        return False, f"Erreur de mise à jour : {str(e)}"
-
-# ==================== CONSTANTES DE L'APPLICATION ====================
-
-# Catégories de services disponibles
-CATEGORIES = ["Jardinage", "Bricolage", "Courses", "Garde d'enfants", 
-              "Garde d'animaux", "Aide aux devoirs", "Covoiturage", "Aide à domicile", "Autre"]
-
-# Types de services proposés
-TYPES_SERVICE = ["Service gratuit", "Location payante", "Service rémunéré", "Échange"]
+    if st.session_state.get('session_restauree'):
+        return
+    st.session_state.session_restauree = True
+    jeton = st.context.cookies.get(COOKIE_SESSION)
+    if not isinstance(jeton, str) or not jeton or st.session_state.utilisateur: # Pas de cookie (ni d'en-têtes : AppTest)
+        return
+    user = restaurer_session(jeton)
+    if user:
+        connecter(user, jeton)
+    else:
+        st.session_state.cookie_session = "" # Jeton expiré ou révoqué : le navigateur l'oublie
+
+def synchroniser_cookie():
+    # Écrit (ou efface, jeton vide) le cookie demandé lors d'un rerun précédent (connexion, déconnexion)
+    jeton = st.session_state.pop('cookie_session', None)
+    if jeton is None:
+        return
+    duree = SESSIONS_DUREE_JOURS * 24 * 3600 if jeton else 0
+    st.html(f"""<script>
+        document.cookie = "{COOKIE_SESSION}={jeton}; path=/; max-age={duree}; SameSite=Strict"
+                          + (location.protocol === "https:" ? "; Secure" : "");
+    </script>""", unsafe_allow_javascript=True)
+
 
 # ==================== PAGES DE L'APPLICATION ====================
 
@@ -452,7 +332,7 @@ def page_inscription():
                 confirmation = st.text_input("Confirmer le mot de passe *", type="password")
                 telephone = st.text_input("Téléphone")
             
-            adresse = st.text_area("Adresse")
+            adresse = st.text_area("Adresse", help="Indiquez le code postal pour la recherche par distance")
             submitted = st.form_submit_button("S'inscrire")
             
             if submitted:
@@ -482,18 +362,19 @@ def page_connexion():
             submitted = st.form_submit_button("Se connecter")
             
             if submitted:
-                user = verifier_connexion(email, mot_de_passe)
+                try:
+                    user = verifier_connexion(email, mot_de_passe, client=st.context.ip_address)
+                    erreur = "Email ou mot de passe incorrect"
+                except TropDeTentatives as e: # Refusée avant toute vérification du mot de passe
+                    user, erreur = None, str(e)
                 if user:
-                    # Stockage des données utilisateur dans l'état de session
-                    st.session_state.utilisateur = {
-                        'id': user[0], 'nom': user[1], 'prenom': user[2],
-                        'email': user[3], 'adresse': user[5], 'telephone': user[6]
-                    }
+                    # Stockage des données utilisateur dans l'état de session, session persistante (cookie)
+                    connecter(user, ouvrir_session(user[0]))
                     st.success(f"Bienvenue {user[2]} {user[1]} !")
                     st.session_state.page_navigation = "Mon compte"  # Rédirection vers la page "Mon compte" après connexion
                     st.rerun()
                 else:
-                    st.error("Email ou mot de passe incorrect")
+                    st.error(erreur)
                 
     # Bouton pour naviguer vers la page de réinitialisation
     if st.button("Mot de passe oublié ?"):
@@ -524,7 +405,8 @@ def page_mot_de_passe_oublie():
                 elif len(nouveau_mot_de_passe) < 6:
                     st.error("Le mot de passe doit contenir au moins 6 caractères.")
                 else:
-                    success, message = reinitialiser_mot_de_passe(email, telephone, nouveau_mot_de_passe)
+                    success, message = reinitialiser_mot_de_passe(email, telephone, nouveau_mot_de_passe,
+                                                                  client=st.context.ip_address)
                     if success:
                         st.success(message)
                         # Offre un bouton pour revenir à la connexion
@@ -561,15 +443,61 @@ def page_proposer_service():
                 if not all([titre, categorie, description]):
                     st.error("Veuillez remplir tous les champs obligatoires (*)")
                 else:
-                    if creer_service(titre, categorie, description, type_service, 
-                                    prix, st.session_state.utilisateur['id']):
-                        st.success("Service publié avec succès !")
+                    succes, message = creer_service(titre, categorie, description, type_service,
+                                                    prix, st.session_state.utilisateur['id'])
+                    if succes:
+                        st.success(message)
                         st.balloons()
                     else:
-                        st.error("Erreur lors de la publication")
+                        st.error(message)
 
 # ========== PAGE : TROUVER UN SERVICE  ==========
 
+# Rayons proposés pour la recherche par proximité (None = pas de filtre de distance)
+RAYONS_KM = [None, 1, 2, 5, 10]
+
+def afficher_service(service, prefixe=""):
+    """Carte d'un service : détails et formulaire de demande (prefixe : clé distincte si l'annonce est affichée deux fois)."""
+    with st.container(border=True):
+        # Utilisation d'un expander pour afficher les détails du service
+        distance = f" - 📍 {service.distance:.1f} km".replace('.', ',') if service.distance is not None else ""
+        with st.expander(f"📌 {service.titre} - {service.categorie}{distance}"):
+            col1, col2 = st.columns([2, 1])
+            
+            with col1:
+                st.markdown(f"**Type :** {service.type_service}")
+                if (service.prix or 0) > 0:
+                    st.markdown(f"**Prix :** {service.prix} €")
+                st.markdown(f"**Description :**")
+                st.write(service.description)
+                st.markdown(f"**Proposé par :** {service.prenom} {service.nom}")
+                st.caption(f"Publié le {service.date_creation[:10]}")
+            
+            with col2:
+                # Affichage du formulaire de demande si l'utilisateur est connecté et n'est pas l'auteur
+                if st.session_state.get('utilisateur'):
+                    if st.session_state.utilisateur['id'] != service.utilisateur_id:
+                        st.markdown("**Contact**")
+                        st.write(f"📧 {service.email}")
+                        if service.telephone:
+                            st.write(f"📞 {service.telephone}")
+                        
+                        # Formulaire pour envoyer une demande de contact/réservation
+                        with st.form(f"demande_{prefixe}{service.id}"):
+                            date_souhaitee = st.date_input("Date souhaitée")
+                            message = st.text_area("Message", height=100)
+                            
+                            if st.form_submit_button("Envoyer une demande"):
+                                succes, retour = creer_demande(service.id, st.session_state.utilisateur['id'],
+                                                               str(date_souhaitee), message)
+                                if succes:
+                                    st.success(retour)
+                                else:
+                                    st.error(retour)
+                else:
+                    st.info("Connectez-vous pour contacter le voisin")
+    st.markdown("---") # Séparation visuelle entre les containers
+
 def page_trouver_service():
     """Page de recherche et consultation des services disponibles."""
     st.title("🔍 Trouver un service")
@@ -577,60 +505,288 @@ def page_trouver_service():
     # Filtres de recherche
     with st.container(border=True):
         st.subheader("Filtres")
-        col1, col2 = st.columns(2)
+        recherche = st.text_input("Rechercher", placeholder="perceuse, tondeuse, baby-sitting...")
+        # Nombre de services disponibles pour chaque option, compte tenu de l'autre filtre
+        compteurs = compter_services_disponibles()
+        type_choisi = st.session_state.get('filtre_type', "Tous")
+        categorie_choisie = st.session_state.get('filtre_categorie', "Toutes")
+        def nombre(categorie, type_service):
+            return sum(n for (c, t), n in compteurs.items()
+                       if categorie in ("Toutes", c) and type_service in ("Tous", t))
+        col1, col2, col3 = st.columns(3)
         with col1:
-            categorie_filtre = st.selectbox("Catégorie", ["Toutes"] + CATEGORIES)
+            categorie_filtre = st.selectbox("Catégorie", ["Toutes"] + CATEGORIES, key="filtre_categorie",
+                                            format_func=lambda c: f"{c} ({nombre(c, type_choisi)})")
         with col2:
-            type_filtre = st.selectbox("Type", ["Tous"] + TYPES_SERVICE)
+            type_filtre = st.selectbox("Type", ["Tous"] + TYPES_SERVICE, key="filtre_type",
+                                       format_func=lambda t: f"{t} ({nombre(categorie_choisie, t)})")
+        with col3:
+            rayon_km = st.selectbox("Distance", RAYONS_KM, key="filtre_rayon",
+                                    format_func=lambda r: "Toutes distances" if r is None else f"À moins de {r} km")
+        
+        # Centre de la recherche par proximité : adresse du voisin connecté, sinon code postal saisi
+        centre = None
+        if rayon_km is not None:
+            if st.session_state.get('utilisateur'):
+                centre = position_utilisateur(st.session_state.utilisateur['id'])
+            if centre is None:
+                lieu = st.text_input("Près de (code postal ou commune)", placeholder="75011, Montreuil...")
+                centre = geocoder(lieu)
+                if lieu and centre is None:
+                    st.warning("Lieu inconnu : indiquez un code postal")
     
     st.markdown("---")
     
-    services = obtenir_services(categorie_filtre, type_filtre)
+    # Pile des curseurs de pagination (un par page déjà parcourue), remise à zéro si les filtres changent
+    # (clé (date_creation, id) pour la liste chronologique, rang de départ pour la recherche plein texte ou par proximité)
+    recherche_fts = requete_fts(recherche)
+    par_rang = bool(recherche_fts) or centre is not None
+    filtres = (recherche_fts, categorie_filtre, type_filtre, centre, rayon_km)
+    if st.session_state.get('filtres_services') != filtres:
+        st.session_state.filtres_services = filtres
+        st.session_state.curseurs_services = [None]
+    curseurs = st.session_state.curseurs_services
+    
+    # Suggestions personnalisées (précalculées par recommander.py), en tête de la première page du catalogue
+    if st.session_state.get('utilisateur') and not par_rang and len(curseurs) == 1:
+        suggestions = [s for s in obtenir_recommandations(st.session_state.utilisateur['id'])
+                       if categorie_filtre in ("Toutes", s.categorie) and type_filtre in ("Tous", s.type_service)]
+        if suggestions:
+            st.subheader("✨ Pour vous")
+            for service in suggestions[:TAILLE_POUR_VOUS]:
+                afficher_service(service, "pour_vous_")
+    
+    # Une ligne de plus que la taille de page pour savoir s'il reste des services à charger
+    if par_rang:
+        services = rechercher_services(recherche, categorie_filtre, type_filtre, limite=TAILLE_PAGE_SERVICES + 1,
+                                       decalage=curseurs[-1] or 0, centre=centre, rayon_km=rayon_km)
+    else:
+        services = obtenir_services(categorie_filtre, type_filtre, apres=curseurs[-1], limite=TAILLE_PAGE_SERVICES + 1)
+    page_suivante = len(services) > TAILLE_PAGE_SERVICES
+    services = services[:TAILLE_PAGE_SERVICES]
     
     if len(services) == 0:
-        st.info("Aucun service disponible pour le moment")
+        if recherche_fts or centre is not None:
+            st.info("Aucun service ne correspond à votre recherche")
+        else:
+            st.info("Aucun service disponible pour le moment")
         return
     
-    st.markdown(f"**{len(services)} service(s) trouvé(s)**")
-    
-    for _, service in services.iterrows():
-        with st.container(border=True):
-            # Utilisation d'un expander pour afficher les détails du service
-            with st.expander(f"📌 {service['titre']} - {service['categorie']}"):
-                col1, col2 = st.columns([2, 1])
+    debut = (len(curseurs) - 1) * TAILLE_PAGE_SERVICES
+    st.markdown(f"**Services {debut + 1} à {debut + len(services)}**")
+    
+    for service in services:
+        afficher_service(service)
+    
+    # Navigation entre les pages de résultats
+    col_debut, col_suivants, _ = st.columns([1, 1, 3])
+    with col_debut:
+        if len(curseurs) > 1 and st.button("⏮️ Revenir au début", key="services_debut"):
+            st.session_state.curseurs_services = [None]
+            st.rerun()
+    with col_suivants:
+        if page_suivante and st.button("Charger plus ➡️", key="services_suivants"):
+            if par_rang:
+                curseurs.append(debut + TAILLE_PAGE_SERVICES)
+            else:
+                dernier = services[-1]
+                curseurs.append((dernier.date_creation, dernier.id))
+            st.rerun()
+
+# ========== PAGE : MON COMPTE  ==========
+
+ONGLETS_MON_COMPTE = ["Mes services", "Demandes reçues", "Demandes envoyées", "Mes informations"]
+
+# Nombre de lignes d'historique archivé affichées par page
+TAILLE_PAGE_HISTORIQUE = 10
+
+def afficher_historique(cle, lire, afficher):
+    """
+    Historique archivé, lu seulement quand l'utilisateur l'affiche, par pages de
+    TAILLE_PAGE_HISTORIQUE lignes. lire(limite, decalage) retourne les lignes,
+    afficher(ligne) dessine l'une d'elles.
+    """
+    if not st.toggle("Afficher l'historique archivé", key=f"historique_{cle}"):
+        return
+    numero = st.session_state.get(f"page_historique_{cle}", 0)
+    lignes = lire(TAILLE_PAGE_HISTORIQUE + 1, numero * TAILLE_PAGE_HISTORIQUE)
+    if not lignes and numero == 0:
+        st.info("Aucun élément archivé")
+        return
+    for ligne in lignes[:TAILLE_PAGE_HISTORIQUE]:
+        afficher(ligne)
+    col_prec, col_suiv, _ = st.columns([1, 1, 3])
+    with col_prec:
+        if numero > 0 and st.button("◀ Plus récents", key=f"historique_prec_{cle}"):
+            st.session_state[f"page_historique_{cle}"] = numero - 1
+            st.rerun()
+    with col_suiv:
+        if len(lignes) > TAILLE_PAGE_HISTORIQUE and st.button("Plus anciens ▶", key=f"historique_suiv_{cle}"):
+            st.session_state[f"page_historique_{cle}"] = numero + 1
+            st.rerun()
+
+def statut_lisible(statut):
+    return statut.replace('_', ' ').capitalize()
+
+def memoriser_onglet(libelles):
+    # Onglet actif mémorisé sous son nom stable : le libellé de "Demandes reçues" change avec le compteur
+    st.session_state.onglet_mon_compte = ONGLETS_MON_COMPTE[libelles.index(st.session_state.onglets_mon_compte)]
+
+def onglet_mes_services(user): # Gestion des services proposés
+    st.subheader("Services que je propose")
+    mes_services = obtenir_mes_services(user['id'])
+    
+    if len(mes_services) == 0:
+        st.info("Vous n'avez pas encore proposé de service")
+    else:
+        for service in mes_services:
+            
+            with st.container(border=True):
+                col_title, col_toggle = st.columns([4, 1])
+                is_dispo = service.disponible == 1
                 
-                with col1:
-                    st.markdown(f"**Type :** {service['type_service']}")
-                    if service['prix'] > 0:
-                        st.markdown(f"**Prix :** {service['prix']} €")
-                    st.markdown(f"**Description :**")
-                    st.write(service['description'])
-                    st.markdown(f"**Proposé par :** {service['prenom']} {service['nom']}")
-                    st.caption(f"Publié le {service['date_creation'][:10]}")
+                with col_toggle:
+                    # Case à cocher pour activer ou désactiver la disponibilité du service
+                    if st.checkbox("Disponible", value=is_dispo, key=f"dispo_{service.id}", help="Active ou désactive votre annonce"):
+                        if not is_dispo:
+                            if mettre_a_jour_disponibilite_service(service.id, 1):
+                                st.success("Service réactivé!")
+                                st.rerun()
+                    else:
+                        if is_dispo:
+                            if mettre_a_jour_disponibilite_service(service.id, 0):
+                                st.warning("Service désactivé!")
+                                st.rerun()
+
+                with col_title:
+                    st.markdown(f"**{service.titre} - {'✅ Actif' if is_dispo else '❌ Inactif'}**")
+
+                with st.expander("Détails"):
+                    st.write(f"**Catégorie :** {service.categorie}")
+                    st.write(f"**Type :** {service.type_service}")
+                    if (service.prix or 0) > 0:
+                        st.write(f"**Prix :** {service.prix} €")
+                st.write(f"**Description :** {service.description}")
+                st.caption(f"Créé le {service.date_creation[:10]}")
+
+            st.markdown("---") # Séparation
+
+    afficher_historique(
+        "services", lambda limite, decalage: obtenir_services_archives(user['id'], limite, decalage),
+        lambda service: st.caption(f"📦 {service.titre} - {service.categorie} - créé le {service.date_creation[:10]}"))
+
+def onglet_demandes_recues(user): # Gestion des demandes reçues
+    st.subheader("Demandes reçues pour mes services")
+    demandes, _ = demandes_suivies(user['id'])
+    
+    if len(demandes) == 0:
+        st.info("Aucune demande reçue")
+    else:
+        for demande in demandes:
+            with st.container(border=True):
+                # Affichage des informations du demandeur
+                with st.expander(f"Demande pour '{demande.titre}' - {demande.date_demande[:10]}"):
+                    st.write(f"**Demandeur :** {demande.prenom} {demande.nom}")
+                    st.write(f"**Email :** {demande.email}")
+                    st.write(f"**Téléphone :** {demande.telephone}")
+                    st.write(f"**Date souhaitée :** {demande.date_souhaitee}")
+                    st.write(f"**Message :**")
+                    st.info(demande.message)
+                    
+                    statut_affiche = demande.statut.replace('_', ' ').capitalize()
+                    
+                    if demande.statut == 'acceptee':
+                        st.success(f"**Statut :** {statut_affiche}")
+                    elif demande.statut == 'refusee':
+                        st.error(f"**Statut :** {statut_affiche}")
+                    else:
+                        st.warning(f"**Statut :** {statut_affiche}")
+                    
+                    # Boutons d'action uniquement si en_attente
+                    if demande.statut == 'en_attente':
+                        col_accept, col_reject, _ = st.columns([1, 1, 3])
+                        with col_accept:
+                            if st.button("Accepter", key=f"accept_{demande.id}", type="primary"):
+                                if mettre_a_jour_statut_demande(demande.id, 'acceptee'):
+                                    st.success("Demande acceptée ! Rafraîchissement...")
+                                    st.rerun()
+                        with col_reject:
+                            if st.button("Refuser", key=f"reject_{demande.id}", type="secondary"):
+                                if mettre_a_jour_statut_demande(demande.id, 'refusee'):
+                                    st.warning("Demande refusée. Rafraîchissement...")
+                                    st.rerun()
+            st.markdown("---") # Séparation
+
+    afficher_historique(
+        "recues", lambda limite, decalage: obtenir_demandes_archivees(user['id'], True, limite, decalage),
+        lambda demande: st.caption(f"📦 '{demande.titre}' - {demande.prenom} {demande.nom} - "
+                                   f"{demande.date_demande[:10]} - {statut_lisible(demande.statut)}"))
+
+def onglet_demandes_envoyees(user): # Gestion des demandes envoyées par l'utilisateur
+    st.subheader("Mes demandes de service envoyées")
+    _, mes_demandes_envoyees = demandes_suivies(user['id'])
+
+    if len(mes_demandes_envoyees) == 0:
+        st.info("Vous n'avez envoyé aucune demande de service pour le moment.")
+    else:
+        for demande in mes_demandes_envoyees:
+            with st.container(border=True):
+                statut = demande.statut
+                statut_affiche = statut.replace('_', ' ').capitalize()
                 
-                with col2:
-                    # Affichage du formulaire de demande si l'utilisateur est connecté et n'est pas l'auteur
-                    if st.session_state.get('utilisateur'):
-                        if st.session_state.utilisateur['id'] != service['utilisateur_id']:
-                            st.markdown("**Contact**")
-                            st.write(f"📧 {service['email']}")
-                            if service['telephone']:
-                                st.write(f"📞 {service['telephone']}")
-                            
-                            # Formulaire pour envoyer une demande de contact/réservation
-                            with st.form(f"demande_{service['id']}"):
-                                date_souhaitee = st.date_input("Date souhaitée")
-                                message = st.text_area("Message", height=100)
-                                
-                                if st.form_submit_button("Envoyer une demande"):
-                                    creer_demande(service['id'], st.session_state.utilisateur['id'],
-                                                str(date_souhaitee), message)
-                                    st.success("Demande envoyée !")
+                with st.expander(f"Demande pour '{demande.titre}' - Statut: {statut_affiche}"):
+                    st.write(f"**Proposé par :** {demande.prenom} {demande.nom}")
+                    st.write(f"**Email du Proposeur :** {demande.email}")
+                    if demande.telephone:
+                        st.write(f"**Téléphone du Proposeur :** {demande.telephone}")
+                    
+                    # Affichage du statut avec couleur
+                    if statut == 'acceptee':
+                        st.success(f"✅ **Statut :** {statut_affiche} - Vous pouvez contacter le voisin.")
+                    elif statut == 'refusee':
+                        st.error(f"❌ **Statut :** {statut_affiche}.")
                     else:
-                        st.info("Connectez-vous pour contacter le voisin")
-        st.markdown("---") # Séparation visuelle entre les containers
+                        st.warning(f"⏳ **Statut :** {statut_affiche} - En attente de réponse.")
+            st.markdown("---") # Séparation
 
-# ========== PAGE : MON COMPTE  ==========
+    afficher_historique(
+        "envoyees", lambda limite, decalage: obtenir_demandes_archivees(user['id'], False, limite, decalage),
+        lambda demande: st.caption(f"📦 '{demande.titre}' - proposé par {demande.prenom} {demande.nom} - "
+                                   f"{demande.date_demande[:10]} - {statut_lisible(demande.statut)}"))
+
+def onglet_mes_informations(user): # Modification du profil
+    st.subheader("Mes informations")
+    
+    with st.container(border=True):
+        with st.form("formulaire_modification_profil"):
+            # L'email est affiché comme non modifiable
+            st.write(f"**Email :** {user['email']} (Non modifiable ici)")
+            
+            # Champs pré-remplis pour la modification
+            nouveau_nom = st.text_input("Nom", value=user['nom'])
+            nouveau_prenom = st.text_input("Prénom", value=user['prenom'])
+            nouveau_telephone = st.text_input("Téléphone", value=user.get('telephone', ''))
+            nouvelle_adresse = st.text_area("Adresse", value=user.get('adresse', ''))
+            if position_utilisateur(user['id']) is None:
+                st.caption("📍 Adresse non localisée : ajoutez le code postal pour la recherche par distance")
+            
+            submitted = st.form_submit_button("Sauvegarder les modifications")
+            
+            if submitted:
+                success, message = mettre_a_jour_utilisateur(
+                    user['id'], nouveau_nom, nouveau_prenom, user['email'], nouvelle_adresse, nouveau_telephone
+                )
+                if success:
+                    # Mise à jour de l'état de session après succès
+                    st.session_state.utilisateur.update({
+                        'nom': nouveau_nom, 
+                        'prenom': nouveau_prenom, 
+                        'adresse': nouvelle_adresse, 
+                        'telephone': nouveau_telephone
+                    })
+                    st.success(message)
+                else:
+                    st.error(message)
 
 def page_mon_compte():
     """Page de gestion du compte utilisateur (services, demandes, profil)."""
@@ -644,167 +800,92 @@ def page_mon_compte():
 
     st.markdown(f"<h3 style='color: #0020CA;'>Bienvenue {user['prenom']} {user['nom']}</h3>", unsafe_allow_html=True)
     
-    # Utilisation de 4 onglets pour afficher (Mes services", "Demandes reçues", "Demandes envoyées", "Mes informations")
-    tab1, tab2, tab3, tab4 = st.tabs(["Mes services", "Demandes reçues", "Demandes envoyées", "Mes informations"])
-    
-    with tab1: # Gestion des services proposés
-        st.subheader("Services que je propose")
-        mes_services = obtenir_mes_services(user['id'])
-        
-        if len(mes_services) == 0:
-            st.info("Vous n'avez pas encore proposé de service")
-        else:
-            for _, service in mes_services.iterrows():
-                
-                with st.container(border=True):
-                    col_title, col_toggle = st.columns([4, 1])
-                    is_dispo = service['disponible'] == 1
-                    
-                    with col_toggle:
-                        # Case à cocher pour activer ou désactiver la disponibilité du service
-                        if st.checkbox("Disponible", value=is_dispo, key=f"dispo_{service['id']}", help="Active ou désactive votre annonce"):
-                            if not is_dispo:
-                                if mettre_a_jour_disponibilite_service(service['id'], 1):
-                                    st.success("Service réactivé!")
-                                    st.rerun()
-                        else:
-                            if is_dispo:
-                                if mettre_a_jour_disponibilite_service(service['id'], 0):
-                                    st.warning("Service désactivé!")
-                                    st.rerun()
+    # Utilisation de 4 onglets pour afficher (Mes services", "Demandes reçues", "Demandes envoyées", "Mes informations").
+    # Seul l'onglet actif est exécuté (on_change) : les autres ne lancent aucune requête.
+    en_attente = compter_demandes_en_attente(user['id'])
+    libelles = [f"{onglet} ({en_attente})" if onglet == "Demandes reçues" and en_attente else onglet
+                for onglet in ONGLETS_MON_COMPTE]
+    actif = ONGLETS_MON_COMPTE.index(st.session_state.get('onglet_mon_compte', ONGLETS_MON_COMPTE[0]))
+    onglets = st.tabs(libelles, default=libelles[actif], key="onglets_mon_compte",
+                      on_change=memoriser_onglet, args=(libelles,))
+    for onglet, afficher in zip(onglets, (onglet_mes_services, onglet_demandes_recues,
+                                          onglet_demandes_envoyees, onglet_mes_informations)):
+        if onglet.open:
+            with onglet:
+                afficher(user)
 
-                    with col_title:
-                        st.markdown(f"**{service['titre']} - {'✅ Actif' if is_dispo else '❌ Inactif'}**")
+# ==================== FONCTION PRINCIPALE  ====================
 
-                    with st.expander("Détails"):
-                        st.write(f"**Catégorie :** {service['categorie']}")
-                        st.write(f"**Type :** {service['type_service']}")
-                        if service['prix'] > 0:
-                            st.write(f"**Prix :** {service['prix']} €")
-                    st.write(f"**Description :** {service['description']}")
-                    st.caption(f"Créé le {service['date_creation'][:10]}")
-    
-                st.markdown("---") # Séparation
+def est_admin(utilisateur):
+    return bool(utilisateur) and utilisateur['email'].lower() in ADMINS
 
-    with tab2: # Gestion des demandes reçues
-        st.subheader("Demandes reçues pour mes services")
-        demandes = obtenir_demandes_recues(user['id'])
-        
-        if len(demandes) == 0:
-            st.info("Aucune demande reçue")
-        else:
-            for _, demande in demandes.iterrows():
-                with st.container(border=True):
-                    # Affichage des informations du demandeur
-                    with st.expander(f"Demande pour '{demande['titre']}' - {demande['date_demande'][:10]}"):
-                        st.write(f"**Demandeur :** {demande['prenom']} {demande['nom']}")
-                        st.write(f"**Email :** {demande['email']}")
-                        st.write(f"**Téléphone :** {demande['telephone']}")
-                        st.write(f"**Date souhaitée :** {demande['date_souhaitee']}")
-                        st.write(f"**Message :**")
-                        st.info(demande['message'])
-                        
-                        statut_affiche = demande['statut'].replace('_', ' ').capitalize()
-                        
-                        if demande['statut'] == 'acceptee':
-                            st.success(f"**Statut :** {statut_affiche}")
-                        elif demande['statut'] == 'refusee':
-                            st.error(f"**Statut :** {statut_affiche}")
-                        else:
-                            st.warning(f"**Statut :** {statut_affiche}")
-                        
-                        # Boutons d'action uniquement si en_attente
-                        if demande['statut'] == 'en_attente':
-                            col_accept, col_reject, _ = st.columns([1, 1, 3])
-                            with col_accept:
-                                if st.button("Accepter", key=f"accept_{demande['id']}", type="primary"):
-                                    if mettre_a_jour_statut_demande(demande['id'], 'acceptee'):
-                                        st.success("Demande acceptée ! Rafraîchissement...")
-                                        st.rerun()
-                            with col_reject:
-                                if st.button("Refuser", key=f"reject_{demande['id']}", type="secondary"):
-                                    if mettre_a_jour_statut_demande(demande['id'], 'refusee'):
-                                        st.warning("Demande refusée. Rafraîchissement...")
-                                        st.rerun()
-                st.markdown("---") # Séparation
-
-    with tab3: # Gestion des demandes envoyées par l'utilisateur
-        st.subheader("Mes demandes de service envoyées")
-        mes_demandes_envoyees = obtenir_mes_demandes_initiees(user['id'])
-
-        if len(mes_demandes_envoyees) == 0:
-            st.info("Vous n'avez envoyé aucune demande de service pour le moment.")
-        else:
-            for _, demande in mes_demandes_envoyees.iterrows():
-                with st.container(border=True):
-                    statut = demande['statut']
-                    statut_affiche = statut.replace('_', ' ').capitalize()
-                    
-                    with st.expander(f"Demande pour '{demande['titre']}' - Statut: {statut_affiche}"):
-                        st.write(f"**Proposé par :** {demande['prenom']} {demande['nom']}")
-                        st.write(f"**Email du Proposeur :** {demande['email']}")
-                        if demande['telephone']:
-                            st.write(f"**Téléphone du Proposeur :** {demande['telephone']}")
-                        
-                        # Affichage du statut avec couleur
-                        if statut == 'acceptee':
-                            st.success(f"✅ **Statut :** {statut_affiche} - Vous pouvez contacter le voisin.")
-                        elif statut == 'refusee':
-                            st.error(f"❌ **Statut :** {statut_affiche}.")
-                        else:
-                            st.warning(f"⏳ **Statut :** {statut_affiche} - En attente de réponse.")
-                st.markdown("---") # Séparation
-
-    
-    with tab4: # Modification du profil
-        st.subheader("Mes informations")
-        
-        with st.container(border=True):
-            with st.form("formulaire_modification_profil"):
-                # L'email est affiché comme non modifiable
-                st.write(f"**Email :** {user['email']} (Non modifiable ici)")
-                
-                # Champs pré-remplis pour la modification
-                nouveau_nom = st.text_input("Nom", value=user['nom'])
-                nouveau_prenom = st.text_input("Prénom", value=user['prenom'])
-                nouveau_telephone = st.text_input("Téléphone", value=user.get('telephone', ''))
-                nouvelle_adresse = st.text_area("Adresse", value=user.get('adresse', ''))
-                
-                submitted = st.form_submit_button("Sauvegarder les modifications")
-                
-                if submitted:
-                    success, message = mettre_a_jour_utilisateur(
-                        user['id'], nouveau_nom, nouveau_prenom, user['email'], nouvelle_adresse, nouveau_telephone
-                    )
-                    if success:
-                        # Mise à jour de l'état de session après succès
-                        st.session_state.utilisateur.update({
-                            'nom': nouveau_nom, 
-                            'prenom': nouveau_prenom, 
-                            'adresse': nouvelle_adresse, 
-                            'telephone': nouveau_telephone
-                        })
-                        st.success(message)
-                    else:
-                        st.error(message)
+def tableau_durees(statistiques):
+    # Lignes {nom, nombre, p50, p95, p99} arrondies, triées par p95 décroissant
+    lignes = [{'nom': nom, 'nombre': s['nombre'],
+               **{rang: round(s[rang], 2) for rang in ('p50', 'p95', 'p99')}}
+              for nom, s in statistiques.items()]
+    return sorted(lignes, key=lambda ligne: ligne['p95'], reverse=True)
 
-# ==================== FONCTION PRINCIPALE  ====================
+def page_administration():
+    """Page réservée aux administrateurs : temps des requêtes et des pages, requêtes lentes."""
+    st.title("🛠️ Administration")
+
+    if not est_admin(st.session_state.get('utilisateur')):
+        st.warning("Accès réservé aux administrateurs")
+        return
+
+    metriques = exporter_metriques()
+    st.download_button("📥 Exporter les métriques (JSON)", json.dumps(metriques, ensure_ascii=False, indent=2),
+                       file_name=f"metriques_{time.strftime('%Y%m%d_%H%M%S')}.json", mime="application/json")
+
+    st.subheader("Requêtes SQL par fonction (ms)")
+    st.dataframe(tableau_durees(metriques['requetes']), use_container_width=True, hide_index=True)
+
+    st.subheader("Rendu des pages (ms)")
+    st.dataframe(tableau_durees(metriques['pages']), use_container_width=True, hide_index=True)
+
+    st.subheader(f"Requêtes lentes (≥ {SEUIL_REQUETE_LENTE_MS:.0f} ms)")
+    if not metriques['requetes_lentes']:
+        st.info("Aucune requête lente enregistrée")
+    for entree in reversed(metriques['requetes_lentes']):
+        with st.expander(f"{entree['date']} - {entree['fonction']} - {entree['duree_ms']} ms"):
+            st.code(entree['requete'], language="sql")
+            st.write(f"**Paramètres :** {entree['parametres']}")
+            st.code("\n".join(entree['plan']) or "(pas de plan)")
+
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("Cache du catalogue")
+        st.json(metriques['cache_catalogue'])
+        st.subheader("Écritures groupées")
+        st.json(metriques['ecritures'])
+    with col2:
+        st.subheader("Connexions")
+        st.json(metriques['connexions'])
+        st.subheader("Tentatives limitées")
+        st.json(metriques['tentatives'])
 
 def main():
     #Fonction principale de l'application - Gère l'initialisation et la navigation.
     
-    init_database()
+    configurer_page()
+    init_database(DB_PATH) # Migrations appliquées au premier rerun du processus uniquement
+    nettoyage_sessions() # Purge des sessions expirées en arrière-plan (un thread par processus)
     
     # Initialisation des variables d'état de session si elles n'existent pas
     if 'utilisateur' not in st.session_state:
         st.session_state.utilisateur = None
     if 'page_navigation' not in st.session_state:
         st.session_state.page_navigation = "Accueil"
+    restaurer_depuis_cookie()
+    synchroniser_cookie()
     
     # Définition des options de menu en fonction de l'état de connexion
     menu_options = (["Accueil", "Proposer un service", "Trouver un service", "Mon compte"] 
                     if st.session_state.utilisateur 
                     else ["Accueil", "S'inscrire", "Se connecter", "Trouver un service"])
+    if est_admin(st.session_state.utilisateur):
+        menu_options.append("Administration")
     
     # Création des colonnes pour la barre de navigation
     col_title, *nav_cols, col_logout = st.columns([2] + [1]*len(menu_options) + [1])
@@ -812,10 +893,14 @@ def main():
     with col_title:
         st.markdown("#### 🏘️ Voisins Solidaires")
     
+    # Badge du nombre de demandes reçues en attente (compteur maintenu par triggers)
+    en_attente = compter_demandes_en_attente(st.session_state.utilisateur['id']) if st.session_state.utilisateur else 0
+    
     # Création des boutons de navigation
     for i, option in enumerate(menu_options):
         with nav_cols[i]:
-            if st.button(option, key=f"nav_{option}", use_container_width=True, 
+            libelle = f"{option} ({en_attente})" if option == "Mon compte" and en_attente else option
+            if st.button(libelle, key=f"nav_{option}", use_container_width=True, 
                         type="primary" if option == st.session_state.page_navigation else "secondary"):
                 st.session_state.page_navigation = option
                 st.rerun()
@@ -824,15 +909,23 @@ def main():
     with col_logout:
         if st.session_state.utilisateur:
             if st.button("🚪 Déconnexion", key="nav_logout", use_container_width=True):
+                if st.session_state.get('jeton_session'):
+                    fermer_session(st.session_state.pop('jeton_session'))
+                st.session_state.cookie_session = ""
                 st.session_state.utilisateur = None
                 st.session_state.page_navigation = "Accueil"
+                for cle in ('suivi_demandes', 'curseur_notifications', 'notifications', 'onglet_mon_compte'):
+                    st.session_state.pop(cle, None)
                 st.rerun()
     
     st.markdown("---")
     
-    # Affichage du statut de connexion
+    # Affichage du statut de connexion, sondage du flux d'évènements et notifications en attente
     if st.session_state.utilisateur:
         st.caption(f"✅ Connecté : {st.session_state.utilisateur['prenom']} {st.session_state.utilisateur['nom']}")
+        surveiller_evenements()
+        for notification in st.session_state.pop('notifications', []):
+            st.toast(notification)
     
     # La liste des pages sous forme de dictionnaire
     pages = {
@@ -842,14 +935,17 @@ def main():
         "Proposer un service": page_proposer_service,
         "Trouver un service": page_trouver_service,
         "Mon compte": page_mon_compte,
-        "Mot de passe oublié": page_mot_de_passe_oublie 
+        "Mot de passe oublié": page_mot_de_passe_oublie,
+        "Administration": page_administration
     }
     
-    # Affichage de la page sélectionnée
-    if st.session_state.page_navigation in pages:
-        pages[st.session_state.page_navigation]()
-    else:
-         pages["Accueil"]() # Page par défaut
+    # Affichage de la page sélectionnée, chronométré (finally : st.rerun() interrompt la page par une exception)
+    nom_page = st.session_state.page_navigation if st.session_state.page_navigation in pages else "Accueil"
+    debut = time.perf_counter()
+    try:
+        pages[nom_page]()
+    finally:
+        metriques_pages().enregistrer(nom_page, (time.perf_counter() - debut) * 1000)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file